@@ -16,22 +16,42 @@ class GuiImportError(ImportError):
 
 
 from .version import ELECTRUM_VERSION
-from .util import format_satoshis
-from .wallet import Wallet
-from .storage import WalletStorage
-from .coinchooser import COIN_CHOOSERS
-from .network import Network, pick_random_server
-from .interface import Interface
-from .simple_config import SimpleConfig
-from . import bitcoin
-from . import transaction
-from . import daemon
-from .transaction import Transaction
-from .plugin import BasePlugin
-from .commands import Commands, known_commands
 from .logging import get_logger
 
 
+# These are imported on first access, so that importing a single submodule
+# (e.g. for the command line client) does not load the wallet, network and lightning stacks.
+_LAZY_ATTRIBUTES = {
+    'format_satoshis': 'util',
+    'Wallet': 'wallet',
+    'WalletStorage': 'storage',
+    'COIN_CHOOSERS': 'coinchooser',
+    'Network': 'network',
+    'pick_random_server': 'network',
+    'Interface': 'interface',
+    'SimpleConfig': 'simple_config',
+    'bitcoin': None,
+    'transaction': None,
+    'daemon': None,
+    'Transaction': 'transaction',
+    'BasePlugin': 'plugin',
+    'Commands': 'commands',
+    'known_commands': 'commands',
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    module_name = _LAZY_ATTRIBUTES[name]
+    if module_name is None:  # a submodule
+        return importlib.import_module(f'{__name__}.{name}')
+    value = getattr(importlib.import_module(f'{__name__}.{module_name}'), name)
+    globals()[name] = value
+    return value
+
+
 __version__ = ELECTRUM_VERSION
 
 _logger = get_logger(__name__)
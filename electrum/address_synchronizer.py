@@ -25,7 +25,7 @@ import asyncio
 import threading
 import itertools
 from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List, Mapping, Union
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List, Mapping, Union, Iterable
 
 from .crypto import sha256
 from . import bitcoin, util
@@ -122,6 +122,20 @@ class AddressSynchronizer(Logger, EventListener):
         self._get_balance_cache = {}
         self._get_asset_balance_cache = {}
         self._get_assets_in_mempool_cache = {}
+        # bumped whenever balances or coins might have changed, see get_state_version
+        self._state_version = 0
+        # output scripts of the addresses in db.history, built lazily, see is_mine_txo.
+        # Addresses are never removed from it, so it is a superset.
+        self._scriptpubkeys = None  # type: Optional[Set[bytes]]
+
+        # index of unspent wallet outputs by asset, see get_utxos(assets=...).
+        # It is refreshed lazily, for the addresses whose local history changed.
+        self._utxo_index = defaultdict(dict)  # type: Dict[Optional[str], Dict[TxOutpoint, Tuple[str, int, bool]]]  # asset -> outpoint -> (addr, value, is_cb)
+        self._utxo_index_keys_by_addr = {}  # type: Dict[str, Set[Tuple[Optional[str], TxOutpoint]]]
+        self._utxo_index_dirty_addrs = set()  # type: Set[str]
+        # per-address counterpart of _state_version, see get_address_version
+        self._address_versions = {}  # type: Dict[str, int]
+        self._last_address_version = 0
 
         self.load_and_cleanup()
 
@@ -147,6 +161,34 @@ class AddressSynchronizer(Logger, EventListener):
         if not address: return False
         return self.db.is_addr_in_history(address)
 
+    def is_mine_txo(self, txo: TxOutput) -> bool:
+        """Same as is_mine(txo.address), but does not decode the address of foreign outputs"""
+        if not self.is_maybe_mine_scriptpubkey(txo.scriptpubkey):
+            return False
+        return self.is_mine(txo.address)
+
+    def is_maybe_mine_scriptpubkey(self, script: bytes) -> bool:
+        """Pre-filter for is_mine, on a raw output script.
+        False means that the output is not ours. True might be a false positive.
+        """
+        if not script:
+            return False
+        base_script = bitcoin.get_scriptpubkey_address_part(script)
+        if base_script is None:
+            return True  # not a minimal template, let the caller decode it
+        scriptpubkeys = self._scriptpubkeys
+        if scriptpubkeys is None:
+            with self.lock:
+                if self._scriptpubkeys is None:
+                    self._scriptpubkeys = {bytes.fromhex(bitcoin.address_to_script(addr))
+                                           for addr in self.db.get_history()}
+                scriptpubkeys = self._scriptpubkeys
+        return base_script in scriptpubkeys
+
+    def _add_address_to_scriptpubkeys(self, address: str) -> None:
+        if self._scriptpubkeys is not None:
+            self._scriptpubkeys.add(bytes.fromhex(bitcoin.address_to_script(address)))
+
     def get_addresses(self):
         return sorted(self.db.get_history())
 
@@ -193,6 +235,18 @@ class AddressSynchronizer(Logger, EventListener):
                 h[tx_hash] = tx_height
         return h
 
+    def get_address_version(self, addr: str) -> int:
+        """Changes whenever the local history of addr changes, and with it its balance.
+        Note: height changes of its txs are not included.
+        """
+        return self._address_versions.get(addr, 0)
+
+    def get_history_version(self) -> int:
+        """Changes whenever the local history of any address changes, see get_address_version.
+        Every address of a tx bumps it, when the tx is added to or removed from the history.
+        """
+        return self._last_address_version
+
     def get_address_history_len(self, addr: str) -> int:
         """Return number of transactions where address is involved."""
         return len(self._history_local.get(addr, ()))
@@ -261,9 +315,7 @@ class AddressSynchronizer(Logger, EventListener):
 
     @event_listener
     def on_event_blockchain_updated(self, *args):
-        self._get_balance_cache = {}  # invalidate cache
-        self._get_asset_balance_cache = {}
-        self._get_assets_in_mempool_cache = {}
+        self._invalidate_balance_cache()
         self.db.put('stored_height', self.get_local_height())
 
     async def stop(self):
@@ -279,9 +331,23 @@ class AddressSynchronizer(Logger, EventListener):
                 self.verifier = None
                 self.unregister_callbacks()
 
+    def _invalidate_balance_cache(self) -> None:
+        self._state_version += 1
+        self._get_balance_cache.clear()
+        self._get_asset_balance_cache.clear()
+        self._get_assets_in_mempool_cache.clear()
+
+    def get_state_version(self) -> int:
+        """Counter that changes whenever balances, coins or tx heights might have changed.
+        Note: changes of the local height are not included.
+        """
+        return self._state_version
+
     def add_address(self, address):
+        self._state_version += 1
         if address not in self.db.history:
             self.db.history[address] = []
+            self._add_address_to_scriptpubkeys(address)
         if self.synchronizer:
             self.synchronizer.add(address)
         self.up_to_date_changed()
@@ -353,7 +419,7 @@ class AddressSynchronizer(Logger, EventListener):
                 # it could happen that we think tx is unrelated but actually one of the inputs is is_mine.
                 # this is the main motivation for allow_unrelated
                 is_mine = any([self.is_mine(self.get_txin_address(txin)) for txin in tx.inputs()])
-                is_for_me = any([self.is_mine(txo.address) for txo in tx.outputs()])
+                is_for_me = any([self.is_mine_txo(txo) for txo in tx.outputs()])
                 if not is_mine and not is_for_me:
                     raise UnrelatedTransactionException()
             # Find all conflicting transactions.
@@ -392,9 +458,7 @@ class AddressSynchronizer(Logger, EventListener):
                         pass
                     else:
                         self.db.add_txi_addr(tx_hash, addr, ser, v, asset)
-                        self._get_balance_cache.clear()  # invalidate cache
-                        self._get_asset_balance_cache.clear()
-                        self._get_assets_in_mempool_cache.clear()
+                        self._invalidate_balance_cache()
             for txi in tx.inputs():
                 if txi.is_coinbase_input():
                     continue
@@ -418,12 +482,10 @@ class AddressSynchronizer(Logger, EventListener):
                 asset_data = get_asset_info_from_script(txo.scriptpubkey)
                 scripthash = bitcoin.script_to_scripthash(txo.scriptpubkey.hex())
                 self.db.add_prevout_by_scripthash(scripthash, prevout=TxOutpoint.from_str(ser), value=asset_data.amount or v, asset=asset_data.asset)
-                addr = txo.address
-                if addr and self.is_mine(addr):
+                if self.is_mine_txo(txo):
+                    addr = txo.address
                     self.db.add_txo_addr(tx_hash, addr, n, asset_data.amount or v, asset_data.asset, is_coinbase)
-                    self._get_balance_cache.clear()  # invalidate cache
-                    self._get_asset_balance_cache.clear()
-                    self._get_assets_in_mempool_cache.clear()
+                    self._invalidate_balance_cache()
                     # give v to txi that spends me
                     next_tx = self.db.get_spent_outpoint(tx_hash, n)
                     if next_tx is not None:
@@ -517,9 +579,7 @@ class AddressSynchronizer(Logger, EventListener):
             remove_from_spent_outpoints()
             self._remove_tx_from_local_history(tx_hash)
             for addr in itertools.chain(self.db.get_txi_addresses(tx_hash), self.db.get_txo_addresses(tx_hash)):
-                self._get_balance_cache.clear()  # invalidate cache
-                self._get_asset_balance_cache.clear()
-                self._get_assets_in_mempool_cache.clear()
+                self._invalidate_balance_cache()
             self.db.remove_txi(tx_hash)
             self.db.remove_txo(tx_hash)
             self.db.remove_tx_fee(tx_hash)
@@ -558,7 +618,10 @@ class AddressSynchronizer(Logger, EventListener):
                     self.db.remove_verified_tx(tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
+            if not self.db.is_addr_in_history(addr):
+                self._add_address_to_scriptpubkeys(addr)
             self.db.set_addr_history(addr, hist)
+            self._state_version += 1
 
         for tx_hash, tx_height in hist:
             # add it in case it was previously unconfirmed
@@ -610,9 +673,11 @@ class AddressSynchronizer(Logger, EventListener):
             with self.transaction_lock:
                 self.db.clear_history()
                 self._history_local.clear()
-                self._get_balance_cache.clear()  # invalidate cache
-                self._get_asset_balance_cache.clear()
-                self._get_assets_in_mempool_cache.clear()
+                self._invalidate_balance_cache()
+                self._utxo_index.clear()
+                self._utxo_index_keys_by_addr.clear()
+                self._utxo_index_dirty_addrs.clear()
+                self._address_versions.clear()
 
     def _get_tx_sort_key(self, tx_hash: str) -> Tuple[int, int]:
         """Returns a key to be used for sorting txs."""
@@ -695,6 +760,7 @@ class AddressSynchronizer(Logger, EventListener):
     def _add_tx_to_local_history(self, txid):
         with self.transaction_lock:
             for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)):
+                self._utxo_index_dirty_addrs.add(addr)
                 cur_hist = self._history_local.get(addr, set())
                 cur_hist.add(txid)
                 self._history_local[addr] = cur_hist
@@ -703,6 +769,7 @@ class AddressSynchronizer(Logger, EventListener):
     def _remove_tx_from_local_history(self, txid):
         with self.transaction_lock:
             for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)):
+                self._utxo_index_dirty_addrs.add(addr)
                 cur_hist = self._history_local.get(addr, set())
                 try:
                     cur_hist.remove(txid)
@@ -713,6 +780,9 @@ class AddressSynchronizer(Logger, EventListener):
                     self._mark_address_history_changed(addr)
 
     def _mark_address_history_changed(self, addr: str) -> None:
+        self._last_address_version += 1
+        self._address_versions[addr] = self._last_address_version
+
         def set_and_clear():
             event = self._address_history_changed_events[addr]
             # history for this address changed, wake up coroutines:
@@ -732,6 +802,7 @@ class AddressSynchronizer(Logger, EventListener):
         await self._address_history_changed_events[addr].wait()
 
     def add_unverified_or_unconfirmed_tx(self, tx_hash, tx_height):
+        self._state_version += 1
         if self.db.is_in_verified_tx(tx_hash):
             if tx_height <= 0:
                 # tx was previously SPV-verified but now in mempool (probably reorg)
@@ -1272,6 +1343,7 @@ class AddressSynchronizer(Logger, EventListener):
         with self.lock:
             self.unverified_tx.pop(tx_hash, None)
             self.db.add_verified_tx(tx_hash, info)
+            self._state_version += 1
         util.trigger_callback('adb_added_verified_tx', self, tx_hash)
 
     def get_unverified_txs(self) -> Dict[str, int]:
@@ -1371,6 +1443,7 @@ class AddressSynchronizer(Logger, EventListener):
                         self.unverified_tx[tx_hash] = tx_height
                         txs.add(tx_hash)
 
+            self._state_version += 1
         for tx_hash in txs:
             util.trigger_callback('adb_removed_verified_tx', self, tx_hash)
         for asset in assets:
@@ -1393,6 +1466,7 @@ class AddressSynchronizer(Logger, EventListener):
         with self.lock:
             old_height = self.future_tx.get(txid) or None
             self.future_tx[txid] = wanted_height
+            self._state_version += 1
         if old_height != wanted_height:
             util.trigger_callback('adb_set_future_tx', self, txid)
 
@@ -1560,6 +1634,43 @@ class AddressSynchronizer(Logger, EventListener):
                 out.pop(k)
         return out
 
+    def _refresh_utxo_index(self) -> None:
+        with self.lock, self.transaction_lock:
+            while self._utxo_index_dirty_addrs:
+                addr = self._utxo_index_dirty_addrs.pop()
+                for asset, prevout in self._utxo_index_keys_by_addr.pop(addr, ()):
+                    asset_utxos = self._utxo_index[asset]
+                    asset_utxos.pop(prevout, None)
+                    if not asset_utxos:
+                        del self._utxo_index[asset]
+                keys = set()
+                for prevout, utxo in self.get_addr_utxo(addr).items():
+                    self._utxo_index[utxo.asset][prevout] = (addr, utxo.value_sats(asset_aware=True), utxo.is_coinbase_output())
+                    keys.add((utxo.asset, prevout))
+                if keys:
+                    self._utxo_index_keys_by_addr[addr] = keys
+
+    def get_indexed_utxos(self, assets: Iterable[Optional[str]]) -> List[PartialTxInput]:
+        """Returns the unspent outputs of the wallet holding any of the given assets
+        (None for the base coin), without looking at the other outputs of the wallet.
+        """
+        self._refresh_utxo_index()
+        coins = []
+        with self.lock, self.transaction_lock:
+            for asset in assets:
+                for prevout, (addr, value, is_cb) in self._utxo_index.get(asset, {}).items():
+                    tx_mined_info = self.get_tx_height(prevout.txid.hex())
+                    utxo = PartialTxInput(prevout=prevout, is_coinbase_output=is_cb)
+                    utxo._trusted_address = addr
+                    utxo._trusted_value_sats = value
+                    utxo._trusted_asset = asset
+                    utxo.block_height = tx_mined_info.height
+                    utxo.block_txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
+                    utxo.spent_txid = None
+                    utxo.spent_height = None
+                    coins.append(utxo)
+        return coins
+
     @with_lock
     @with_transaction_lock
     @with_local_height_cached
@@ -1692,7 +1803,9 @@ class AddressSynchronizer(Logger, EventListener):
             confirmed_spending_only: bool = False,
             nonlocal_only: bool = False,
             block_height: int = None,
+            assets: Optional[Iterable[Optional[str]]] = None,
     ) -> Sequence[PartialTxInput]:
+        """If assets is given, only coins of those assets (None for the base coin) are returned."""
         if block_height is not None:
             # caller wants the UTXOs we had at a given height; check other parameters
             assert confirmed_funding_only
@@ -1705,24 +1818,29 @@ class AddressSynchronizer(Logger, EventListener):
         if excluded_addresses:
             domain = set(domain) - set(excluded_addresses)
         mempool_height = block_height + 1  # height of next block
-        for addr in domain:
-            txos = self.get_addr_outputs(addr)
-            for txo in txos.values():
-                if txo.value_sats(asset_aware=True) == 0: continue
-                if txo.spent_height is not None:
-                    if not confirmed_spending_only:
-                        continue
-                    if confirmed_spending_only and 0 < txo.spent_height <= block_height:
-                        continue
-                if confirmed_funding_only and not (0 < txo.block_height <= block_height):
-                    continue
-                if nonlocal_only and txo.block_height in (TX_HEIGHT_LOCAL, TX_HEIGHT_FUTURE):
+        if assets is not None and not confirmed_spending_only:
+            # the index only knows outputs that are currently unspent
+            txos = [txo for txo in self.get_indexed_utxos(assets) if txo.address in domain]
+        else:
+            txos = itertools.chain.from_iterable(self.get_addr_outputs(addr).values() for addr in domain)
+            if assets is not None:
+                assets = set(assets)
+                txos = (txo for txo in txos if txo.asset in assets)
+        for txo in txos:
+            if txo.value_sats(asset_aware=True) == 0: continue
+            if txo.spent_height is not None:
+                if not confirmed_spending_only:
                     continue
-                if (mature_only and txo.is_coinbase_output()
-                        and txo.block_height + COINBASE_MATURITY > mempool_height):
+                if confirmed_spending_only and 0 < txo.spent_height <= block_height:
                     continue
-                coins.append(txo)
+            if confirmed_funding_only and not (0 < txo.block_height <= block_height):
+                continue
+            if nonlocal_only and txo.block_height in (TX_HEIGHT_LOCAL, TX_HEIGHT_FUTURE):
+                continue
+            if (mature_only and txo.is_coinbase_output()
+                    and txo.block_height + COINBASE_MATURITY > mempool_height):
                 continue
+            coins.append(txo)
         return coins
 
     def is_used(self, address: str) -> bool:
@@ -2,7 +2,8 @@
 # Distributed under the MIT software license, see the accompanying
 # file LICENCE or http://www.opensource.org/licenses/mit-license.php
 
-from typing import TYPE_CHECKING
+import asyncio
+from typing import TYPE_CHECKING, Callable, List, NamedTuple, Optional, Sequence
 import itertools
 
 from . import bitcoin
@@ -16,55 +17,138 @@ if TYPE_CHECKING:
     from .network import Network
 
 
-async def account_discovery(network: 'Network', get_account_xpub):
+# ad-hoc gap limits
+DEFAULT_GAP_LIMIT = 20
+DEFAULT_GAP_LIMIT_FOR_CHANGE = 10
+# number of account indices per wallet format that are checked at the same time.
+# Accounts past the first one without history are discarded, as before.
+ACCOUNT_LOOKAHEAD = 3
+
+
+class AccountDiscoveryProgress(NamedTuple):
+    num_accounts_checked: int
+    active_accounts: Sequence[dict]  # found so far, in no particular order
+    has_finished: bool
+
+
+async def account_discovery(
+        network: 'Network',
+        get_account_xpub: Callable[[List[int]], str],
+        *,
+        gap_limit: int = DEFAULT_GAP_LIMIT,
+        gap_limit_for_change: int = DEFAULT_GAP_LIMIT_FOR_CHANGE,
+        progress_cb: Callable[[AccountDiscoveryProgress], None] = None,
+) -> List[dict]:
+    """Scans all known BIP39 wallet formats for accounts with history.
+    To cancel, cancel the task running this coroutine.
+    progress_cb, if given, is called on the event loop after each checked account.
+    """
+    num_checked = 0
+    found = []
+
+    def on_account_checked(account: Optional[dict]) -> None:
+        nonlocal num_checked
+        num_checked += 1
+        if account is not None:
+            found.append(account)
+        if progress_cb:
+            progress_cb(AccountDiscoveryProgress(num_checked, list(found), has_finished=False))
+
     async with OldTaskGroup() as group:
         account_scan_tasks = []
         for wallet_format in BIP39_WALLET_FORMATS:
-            account_scan = scan_for_active_accounts(network, get_account_xpub, wallet_format)
+            account_scan = scan_for_active_accounts(
+                network, get_account_xpub, wallet_format,
+                gap_limit=gap_limit, gap_limit_for_change=gap_limit_for_change,
+                on_account_checked=on_account_checked)
             account_scan_tasks.append(await group.spawn(account_scan))
     active_accounts = []
     for task in account_scan_tasks:
         active_accounts.extend(task.result())
+    if progress_cb:
+        progress_cb(AccountDiscoveryProgress(num_checked, list(active_accounts), has_finished=True))
     return active_accounts
 
 
-async def scan_for_active_accounts(network: 'Network', get_account_xpub, wallet_format):
+async def scan_for_active_accounts(
+        network: 'Network',
+        get_account_xpub: Callable[[List[int]], str],
+        wallet_format: dict,
+        *,
+        gap_limit: int = DEFAULT_GAP_LIMIT,
+        gap_limit_for_change: int = DEFAULT_GAP_LIMIT_FOR_CHANGE,
+        on_account_checked: Callable[[Optional[dict]], None] = None,
+) -> List[dict]:
+    loop = asyncio.get_running_loop()
+
+    async def check_account(account_path: List[int]) -> Optional[dict]:
+        # deriving the account xpub can involve hashing the seed, keep it off the event loop
+        account_xpub = await loop.run_in_executor(None, get_account_xpub, account_path)
+        account_node = BIP32Node.from_xkey(account_xpub)
+        has_history = await account_has_history(
+            network, account_node, wallet_format["script_type"],
+            gap_limit=gap_limit, gap_limit_for_change=gap_limit_for_change)
+        account = format_account(wallet_format, account_path) if has_history else None
+        if on_account_checked:
+            on_account_checked(account)
+        return account
+
     active_accounts = []
     account_path = bip32_str_to_ints(wallet_format["derivation_path"])
+    lookahead = ACCOUNT_LOOKAHEAD if wallet_format["iterate_accounts"] else 1
     while True:
-        account_xpub = get_account_xpub(account_path)
-        account_node = BIP32Node.from_xkey(account_xpub)
-        has_history = await account_has_history(network, account_node, wallet_format["script_type"])
-        if has_history:
-            account = format_account(wallet_format, account_path)
+        paths = [account_path[:-1] + [account_path[-1] + i] for i in range(lookahead)]
+        async with OldTaskGroup() as group:
+            tasks = [await group.spawn(check_account(path)) for path in paths]
+        for task in tasks:
+            account = task.result()
+            if account is None:
+                return active_accounts
             active_accounts.append(account)
-        if not has_history or not wallet_format["iterate_accounts"]:
-            break
-        account_path[-1] = account_path[-1] + 1
-    return active_accounts
+        if not wallet_format["iterate_accounts"]:
+            return active_accounts
+        account_path = paths[-1][:-1] + [paths[-1][-1] + 1]
 
 
-async def account_has_history(network: 'Network', account_node: BIP32Node, script_type: str) -> bool:
+def get_scripthashes_for_account(
+        account_node: BIP32Node,
+        script_type: str,
+        *,
+        gap_limit: int = DEFAULT_GAP_LIMIT,
+        gap_limit_for_change: int = DEFAULT_GAP_LIMIT_FOR_CHANGE,
+) -> List[str]:
     # note: scan both receiving and change addresses. some wallets send change across accounts.
     path_suffixes = itertools.chain(
-        itertools.product((0,), range(20)),  # ad-hoc gap limits
-        itertools.product((1,), range(10)),
+        itertools.product((0,), range(gap_limit)),
+        itertools.product((1,), range(gap_limit_for_change)),
     )
-    async with OldTaskGroup() as group:
-        get_history_tasks = []
-        for path_suffix in path_suffixes:
-            address_node = account_node.subkey_at_public_derivation(path_suffix)
-            pubkey = address_node.eckey.get_public_key_hex()
-            address = bitcoin.pubkey_to_address(script_type, pubkey)
-            script = bitcoin.address_to_script(address)
-            scripthash = bitcoin.script_to_scripthash(script)
-            get_history = network.get_history_for_scripthash(scripthash)
-            get_history_tasks.append(await group.spawn(get_history))
-    for task in get_history_tasks:
-        history = task.result()
-        if len(history) > 0:
-            return True
-    return False
+    scripthashes = []
+    branch_nodes = {}
+    for for_change, n in path_suffixes:
+        if for_change not in branch_nodes:
+            branch_nodes[for_change] = account_node.subkey_at_public_derivation((for_change,))
+        address_node = branch_nodes[for_change].subkey_at_public_derivation((n,))
+        pubkey = address_node.eckey.get_public_key_hex()
+        address = bitcoin.pubkey_to_address(script_type, pubkey)
+        script = bitcoin.address_to_script(address)
+        scripthashes.append(bitcoin.script_to_scripthash(script))
+    return scripthashes
+
+
+async def account_has_history(
+        network: 'Network',
+        account_node: BIP32Node,
+        script_type: str,
+        *,
+        gap_limit: int = DEFAULT_GAP_LIMIT,
+        gap_limit_for_change: int = DEFAULT_GAP_LIMIT_FOR_CHANGE,
+) -> bool:
+    scripthashes = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: get_scripthashes_for_account(
+            account_node, script_type, gap_limit=gap_limit, gap_limit_for_change=gap_limit_for_change))
+    # a single batch request for all addresses of the account
+    histories = await network.get_history_for_scripthashes(scripthashes)
+    return any(len(history) > 0 for history in histories)
 
 
 def format_account(wallet_format, account_path):
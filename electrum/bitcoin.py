@@ -527,6 +527,24 @@ def script_to_scripthash(script: str) -> str:
     h = sha256(raw_script)[0:32]
     return h[::-1].hex()
 
+def get_scriptpubkey_address_part(script: bytes) -> Optional[bytes]:
+    """Returns the leading address template (p2pkh, p2sh or witness program) of an
+    output script, i.e. the script without a trailing asset part, without decoding it.
+    Returns None if the script does not start with a minimally encoded template,
+    in which case callers must fall back to get_address_from_output_script.
+    """
+    n = len(script)
+    if n >= 25 and script[0] == opcodes.OP_DUP and script[1] == opcodes.OP_HASH160 and script[2] == 20 \
+            and script[23] == opcodes.OP_EQUALVERIFY and script[24] == opcodes.OP_CHECKSIG:
+        return script[:25]
+    if n >= 23 and script[0] == opcodes.OP_HASH160 and script[1] == 20 and script[22] == opcodes.OP_EQUAL:
+        return script[:23]
+    if n >= 2 and (script[0] == opcodes.OP_0 or opcodes.OP_1 <= script[0] <= opcodes.OP_16) \
+            and 2 <= script[1] <= 40 and n >= 2 + script[1]:
+        return script[:2 + script[1]]
+    return None
+
+
 def public_key_to_p2pk_script(pubkey: str) -> str:
     return construct_script([pubkey, opcodes.OP_CHECKSIG])
 
@@ -103,6 +103,24 @@ def deserialize_header(s: bytes, height: int) -> dict:
     h['block_height'] = height
     return h
 
+def pad_headers_to_kawpow_len(start_height: int, data: bytes) -> bytearray:
+    """Converts a chunk of headers, as served (legacy headers are 80 bytes),
+    to the format of the headers file, where every header takes HEADER_SIZE
+    bytes. Legacy headers are padded with zeros.
+    """
+    num_legacy = max(0, constants.net.KawpowActivationHeight - start_height)
+    num_legacy = min(num_legacy, len(data) // LEGACY_HEADER_SIZE)
+    legacy_len = num_legacy * LEGACY_HEADER_SIZE
+    if (len(data) - legacy_len) % HEADER_SIZE != 0:
+        raise Exception('Header extension error')
+    out = bytearray(num_legacy * HEADER_SIZE + len(data) - legacy_len)
+    src = memoryview(data)
+    for i in range(num_legacy):
+        out[i * HEADER_SIZE:i * HEADER_SIZE + LEGACY_HEADER_SIZE] = src[i * LEGACY_HEADER_SIZE:(i + 1) * LEGACY_HEADER_SIZE]
+    out[num_legacy * HEADER_SIZE:] = src[legacy_len:]
+    return out
+
+
 def hash_header(header: dict) -> str:
     if header is None:
         return '0' * 64
@@ -264,6 +282,7 @@ class Blockchain(Logger):
         self._forkpoint_hash = forkpoint_hash  # blockhash at forkpoint. "first hash"
         self._prev_hash = prev_hash  # blockhash immediately before forkpoint
         self.lock = threading.RLock()
+        self._unsynced_chunks = 0  # chunks written but not fsynced yet
         self.update_size()
 
     @property
@@ -438,43 +457,36 @@ class Blockchain(Logger):
         return os.path.join(d, filename)
 
     @with_lock
-    def save_chunk(self, start_height: int, chunk: bytes):
+    def save_chunk(self, start_height: int, chunk: bytes, *, fsync: bool = True):
+        """With fsync=False, the headers file is only fsynced every
+        HEADERS_FSYNC_INTERVAL chunks; the caller must call sync_headers_to_disk
+        when done.
+        """
         assert start_height >= 0, start_height
         chunk_within_checkpoint_region = start_height <= constants.net.max_checkpoint()
         # chunks in checkpoint region are the responsibility of the 'main chain'
         if chunk_within_checkpoint_region and self.parent is not None:
             main_chain = get_best_chain()
-            main_chain.save_chunk(start_height, chunk)
+            main_chain.save_chunk(start_height, chunk, fsync=fsync)
             return
 
+        data = pad_headers_to_kawpow_len(start_height, chunk)
         delta_height = (start_height - self.forkpoint)
         delta_bytes = delta_height * HEADER_SIZE
         # if this chunk contains our forkpoint, only save the part after forkpoint
         # (the part before is the responsibility of the parent)
+        view = memoryview(data)
         if delta_bytes < 0:
-            chunk = chunk[-delta_bytes:]
+            view = view[-delta_bytes:]
             delta_bytes = 0
         truncate = not chunk_within_checkpoint_region
-
-        def convert_to_kawpow_len():
-            r = b''
-            p = 0
-            s = start_height
-            while p < len(chunk):
-                if s < constants.net.KawpowActivationHeight:
-                    r += chunk[p:p + LEGACY_HEADER_SIZE] + bytes(40)
-                    p += LEGACY_HEADER_SIZE
-                else:
-                    r += chunk[p:p + HEADER_SIZE]
-                    p += HEADER_SIZE
-                s += 1
-            if len(r) % HEADER_SIZE != 0:
-                raise Exception('Header extension error')
-            return r
-
-        chunk = convert_to_kawpow_len()
-        self.write(chunk, delta_bytes, truncate)
-        assert self.read_header(start_height) == deserialize_header(chunk[:120], start_height)
+        # during catch-up, fsync only every few chunks. an unsynced tail
+        # lost in a crash is simply downloaded again.
+        self._unsynced_chunks += 1
+        if not fsync:
+            fsync = self._unsynced_chunks >= self.config.HEADERS_FSYNC_INTERVAL
+        self.write(view, delta_bytes, truncate, fsync=fsync)
+        assert self.read_header(start_height) == deserialize_header(data[:HEADER_SIZE], start_height)
         self.swap_with_parent()
 
     def swap_with_parent(self) -> None:
@@ -552,19 +564,31 @@ class Blockchain(Logger):
             raise FileNotFoundError('Cannot find headers file but headers_dir is there. Should be at {}'.format(path))
 
     @with_lock
-    def write(self, data: bytes, offset: int, truncate: bool=True) -> None:
+    def write(self, data: bytes, offset: int, truncate: bool=True, *, fsync: bool = True) -> None:
         filename = self.path()
         self.assert_headers_file_available(filename)
         with open(filename, 'rb+') as f:
             if truncate and offset != self._size * HEADER_SIZE:
-                f.seek(offset)
-                f.truncate()
+                f.truncate(offset)
             f.seek(offset)
             f.write(data)
             f.flush()
-            os.fsync(f.fileno())
+            if fsync:
+                os.fsync(f.fileno())
+                self._unsynced_chunks = 0
         self.update_size()
 
+    @with_lock
+    def sync_to_disk(self) -> None:
+        """fsyncs the chunks that save_chunk wrote without fsync."""
+        if not self._unsynced_chunks:
+            return
+        filename = self.path()
+        if os.path.exists(filename):
+            with open(filename, 'rb+') as f:
+                os.fsync(f.fileno())
+        self._unsynced_chunks = 0
+
     @with_lock
     def save_header(self, header: dict) -> None:
         delta = header.get('block_height') - self.forkpoint
@@ -852,13 +876,13 @@ class Blockchain(Logger):
             return False
         return True
 
-    async def connect_chunk(self, start_height: int, hexdata: str) -> bool:
+    async def connect_chunk(self, start_height: int, hexdata: str, *, fsync: bool = True) -> bool:
         assert start_height >= 0, start_height
         try:
             data = bfh(hexdata)
             # This is computationally intensive (thanks DGW)
             self.verify_chunk(start_height, data)
-            self.save_chunk(start_height, data)
+            self.save_chunk(start_height, data, fsync=fsync)
             return True
         except BaseException as e:
             self.logger.info(f'verify_chunk from height {start_height} failed: {repr(e)}')
@@ -875,6 +899,12 @@ class Blockchain(Logger):
         return cp
 
 
+def sync_headers_to_disk() -> None:
+    with blockchains_lock: chains = list(blockchains.values())
+    for b in chains:
+        b.sync_to_disk()
+
+
 def check_header(header: dict) -> Optional[Blockchain]:
     """Returns any Blockchain that contains header, or None."""
     if type(header) is not dict:
@@ -27,13 +27,15 @@ import time
 import random
 import os
 from collections import defaultdict
-from typing import Sequence, List, Tuple, Optional, Dict, NamedTuple, TYPE_CHECKING, Set
+from typing import Sequence, List, Tuple, Optional, Dict, NamedTuple, TYPE_CHECKING, Set, Callable
 import binascii
 import base64
 import asyncio
 import threading
 from enum import IntEnum
 import functools
+import struct
+import concurrent.futures
 
 from aiorpcx import NetAddress
 
@@ -63,6 +65,33 @@ FLAG_DIRECTION = 1 << 0
 class ChannelDBNotLoaded(UserFacingException): pass
 
 
+# Gossip signatures are verified on this pool. ecc calls into libsecp256k1 via ctypes,
+# which releases the GIL, so verification of a large batch is spread over several cores.
+_gossip_verify_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=min(8, os.cpu_count() or 1),
+    thread_name_prefix='gossip_verify_thread',
+)
+GOSSIP_VERIFY_CHUNK_SIZE = 100
+
+
+def verify_gossip_msgs(verify: Callable[[dict], None], payloads: Sequence[dict]) -> None:
+    """Calls verify on each payload, in parallel for large batches.
+    Raises InvalidGossipMsg if any of them is invalid.
+    """
+    if len(payloads) <= GOSSIP_VERIFY_CHUNK_SIZE:
+        for payload in payloads:
+            verify(payload)
+        return
+    def verify_chunk(chunk: Sequence[dict]) -> None:
+        for payload in chunk:
+            verify(payload)
+    futures = [
+        _gossip_verify_executor.submit(verify_chunk, payloads[i:i + GOSSIP_VERIFY_CHUNK_SIZE])
+        for i in range(0, len(payloads), GOSSIP_VERIFY_CHUNK_SIZE)]
+    for fut in futures:
+        fut.result()  # re-raises
+
+
 class ChannelInfo(NamedTuple):
     short_channel_id: ShortChannelID
     node1_id: bytes
@@ -307,12 +336,121 @@ msg BLOB,
 PRIMARY KEY(node_id)
 )"""
 
+create_graph_snapshot = """
+CREATE TABLE IF NOT EXISTS graph_snapshot (
+id INTEGER,
+data BLOB,
+PRIMARY KEY(id)
+)"""
+
+
+# The graph snapshot is a pre-parsed copy of the channel_info, policy and node_info tables,
+# so that load_data does not need to run lnmsg.decode_msg on every row.
+# It records the max rowid of each table at the time it was taken: rows with a larger
+# rowid are newer than the snapshot (note: REPLACE INTO allocates a new rowid),
+# and are decoded and applied on top of it.
+GRAPH_SNAPSHOT_MAGIC = b'ELGS'
+GRAPH_SNAPSHOT_VERSION = 1
+
+# magic, version, max rowid of (channel_info, policy, node_info), num (channels, policies, nodes)
+_SNAPSHOT_HEADER = struct.Struct('<4sIqqqIII')
+# short_channel_id, node1_id, node2_id
+_SNAPSHOT_CHANNEL = struct.Struct('<8s33s33s')
+# key, cltv_expiry_delta, htlc_minimum_msat, has_htlc_maximum, htlc_maximum_msat,
+# fee_base_msat, fee_proportional_millionths, channel_flags, message_flags, timestamp
+_SNAPSHOT_POLICY = struct.Struct('<41sHQ?QIIBBI')
+# node_id, timestamp, len(features), len(alias); followed by features and alias
+_SNAPSHOT_NODE = struct.Struct('<33sIHB')
+
+
+class GraphSnapshotRowids(NamedTuple):
+    channel_info: int
+    policy: int
+    node_info: int
+
+
+def serialize_graph_snapshot(
+        *,
+        rowids: GraphSnapshotRowids,
+        channels: Sequence[ChannelInfo],
+        policies: Sequence[Policy],
+        nodes: Sequence[NodeInfo],
+) -> bytes:
+    buf = bytearray(_SNAPSHOT_HEADER.pack(
+        GRAPH_SNAPSHOT_MAGIC, GRAPH_SNAPSHOT_VERSION, *rowids,
+        len(channels), len(policies), len(nodes)))
+    for ci in channels:
+        buf += _SNAPSHOT_CHANNEL.pack(ci.short_channel_id, ci.node1_id, ci.node2_id)
+    for p in policies:
+        buf += _SNAPSHOT_POLICY.pack(
+            p.key, p.cltv_expiry_delta, p.htlc_minimum_msat,
+            p.htlc_maximum_msat is not None, p.htlc_maximum_msat or 0,
+            p.fee_base_msat, p.fee_proportional_millionths,
+            p.channel_flags, p.message_flags, p.timestamp)
+    for n in nodes:
+        features = n.features.to_bytes((n.features.bit_length() + 7) // 8, 'big')
+        alias = n.alias.encode('utf8')
+        buf += _SNAPSHOT_NODE.pack(n.node_id, n.timestamp, len(features), len(alias))
+        buf += features
+        buf += alias
+    return bytes(buf)
+
+
+def deserialize_graph_snapshot(data: bytes) -> Tuple[
+        GraphSnapshotRowids, List[ChannelInfo], List[Policy], List[NodeInfo]]:
+    """Raises ValueError if the snapshot is corrupt or has a different version."""
+    try:
+        magic, version, *rowids, num_channels, num_policies, num_nodes = _SNAPSHOT_HEADER.unpack_from(data, 0)
+        if magic != GRAPH_SNAPSHOT_MAGIC or version != GRAPH_SNAPSHOT_VERSION:
+            raise ValueError(f'unexpected graph snapshot version: {version}')
+        offset = _SNAPSHOT_HEADER.size
+        channels = []
+        for scid, node1_id, node2_id in _SNAPSHOT_CHANNEL.iter_unpack(
+                data[offset:offset + num_channels * _SNAPSHOT_CHANNEL.size]):
+            channels.append(ChannelInfo(
+                short_channel_id=ShortChannelID(scid),
+                node1_id=node1_id,
+                node2_id=node2_id,
+                capacity_sat=None))
+        offset += num_channels * _SNAPSHOT_CHANNEL.size
+        policies = []
+        for (key, cltv_expiry_delta, htlc_minimum_msat, has_htlc_maximum, htlc_maximum_msat,
+             fee_base_msat, fee_proportional_millionths, channel_flags, message_flags, timestamp
+             ) in _SNAPSHOT_POLICY.iter_unpack(data[offset:offset + num_policies * _SNAPSHOT_POLICY.size]):
+            policies.append(Policy(
+                key=key,
+                cltv_expiry_delta=cltv_expiry_delta,
+                htlc_minimum_msat=htlc_minimum_msat,
+                htlc_maximum_msat=htlc_maximum_msat if has_htlc_maximum else None,
+                fee_base_msat=fee_base_msat,
+                fee_proportional_millionths=fee_proportional_millionths,
+                channel_flags=channel_flags,
+                message_flags=message_flags,
+                timestamp=timestamp))
+        offset += num_policies * _SNAPSHOT_POLICY.size
+        nodes = []
+        for _ in range(num_nodes):
+            node_id, timestamp, len_features, len_alias = _SNAPSHOT_NODE.unpack_from(data, offset)
+            offset += _SNAPSHOT_NODE.size
+            features = int.from_bytes(data[offset:offset + len_features], 'big')
+            offset += len_features
+            alias = data[offset:offset + len_alias].decode('utf8')
+            offset += len_alias
+            nodes.append(NodeInfo(node_id=node_id, features=features, timestamp=timestamp, alias=alias))
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f'corrupt graph snapshot: {e!r}') from e
+    if len(channels) != num_channels or len(policies) != num_policies or offset != len(data):
+        raise ValueError('corrupt graph snapshot: unexpected length')
+    return GraphSnapshotRowids(*rowids), channels, policies, nodes
+
 
 class ChannelDB(SqlDB):
 
     NUM_MAX_RECENT_PEERS = 20
     PRIVATE_CHAN_UPD_CACHE_TTL_NORMAL = 600
     PRIVATE_CHAN_UPD_CACHE_TTL_SHORT = 120
+    # min number of gossip rows written since the last graph snapshot, before we take a new one
+    GRAPH_SNAPSHOT_MIN_NEW_ROWS = 1000
 
     def __init__(self, network: 'Network'):
         path = self.get_file_path(network.config)
@@ -334,10 +472,14 @@ class ChannelDB(SqlDB):
         # node_id -> NetAddress -> timestamp
         self._addresses = defaultdict(dict)  # type: Dict[bytes, Dict[NetAddress, int]]
         self._channels_for_node = defaultdict(set)  # type: Dict[bytes, Set[ShortChannelID]]
+        # node_id -> ((scid, other_node_id), ...). Compact adjacency used by pathfinding.
+        # Built lazily from _channels_for_node, and invalidated per node when its channels change.
+        self._neighbours_for_node = {}  # type: Dict[bytes, Tuple[Tuple[ShortChannelID, bytes, ChannelInfo], ...]]
         self._recent_peers = []  # type: List[bytes]  # list of node_ids
         self._chans_with_0_policies = set()  # type: Set[ShortChannelID]
         self._chans_with_1_policies = set()  # type: Set[ShortChannelID]
         self._chans_with_2_policies = set()  # type: Set[ShortChannelID]
+        self._num_rows_since_graph_snapshot = 0  # note: only accessed from the sql thread
 
         self.data_loaded = asyncio.Event()
         self.network = network # only for callback
@@ -403,6 +545,7 @@ class ChannelDB(SqlDB):
         if type(msg_payloads) is dict:
             msg_payloads = [msg_payloads]
         added = 0
+        db_rows = []
         for msg in msg_payloads:
             short_channel_id = ShortChannelID(msg['short_channel_id'])
             if short_channel_id in self._channels:
@@ -417,14 +560,21 @@ class ChannelDB(SqlDB):
                 continue
             if trusted:
                 added += 1
-                self.add_verified_channel_info(msg)
+                self.add_verified_channel_info(msg, db_rows=db_rows)
             else:
                 added += self.ca_verifier.add_new_channel_info(short_channel_id, msg)
-
+        if db_rows:
+            self._db_save_channels(db_rows)
         self.update_counts()
         self.logger.debug('add_channel_announcement: %d/%d'%(added, len(msg_payloads)))
 
-    def add_verified_channel_info(self, msg: dict, *, capacity_sat: int = None) -> None:
+    def add_verified_channel_info(
+            self,
+            msg: dict,
+            *,
+            capacity_sat: int = None,
+            db_rows: List[Tuple[bytes, bytes]] = None,  # if set, rows are appended here instead of saved
+    ) -> None:
         try:
             channel_info = ChannelInfo.from_msg(msg)
         except IncompatibleOrInsaneFeatures:
@@ -434,9 +584,15 @@ class ChannelDB(SqlDB):
             self._channels[channel_info.short_channel_id] = channel_info
             self._channels_for_node[channel_info.node1_id].add(channel_info.short_channel_id)
             self._channels_for_node[channel_info.node2_id].add(channel_info.short_channel_id)
+            self._neighbours_for_node.pop(channel_info.node1_id, None)
+            self._neighbours_for_node.pop(channel_info.node2_id, None)
         self._update_num_policies_for_chan(channel_info.short_channel_id)
         if 'raw' in msg:
-            self._db_save_channel(channel_info.short_channel_id, msg['raw'])
+            row = (channel_info.short_channel_id, msg['raw'])
+            if db_rows is not None:
+                db_rows.append(row)
+            else:
+                self._db_save_channels([row])
 
     def policy_changed(self, old_policy: Policy, new_policy: Policy, verbose: bool) -> bool:
         changed = False
@@ -472,9 +628,10 @@ class ChannelDB(SqlDB):
             self.logger.info(f'policy unchanged: {old_policy.timestamp} -> {new_policy.timestamp}')
         return changed
 
-    def add_channel_update(
-            self, payload, *, max_age=None, verify=True, verbose=True) -> UpdateStatus:
-        now = int(time.time())
+    def _check_channel_update(self, payload, *, max_age=None, now: int) -> Optional[UpdateStatus]:
+        """Returns the status of a channel update that should be discarded,
+        or None if it is newer than what we have. Sets payload['start_node'].
+        """
         short_channel_id = ShortChannelID(payload['short_channel_id'])
         timestamp = payload['timestamp']
         if max_age and now - timestamp > max_age:
@@ -489,49 +646,69 @@ class ChannelDB(SqlDB):
         start_node = channel_info.node1_id if direction == 0 else channel_info.node2_id
         payload['start_node'] = start_node
         # compare updates to existing database entries
-        short_channel_id = ShortChannelID(payload['short_channel_id'])
-        key = (start_node, short_channel_id)
-        old_policy = self._policies.get(key)
+        old_policy = self._policies.get((start_node, short_channel_id))
         if old_policy and timestamp <= old_policy.timestamp + 60:
             return UpdateStatus.DEPRECATED
+        return None
+
+    def add_channel_update(
+            self,
+            payload,
+            *,
+            max_age=None,
+            verify=True,
+            verbose=True,
+            db_rows: List[Tuple[bytes, bytes]] = None,  # if set, rows are appended here instead of saved
+    ) -> UpdateStatus:
+        now = int(time.time())
+        status = self._check_channel_update(payload, max_age=max_age, now=now)
+        if status is not None:
+            return status
         if verify:
             self.verify_channel_update(payload)
+        short_channel_id = ShortChannelID(payload['short_channel_id'])
+        key = (payload['start_node'], short_channel_id)
+        old_policy = self._policies.get(key)
         policy = Policy.from_msg(payload)
         with self.lock:
             self._policies[key] = policy
         self._update_num_policies_for_chan(short_channel_id)
         if 'raw' in payload:
-            self._db_save_policy(policy.key, payload['raw'])
+            row = (policy.key, payload['raw'])
+            if db_rows is not None:
+                db_rows.append(row)
+            else:
+                self._db_save_policies([row])
         if old_policy and not self.policy_changed(old_policy, policy, verbose):
             return UpdateStatus.UNCHANGED
         else:
             return UpdateStatus.GOOD
 
     def add_channel_updates(self, payloads, max_age=None) -> CategorizedChannelUpdates:
-        orphaned = []
-        expired = []
-        deprecated = []
-        unchanged = []
-        good = []
+        categorized = defaultdict(list)  # type: Dict[UpdateStatus, List[dict]]
+        now = int(time.time())
+        new_payloads = []
         for payload in payloads:
-            r = self.add_channel_update(payload, max_age=max_age, verbose=False, verify=True)
-            if r == UpdateStatus.ORPHANED:
-                orphaned.append(payload)
-            elif r == UpdateStatus.EXPIRED:
-                expired.append(payload)
-            elif r == UpdateStatus.DEPRECATED:
-                deprecated.append(payload)
-            elif r == UpdateStatus.UNCHANGED:
-                unchanged.append(payload)
-            elif r == UpdateStatus.GOOD:
-                good.append(payload)
+            r = self._check_channel_update(payload, max_age=max_age, now=now)
+            if r is None:
+                new_payloads.append(payload)
+            else:
+                categorized[r].append(payload)
+        # only verify signatures of the updates we are going to store
+        verify_gossip_msgs(self.verify_channel_update, new_payloads)
+        db_rows = []
+        for payload in new_payloads:
+            r = self.add_channel_update(payload, max_age=max_age, verbose=False, verify=False, db_rows=db_rows)
+            categorized[r].append(payload)
+        if db_rows:
+            self._db_save_policies(db_rows)
         self.update_counts()
         return CategorizedChannelUpdates(
-            orphaned=orphaned,
-            expired=expired,
-            deprecated=deprecated,
-            unchanged=unchanged,
-            good=good)
+            orphaned=categorized[UpdateStatus.ORPHANED],
+            expired=categorized[UpdateStatus.EXPIRED],
+            deprecated=categorized[UpdateStatus.DEPRECATED],
+            unchanged=categorized[UpdateStatus.UNCHANGED],
+            good=categorized[UpdateStatus.GOOD])
 
 
     def create_database(self):
@@ -540,36 +717,42 @@ class ChannelDB(SqlDB):
         c.execute(create_address)
         c.execute(create_policy)
         c.execute(create_channel_info)
+        c.execute(create_graph_snapshot)
         self.conn.commit()
 
     @sql
-    def _db_save_policy(self, key: bytes, msg: bytes):
-        # 'msg' is a 'channel_update' message
+    def _db_save_policies(self, rows: Sequence[Tuple[bytes, bytes]]):
+        # rows are (key, msg), where 'msg' is a 'channel_update' message
         c = self.conn.cursor()
-        c.execute("""REPLACE INTO policy (key, msg) VALUES (?,?)""", [key, msg])
+        c.executemany("""REPLACE INTO policy (key, msg) VALUES (?,?)""", rows)
+        self._num_rows_since_graph_snapshot += len(rows)
 
     @sql
     def _db_delete_policy(self, node_id: bytes, short_channel_id: ShortChannelID):
         key = short_channel_id + node_id
         c = self.conn.cursor()
         c.execute("""DELETE FROM policy WHERE key=?""", (key,))
+        self._num_rows_since_graph_snapshot += 1
 
     @sql
-    def _db_save_channel(self, short_channel_id: ShortChannelID, msg: bytes):
-        # 'msg' is a 'channel_announcement' message
+    def _db_save_channels(self, rows: Sequence[Tuple[ShortChannelID, bytes]]):
+        # rows are (short_channel_id, msg), where 'msg' is a 'channel_announcement' message
         c = self.conn.cursor()
-        c.execute("REPLACE INTO channel_info (short_channel_id, msg) VALUES (?,?)", [short_channel_id, msg])
+        c.executemany("REPLACE INTO channel_info (short_channel_id, msg) VALUES (?,?)", rows)
+        self._num_rows_since_graph_snapshot += len(rows)
 
     @sql
     def _db_delete_channel(self, short_channel_id: ShortChannelID):
         c = self.conn.cursor()
         c.execute("""DELETE FROM channel_info WHERE short_channel_id=?""", (short_channel_id,))
+        self._num_rows_since_graph_snapshot += 1
 
     @sql
-    def _db_save_node_info(self, node_id: bytes, msg: bytes):
-        # 'msg' is a 'node_announcement' message
+    def _db_save_node_infos(self, rows: Sequence[Tuple[bytes, bytes]]):
+        # rows are (node_id, msg), where 'msg' is a 'node_announcement' message
         c = self.conn.cursor()
-        c.execute("REPLACE INTO node_info (node_id, msg) VALUES (?,?)", [node_id, msg])
+        c.executemany("REPLACE INTO node_info (node_id, msg) VALUES (?,?)", rows)
+        self._num_rows_since_graph_snapshot += len(rows)
 
     @sql
     def _db_save_node_address(self, peer: LNPeerAddr, timestamp: int):
@@ -619,6 +802,8 @@ class ChannelDB(SqlDB):
         if type(msg_payloads) is dict:
             msg_payloads = [msg_payloads]
         new_nodes = {}
+        db_rows = []
+        all_node_addresses = []
         for msg_payload in msg_payloads:
             try:
                 node_info, node_addresses = NodeInfo.from_msg(msg_payload)
@@ -639,13 +824,16 @@ class ChannelDB(SqlDB):
             with self.lock:
                 self._nodes[node_id] = node_info
             if 'raw' in msg_payload:
-                self._db_save_node_info(node_id, msg_payload['raw'])
+                db_rows.append((node_id, msg_payload['raw']))
             with self.lock:
                 for addr in node_addresses:
                     net_addr = NetAddress(addr.host, addr.port)
                     self._addresses[node_id][net_addr] = self._addresses[node_id].get(net_addr) or 0
-            self._db_save_node_addresses(node_addresses)
-
+            all_node_addresses.extend(node_addresses)
+        if db_rows:
+            self._db_save_node_infos(db_rows)
+        if all_node_addresses:
+            self._db_save_node_addresses(all_node_addresses)
         self.logger.debug("on_node_announcement: %d/%d"%(len(new_nodes), len(msg_payloads)))
         self.update_counts()
 
@@ -725,6 +913,8 @@ class ChannelDB(SqlDB):
             if channel_info:
                 self._channels_for_node[channel_info.node1_id].remove(channel_info.short_channel_id)
                 self._channels_for_node[channel_info.node2_id].remove(channel_info.short_channel_id)
+                self._neighbours_for_node.pop(channel_info.node1_id, None)
+                self._neighbours_for_node.pop(channel_info.node2_id, None)
         self._update_num_policies_for_chan(short_channel_id)
         # delete from database
         self._db_delete_channel(short_channel_id)
@@ -774,9 +964,22 @@ class ChannelDB(SqlDB):
             return newest_ts
         sorted_node_ids = sorted(self._addresses.keys(), key=newest_ts_for_node_id, reverse=True)
         self._recent_peers = sorted_node_ids[:self.NUM_MAX_RECENT_PEERS]
-        c.execute("""SELECT * FROM channel_info""")
+        # start from the graph snapshot, if we have one. Rows that are newer than it are decoded below.
+        rowids = GraphSnapshotRowids(0, 0, 0)
+        c.execute("""SELECT data FROM graph_snapshot WHERE id=0""")
+        row = c.fetchone()
+        if row:
+            try:
+                rowids, channels, policies, nodes = deserialize_graph_snapshot(row[0])
+            except ValueError as e:
+                self.logger.info(f"ignoring graph snapshot: {e!r}")
+            else:
+                self._load_graph_snapshot(c, rowids, channels, policies, nodes)
+        num_decoded = 0
+        c.execute("""SELECT short_channel_id, msg FROM channel_info WHERE rowid > ?""", (rowids.channel_info,))
         for short_channel_id, msg in c:
             maybe_abort()
+            num_decoded += 1
             try:
                 ci = ChannelInfo.from_raw_msg(msg)
             except IncompatibleOrInsaneFeatures:
@@ -784,9 +987,10 @@ class ChannelDB(SqlDB):
             except FailedToParseMsg:
                 continue
             self._channels[ShortChannelID.normalize(short_channel_id)] = ci
-        c.execute("""SELECT * FROM node_info""")
+        c.execute("""SELECT node_id, msg FROM node_info WHERE rowid > ?""", (rowids.node_info,))
         for node_id, msg in c:
             maybe_abort()
+            num_decoded += 1
             try:
                 node_info, node_addresses = NodeInfo.from_raw_msg(msg)
             except IncompatibleOrInsaneFeatures:
@@ -795,18 +999,23 @@ class ChannelDB(SqlDB):
                 continue
             # don't load node_addresses because they dont have timestamps
             self._nodes[node_id] = node_info
-        c.execute("""SELECT * FROM policy""")
+        c.execute("""SELECT key, msg FROM policy WHERE rowid > ?""", (rowids.policy,))
         for key, msg in c:
             maybe_abort()
+            num_decoded += 1
             try:
                 p = Policy.from_raw_msg(key, msg)
             except FailedToParseMsg:
                 continue
             self._policies[(p.start_node, p.short_channel_id)] = p
+        self.logger.info(f'decoded {num_decoded} gossip messages newer than graph snapshot')
+        self._num_rows_since_graph_snapshot = num_decoded
         for channel_info in self._channels.values():
             self._channels_for_node[channel_info.node1_id].add(channel_info.short_channel_id)
             self._channels_for_node[channel_info.node2_id].add(channel_info.short_channel_id)
             self._update_num_policies_for_chan(channel_info.short_channel_id)
+        with self.lock:
+            self._neighbours_for_node.clear()
         self.logger.info(f'data loaded. {len(self._channels)} chans. {len(self._policies)} policies. '
                          f'{len(self._channels_for_node)} nodes.')
         self.update_counts()
@@ -815,6 +1024,67 @@ class ChannelDB(SqlDB):
                          f'0p: {nchans_with_0p}, 1p: {nchans_with_1p}, 2p: {nchans_with_2p}')
         self.asyncio_loop.call_soon_threadsafe(self.data_loaded.set)
         util.trigger_callback('gossip_db_loaded')
+        self._save_graph_snapshot_if_needed()
+
+    def _load_graph_snapshot(
+            self,
+            c,
+            rowids: GraphSnapshotRowids,
+            channels: Sequence[ChannelInfo],
+            policies: Sequence[Policy],
+            nodes: Sequence[NodeInfo],
+    ) -> None:
+        # Rows that were deleted or replaced since the snapshot was taken no longer
+        # have their old rowid. Only keep snapshot entries whose row is still there.
+        c.execute("""SELECT short_channel_id FROM channel_info WHERE rowid <= ?""", (rowids.channel_info,))
+        keep = set(ShortChannelID.normalize(x[0]) for x in c)
+        for ci in channels:
+            if ci.short_channel_id in keep:
+                self._channels[ci.short_channel_id] = ci
+        c.execute("""SELECT key FROM policy WHERE rowid <= ?""", (rowids.policy,))
+        keep = set(x[0] for x in c)
+        for p in policies:
+            if p.key in keep:
+                self._policies[(p.start_node, p.short_channel_id)] = p
+        c.execute("""SELECT node_id FROM node_info WHERE rowid <= ?""", (rowids.node_info,))
+        keep = set(x[0] for x in c)
+        for node_info in nodes:
+            if node_info.node_id in keep:
+                self._nodes[node_info.node_id] = node_info
+        self.logger.info(f'graph snapshot loaded. {len(self._channels)} chans. {len(self._policies)} policies. '
+                         f'{len(self._nodes)} nodes.')
+
+    def _save_graph_snapshot_if_needed(self) -> None:
+        # note: runs on the sql thread, so all rows written so far are in the db,
+        #       and the in-memory graph is at least as new as the db.
+        if self._num_rows_since_graph_snapshot < self.GRAPH_SNAPSHOT_MIN_NEW_ROWS:
+            return
+        c = self.conn.cursor()
+        max_rowids = []
+        for table in ('channel_info', 'policy', 'node_info'):
+            c.execute(f"""SELECT MAX(rowid) FROM {table}""")
+            max_rowids.append(c.fetchone()[0] or 0)
+        with self.lock:
+            channels = list(self._channels.values())
+            policies = list(self._policies.values())
+            nodes = list(self._nodes.values())
+        try:
+            data = serialize_graph_snapshot(
+                rowids=GraphSnapshotRowids(*max_rowids),
+                channels=channels,
+                policies=policies,
+                nodes=nodes)
+        except struct.error as e:
+            self.logger.warning(f"failed to serialize graph snapshot: {e!r}")
+            return
+        c.execute("""REPLACE INTO graph_snapshot (id, data) VALUES (0,?)""", (data,))
+        self.conn.commit()
+        self._num_rows_since_graph_snapshot = 0
+        self.logger.info(f'graph snapshot saved. {len(data)} bytes.')
+
+    @sql
+    def save_graph_snapshot(self) -> None:
+        self._save_graph_snapshot_if_needed()
 
     def _update_num_policies_for_chan(self, short_channel_id: ShortChannelID) -> None:
         channel_info = self.get_channel_info(short_channel_id)
@@ -913,6 +1183,69 @@ class ChannelDB(SqlDB):
                     relevant_channels.add(route_edge.short_channel_id)
         return relevant_channels
 
+    def _get_public_neighbours_for_node(self, node_id: bytes) -> Tuple[Tuple[ShortChannelID, bytes, ChannelInfo], ...]:
+        neighbours = self._neighbours_for_node.get(node_id)
+        if neighbours is not None:
+            return neighbours
+        with self.lock:
+            neighbours = []
+            for short_channel_id in self._channels_for_node.get(node_id, ()):
+                channel_info = self._channels.get(short_channel_id)
+                if channel_info is None:
+                    continue
+                other = channel_info.node2_id if channel_info.node1_id == node_id else channel_info.node1_id
+                neighbours.append((short_channel_id, other, channel_info))
+            neighbours = tuple(neighbours)
+            self._neighbours_for_node[node_id] = neighbours
+        return neighbours
+
+    def get_neighbours_for_node(
+            self,
+            node_id: bytes,
+            *,
+            my_channels: Dict[ShortChannelID, 'Channel'] = None,
+            private_route_edges: Dict[ShortChannelID, 'RouteEdge'] = None,
+    ) -> Sequence[Tuple[ShortChannelID, bytes, ChannelInfo]]:
+        """Returns (short_channel_id, other_node_id, channel_info) for the channels where
+        node_id is one of the channel participants. Same channel set as get_channels_for_node,
+        and channel_info is what get_channel_info would return.
+        """
+        if not self.data_loaded.is_set():
+            raise ChannelDBNotLoaded("channelDB data not loaded yet!")
+        neighbours = self._get_public_neighbours_for_node(node_id)
+        if not my_channels and not private_route_edges:
+            return neighbours
+        neighbours = list(neighbours)
+        seen = set(scid for scid, _, _ in neighbours)
+        if my_channels:
+            for chan in my_channels.values():
+                if chan.short_channel_id in seen:
+                    continue
+                local_pubkey = chan.get_local_pubkey()
+                if node_id == chan.node_id:
+                    other = local_pubkey
+                elif node_id == local_pubkey:
+                    other = chan.node_id
+                else:
+                    continue
+                channel_info = get_mychannel_info(chan.short_channel_id, my_channels)
+                neighbours.append((chan.short_channel_id, other, channel_info))
+                seen.add(chan.short_channel_id)
+        if private_route_edges:
+            for route_edge in private_route_edges.values():
+                if route_edge.short_channel_id in seen:
+                    continue
+                if node_id == route_edge.start_node:
+                    other = route_edge.end_node
+                elif node_id == route_edge.end_node:
+                    other = route_edge.start_node
+                else:
+                    continue
+                channel_info = ChannelInfo.from_route_edge(route_edge)
+                neighbours.append((route_edge.short_channel_id, other, channel_info))
+                seen.add(route_edge.short_channel_id)
+        return neighbours
+
     def get_endnodes_for_chan(self, short_channel_id: ShortChannelID, *,
                               my_channels: Dict[ShortChannelID, 'Channel'] = None) -> Optional[Tuple[bytes, bytes]]:
         channel_info = self.get_channel_info(short_channel_id)
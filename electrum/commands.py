@@ -37,12 +37,15 @@ from collections import defaultdict
 from functools import wraps, partial
 from itertools import repeat
 from decimal import Decimal, InvalidOperation
-from typing import Optional, TYPE_CHECKING, Dict, List
+from typing import Optional, TYPE_CHECKING, Dict, List, Tuple, Iterator
 import os
 
+from aiorpcx import run_in_thread
+
 from .import util, ecc
-from .util import (bfh, format_satoshis, json_decode, json_normalize,
-                   is_hash256_str, is_hex_str, to_bytes, parse_max_spend, to_decimal)
+from .util import (bfh, format_satoshis, json_decode, json_normalize, MyEncoder,
+                   is_hash256_str, is_hex_str, to_bytes, parse_max_spend, to_decimal,
+                   UserFacingException)
 from . import bitcoin
 from .bitcoin import is_address,  hash_160, COIN
 from .bip32 import BIP32Node
@@ -52,18 +55,16 @@ from .transaction import (Transaction, multisig_script, TxOutput, PartialTransac
 from . import transaction
 from .invoices import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED
 from .synchronizer import Notifier
-from .wallet import Abstract_Wallet, create_new_wallet, restore_wallet_from_text, Deterministic_Wallet
+from .wallet import Abstract_Wallet, create_new_wallet, restore_wallet_from_text, Deterministic_Wallet, DetailedHistoryTotals
 from .address_synchronizer import TX_HEIGHT_LOCAL
 from .mnemonic import Mnemonic
 from .lnutil import SENT, RECEIVED
 from .lnutil import LnFeatures
-from .lnutil import extract_nodeid
-from .lnpeer import channel_id_from_funding_tx
+from .lnutil import extract_nodeid, channel_id_from_funding_tx
 from .plugin import run_hook, DeviceMgr, Plugins
 from .version import ELECTRUM_VERSION
 from .simple_config import SimpleConfig
 from .invoices import Invoice
-from . import submarine_swaps
 from . import GuiImportError
 from . import crypto
 from . import constants
@@ -359,16 +360,27 @@ class Commands:
         return await self.network.get_history_for_scripthash(sh)
 
     @command('w')
-    async def listunspent(self, wallet: Abstract_Wallet = None):
+    async def listunspent(self, known_version=None, wallet: Abstract_Wallet = None):
         """List unspent outputs. Returns the list of unspent transaction
-        outputs in your wallet."""
-        coins = []
-        for txin in wallet.get_utxos():
-            d = txin.to_json()
-            v = d.pop("value_sats")
-            d["value"] = str(to_decimal(v)/COIN) if v is not None else None
-            coins.append(d)
-        return coins
+        outputs in your wallet.
+        If known_version is given, returns {"version": ..., "unspent": [...]},
+        and omits "unspent" if the version is still known_version.
+        """
+        def make_coins():
+            coins = []
+            for txin in wallet.get_utxos():
+                d = txin.to_json()
+                v = d.pop("value_sats")
+                d["value"] = str(to_decimal(v)/COIN) if v is not None else None
+                coins.append(d)
+            return coins
+        version, coins = wallet.get_snapshot('listunspent', make_coins)
+        if known_version is None:
+            return [dict(d) for d in coins]
+        out = {'version': version}
+        if version != known_version:
+            out['unspent'] = [dict(d) for d in coins]
+        return out
 
     @command('n')
     async def getaddressunspent(self, address):
@@ -551,18 +563,52 @@ class Commands:
         return wallet.get_public_keys(address)
 
     @command('w')
-    async def getbalance(self, wallet: Abstract_Wallet = None):
-        """Return the balance of your wallet. """
-        c, u, x = wallet.get_balance()
+    async def getbalance(self, known_version=None, wallet: Abstract_Wallet = None):
+        """Return the balance of your wallet.
+        If known_version is given, returns {"version": ..., "balance": {...}},
+        and omits "balance" if the version is still known_version.
+        """
+        version, balance = self._get_balance_snapshot(wallet)
+        if known_version is None:
+            return balance
+        out = {'version': version}
+        if version != known_version:
+            out['balance'] = balance
+        return out
+
+    @command('n')
+    async def getbalances(self, known_versions=None):
+        """Return the balance of all wallets loaded in the daemon, by wallet path.
+        known_versions is an optional dict (wallet path -> version) from a previous call,
+        the balance of wallets whose version did not change is omitted.
+        """
+        known_versions = known_versions or {}
+        out = {}
+        for path, wallet in self.daemon.get_wallets().items():
+            version, balance = self._get_balance_snapshot(wallet)
+            out[path] = {'version': version}
+            if version != known_versions.get(path):
+                out[path]['balance'] = balance
+        return out
+
+    @staticmethod
+    def _get_balance_snapshot(wallet: Abstract_Wallet) -> Tuple[str, dict]:
+        def make_balance():
+            c, u, x = wallet.get_balance()
+            out = {"confirmed": str(to_decimal(c)/COIN)}
+            if u:
+                out["unconfirmed"] = str(to_decimal(u)/COIN)
+            if x:
+                out["unmatured"] = str(to_decimal(x)/COIN)
+            return out
+        version, balance = wallet.get_snapshot('getbalance', make_balance)
+        balance = dict(balance)
+        # the lightning balance is not part of the wallet state version
         l = wallet.lnworker.get_balance() if wallet.lnworker else None
-        out = {"confirmed": str(to_decimal(c)/COIN)}
-        if u:
-            out["unconfirmed"] = str(to_decimal(u)/COIN)
-        if x:
-            out["unmatured"] = str(to_decimal(x)/COIN)
         if l:
-            out["lightning"] = str(to_decimal(l)/COIN)
-        return out
+            balance["lightning"] = str(to_decimal(l)/COIN)
+            version = f'{version}.{l}'
+        return version, balance
 
     @command('n')
     async def getaddressbalance(self, address):
@@ -776,13 +822,21 @@ class Commands:
 
     @command('w')
     async def onchain_history(self, year=None, show_addresses=False, show_fiat=False, wallet: Abstract_Wallet = None,
-                              from_height=None, to_height=None):
-        """Wallet onchain history. Returns the transaction history of your wallet."""
+                              from_height=None, to_height=None, asset=None, jsonl=False, output_file=None):
+        """Wallet onchain history. Returns the transaction history of your wallet.
+        With --jsonl, returns one JSON object per line, and a last line with the summary.
+        With --jsonl and --output_file, the lines are written to that file as they are
+        produced. The path is on the machine running the daemon.
+        """
+        if output_file and not jsonl:
+            raise UserFacingException('--output_file requires --jsonl')
         kwargs = {
             'show_addresses': show_addresses,
             'from_height': from_height,
             'to_height': to_height,
         }
+        if asset is not None:
+            kwargs['assets'] = {asset}
         if year:
             import time
             start_date = datetime.datetime(year, 1, 1)
@@ -793,8 +847,31 @@ class Commands:
             from .exchange_rate import FxThread
             kwargs['fx'] = self.daemon.fx if self.daemon else FxThread(config=self.config)
 
+        if jsonl:
+            lines = self._iter_history_jsonl(wallet, **kwargs)
+            if output_file:
+                def write():
+                    with open(output_file, 'w', encoding='utf-8') as f:
+                        for line in lines:
+                            f.write(line + '\n')
+                await run_in_thread(write)
+                return True
+            return '\n'.join(lines)
         return json_normalize(wallet.get_detailed_history(**kwargs))
 
+    @staticmethod
+    def _iter_history_jsonl(wallet: Abstract_Wallet, **kwargs) -> Iterator[str]:
+        # encode rows as they are produced, instead of normalizing the whole history at once
+        totals = DetailedHistoryTotals()
+        for item in wallet.iter_detailed_history(**kwargs):
+            totals.add(item)
+            yield json.dumps(item, sort_keys=True, cls=MyEncoder)
+        summary = wallet.get_detailed_history_summary(
+            totals, fx=kwargs.get('fx'), from_timestamp=kwargs.get('from_timestamp'),
+            to_timestamp=kwargs.get('to_timestamp'), from_height=kwargs.get('from_height'),
+            to_height=kwargs.get('to_height'))
+        yield json.dumps({'summary': summary}, sort_keys=True, cls=MyEncoder)
+
     @command('wp')
     async def bumpfee(self, tx, new_fee_rate, from_coins=None, decrease_payment=False, password=None, unsigned=False, wallet: Abstract_Wallet = None):
         """Bump the fee for an unconfirmed transaction.
@@ -1143,7 +1220,7 @@ class Commands:
     async def open_channel(self, connection_string, amount, push_amount=0, password=None, wallet: Abstract_Wallet = None):
         funding_sat = satoshis(amount)
         push_sat = satoshis(push_amount)
-        coins = wallet.get_spendable_coins(None)
+        coins = wallet.get_spendable_coins(None, assets={None})
         node_id, rest = extract_nodeid(connection_string)
         funding_tx = wallet.lnworker.mktx_for_open_channel(
             coins=coins,
@@ -1469,6 +1546,10 @@ command_options = {
     'fee_level':   (None, "Float between 0.0 and 1.0, representing fee slider position"),
     'from_height': (None, "Only show transactions that confirmed after given block height"),
     'to_height':   (None, "Only show transactions that confirmed before given block height"),
+    'jsonl':       (None, "Output one JSON object per line"),
+    'output_file': (None, "Write the output to this file"),
+    'known_version': (None, "Version returned by a previous call. The result is omitted if it did not change"),
+    'known_versions': (None, "Versions returned by a previous call, as a JSON dict: wallet path -> version"),
     'iknowwhatimdoing': (None, "Acknowledge that I understand the full implications of what I am about to do"),
     'gossip':      (None, "Apply command to gossip node instead of wallet"),
     'connection_string':      (None, "Lightning network node ID or network address"),
@@ -1492,6 +1573,7 @@ arg_types = {
     'to_height': int,
     'tx': convert_raw_tx_to_hex,
     'pubkeys': json_loads,
+    'known_versions': json_loads,
     'jsontx': json_loads,
     'inputs': json_loads,
     'outputs': json_loads,
@@ -29,7 +29,7 @@ import os
 import sys
 import hashlib
 import hmac
-from typing import Union, Mapping, Optional
+from typing import Union, Mapping, Optional, Iterable
 
 from .util import assert_bytes, InvalidPassword, to_bytes, to_string, WalletFileException, versiontuple
 from .i18n import _
@@ -172,6 +172,31 @@ def aes_decrypt_with_iv(key: bytes, iv: bytes, data: bytes) -> bytes:
         raise InvalidPassword()
 
 
+class AESCBCStream:
+    """Incremental AES-CBC over block-aligned chunks. Padding is left to the caller."""
+
+    def __init__(self, key: bytes, iv: bytes, *, decrypt: bool = False):
+        assert_bytes(key, iv)
+        if HAS_CRYPTODOME:
+            cipher = CD_AES.new(key, CD_AES.MODE_CBC, iv)
+            self._update = cipher.decrypt if decrypt else cipher.encrypt
+        elif HAS_CRYPTOGRAPHY:
+            cipher = CG_Cipher(CG_algorithms.AES(key), CG_modes.CBC(iv), backend=CG_default_backend())
+            self._update = (cipher.decryptor() if decrypt else cipher.encryptor()).update
+        elif HAS_PYAES:
+            aes_cbc = pyaes.AESModeOfOperationCBC(key, iv=iv)
+            process_block = aes_cbc.decrypt if decrypt else aes_cbc.encrypt
+            self._update = lambda data: b''.join(
+                process_block(data[i:i+16]) for i in range(0, len(data), 16))
+        else:
+            raise Exception("no AES backend found")
+
+    def update(self, data: bytes) -> bytes:
+        assert_bytes(data)
+        assert len(data) % 16 == 0, len(data)
+        return self._update(data)
+
+
 def EncodeAES_bytes(secret: bytes, msg: bytes) -> bytes:
     assert_bytes(msg)
     iv = bytes(os.urandom(16))
@@ -327,6 +352,14 @@ def sha256d(x: Union[bytes, str]) -> bytes:
     return out
 
 
+def sha256d_chunks(chunks: Iterable[Union[bytes, memoryview]]) -> bytes:
+    """sha256d of the concatenation of chunks, without building the concatenation."""
+    h = hashlib.sha256()
+    for chunk in chunks:
+        h.update(chunk)
+    return sha256(h.digest())
+
+
 def hash_160(x: bytes) -> bytes:
     return ripemd(sha256(x))
 
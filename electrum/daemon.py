@@ -461,7 +461,7 @@ class Daemon(Logger):
 
         self.network.start(jobs=[self.fx.run])
         # prepare lightning functionality, also load channel db early
-        if self.config.LIGHTNING_USE_GOSSIP:
+        if self.config.LIGHTNING_ENABLED and self.config.LIGHTNING_USE_GOSSIP:
             self.network.start_gossip()
 
     @staticmethod
@@ -168,12 +168,17 @@ class PubkeyProvider(object):
         self,
         origin: Optional['KeyOriginInfo'],
         pubkey: str,
-        deriv_path: Optional[str]
+        deriv_path: Optional[str],
+        *,
+        extkey: Optional[BIP32Node] = None,
+        pubkey_bytes: Optional[bytes] = None,
     ) -> None:
         """
         :param origin: The key origin if one is available
         :param pubkey: The public key. Either a hex string or a serialized extended pubkey
         :param deriv_path: Additional derivation path (suffix) if the pubkey is an extended pubkey
+        :param extkey: ``pubkey`` already parsed, if the caller has it at hand
+        :param pubkey_bytes: The derived public key, if the caller already knows it (not for ranged keys)
         """
         self.origin = origin
         self.pubkey = pubkey
@@ -188,15 +193,20 @@ class PubkeyProvider(object):
             if deriv_path[0] != "/":
                 raise ValueError(f"deriv_path suffix must start with a '/'. got {deriv_path!r}")
         # Make ExtendedKey from pubkey if it isn't hex
-        self.extkey = None
-        try:
-            unhexlify(self.pubkey)
-            # Is hex, normal pubkey
-        except Exception:
-            # Not hex, maybe xpub (but don't allow ypub/zpub)
-            self.extkey = BIP32Node.from_xkey(pubkey, allow_custom_headers=False)
+        self.extkey = extkey
+        if self.extkey is None:
+            try:
+                unhexlify(self.pubkey)
+                # Is hex, normal pubkey
+            except Exception:
+                # Not hex, maybe xpub (but don't allow ypub/zpub)
+                self.extkey = BIP32Node.from_xkey(pubkey, allow_custom_headers=False)
         if deriv_path and self.extkey is None:
             raise ValueError("deriv_path suffix present for simple pubkey")
+        # derivation result for non-ranged keys, which is asked for repeatedly when signing
+        if pubkey_bytes is not None and self.is_range():
+            raise ValueError("pubkey_bytes given for ranged key")
+        self._pubkey_bytes = pubkey_bytes  # type: Optional[bytes]
 
     @classmethod
     def parse(cls, s: str) -> 'PubkeyProvider':
@@ -240,6 +250,13 @@ class PubkeyProvider(object):
         if self.is_range() and pos is None:
             raise ValueError("pos must be set for ranged descriptor")
         # note: if not ranged, we ignore pos.
+        if not self.is_range():
+            if self._pubkey_bytes is None:
+                self._pubkey_bytes = self._derive_pubkey_bytes(pos=None)
+            return self._pubkey_bytes
+        return self._derive_pubkey_bytes(pos=pos)
+
+    def _derive_pubkey_bytes(self, *, pos: Optional[int]) -> bytes:
         if self.extkey is not None:
             compressed = True  # bip32 implies compressed pubkeys
             if self.deriv_path is None:
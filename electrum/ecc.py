@@ -26,14 +26,16 @@
 import base64
 import hashlib
 import functools
-from typing import Union, Tuple, Optional
+import hmac
+from typing import Union, Tuple, Optional, Iterable, Iterator, BinaryIO, List
 from ctypes import (
     byref, c_byte, c_int, c_uint, c_char_p, c_size_t, c_void_p, create_string_buffer,
     CFUNCTYPE, POINTER, cast
 )
 
 from .util import bfh, assert_bytes, to_bytes, InvalidPassword, profiler, randrange
-from .crypto import (sha256d, aes_encrypt_with_iv, aes_decrypt_with_iv, hmac_oneshot)
+from .crypto import (sha256d, aes_encrypt_with_iv, aes_decrypt_with_iv, hmac_oneshot,
+                     AESCBCStream, append_PKCS7_padding, strip_PKCS7_padding, InvalidPadding)
 from . import constants
 from .logging import get_logger
 from .ecc_fast import _libsecp256k1, SECP256K1_EC_UNCOMPRESSED
@@ -358,6 +360,35 @@ class ECPubkey(object):
 
         return base64.b64encode(encrypted + mac)
 
+    def encrypt_message_stream(self, chunks: Iterable[bytes], magic: bytes = b'BIE1') -> Iterator[bytes]:
+        """Streaming version of encrypt_message.
+        'chunks' are consumed lazily, and the base64 ciphertext is yielded piece by piece.
+        The concatenated output can be decrypted with decrypt_message.
+        """
+        ephemeral = ECPrivkey.generate_random_key()
+        ecdh_key = (self * ephemeral.secret_scalar).get_public_key_bytes(compressed=True)
+        key = hashlib.sha512(ecdh_key).digest()
+        iv, key_e, key_m = key[0:16], key[16:32], key[32:]
+        aes = AESCBCStream(key_e, iv)
+        encrypted = magic + ephemeral.get_public_key_bytes(compressed=True)  # not yet base64-encoded
+        mac = hmac.new(key_m, encrypted, hashlib.sha256)
+        plaintext = b''  # not yet a multiple of the AES block size
+        for chunk in chunks:
+            assert_bytes(chunk)
+            plaintext += chunk
+            n = len(plaintext) - len(plaintext) % 16
+            ciphertext = aes.update(plaintext[:n])
+            plaintext = plaintext[n:]
+            mac.update(ciphertext)
+            encrypted += ciphertext
+            n = len(encrypted) - len(encrypted) % 3
+            if n:
+                yield base64.b64encode(encrypted[:n])
+                encrypted = encrypted[n:]
+        ciphertext = aes.update(append_PKCS7_padding(plaintext))
+        mac.update(ciphertext)
+        yield base64.b64encode(encrypted + ciphertext + mac.digest())
+
     @classmethod
     def order(cls) -> int:
         return CURVE_ORDER
@@ -546,6 +577,90 @@ class ECPrivkey(ECPubkey):
             raise InvalidPassword()
         return aes_decrypt_with_iv(key_e, iv, ciphertext)
 
+    def decrypt_message_stream(self, f: BinaryIO, magic: bytes = b'BIE1') -> Iterator[bytes]:
+        """Streaming version of decrypt_message, reading the base64 ciphertext from
+        the seekable binary file 'f'. The mac is checked in a first pass over the
+        file, before anything gets decrypted.
+        """
+        mac = []
+        pieces = _iter_ecies_ciphertext(f, mac)
+        header = next(pieces)
+        if header[:4] != magic:
+            raise Exception('invalid ciphertext: invalid magic bytes')
+        try:
+            ephemeral_pubkey = ECPubkey(header[4:37])
+        except InvalidECPointException as e:
+            raise Exception('invalid ciphertext: invalid ephemeral pubkey') from e
+        ecdh_key = (ephemeral_pubkey * self.secret_scalar).get_public_key_bytes(compressed=True)
+        key = hashlib.sha512(ecdh_key).digest()
+        iv, key_e, key_m = key[0:16], key[16:32], key[32:]
+        expected_mac = hmac.new(key_m, header, hashlib.sha256)
+        for ciphertext in pieces:
+            expected_mac.update(ciphertext)
+        if mac[0] != expected_mac.digest():
+            raise InvalidPassword()
+        # second pass: decrypt. The last block is held back to strip the padding.
+        aes = AESCBCStream(key_e, iv, decrypt=True)
+        pieces = _iter_ecies_ciphertext(f, [])
+        next(pieces)
+        ciphertext = b''
+        last_block = b''
+        for piece in pieces:
+            ciphertext += piece
+            n = len(ciphertext) - len(ciphertext) % 16
+            if n:
+                plaintext = last_block + aes.update(ciphertext[:n])
+                ciphertext = ciphertext[n:]
+                yield plaintext[:-16]
+                last_block = plaintext[-16:]
+        if ciphertext:
+            raise Exception('invalid ciphertext: length')
+        try:
+            yield strip_PKCS7_padding(last_block)
+        except InvalidPadding:
+            raise InvalidPassword()
+
+
+def _iter_b64decode(f: BinaryIO, *, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    pending = b''
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        pending += data.translate(None, b' \t\r\n')
+        n = len(pending) - len(pending) % 4
+        if n:
+            yield base64.b64decode(pending[:n])
+            pending = pending[n:]
+    if pending:
+        yield base64.b64decode(pending)
+
+
+def _iter_ecies_ciphertext(f: BinaryIO, mac: List[bytes]) -> Iterator[bytes]:
+    """Reads an ECIES message from the start of 'f'. Yields the header
+    (magic and ephemeral pubkey) first, then the ciphertext in pieces.
+    The trailing mac is appended to 'mac' at the end.
+    """
+    f.seek(0)
+    buf = b''
+    header_len = 37
+    ciphertext_len = 0
+    for data in _iter_b64decode(f):
+        buf += data
+        if header_len:
+            if len(buf) < header_len + 32:
+                continue
+            yield buf[:header_len]
+            buf = buf[header_len:]
+            header_len = 0
+        if len(buf) > 32:
+            ciphertext_len += len(buf) - 32
+            yield buf[:-32]
+            buf = buf[-32:]
+    if header_len or ciphertext_len < 16:
+        raise Exception('invalid ciphertext: length')
+    mac.append(buf)
+
 
 def construct_sig65(sig_string: bytes, recid: int, is_compressed: bool) -> bytes:
     comp = 4 if is_compressed else 0
@@ -1,9 +1,13 @@
 import asyncio
-from datetime import datetime
+from array import array
+from datetime import datetime, date
 import inspect
 import sys
 import os
 import json
+import math
+import mmap
+import struct
 import time
 import csv
 import decimal
@@ -40,11 +44,101 @@ SPOT_RATE_CLOSE_TO_STALE = 450      # try harder to fetch an update if price is
 SPOT_RATE_EXPIRY = 600              # spot price becomes stale after 10 minutes -> we no longer show/use it
 
 
+class DailyRates:
+    """Historical rates of one currency, as an array of floats indexed by day.
+
+    The index is derived from the json history file of the exchange, and
+    saved next to it. Later loads mmap the index instead of parsing json.
+    File format: the ordinal of the first day (int64), followed by one
+    float64 per day, little-endian; days without rate are NaN.
+    A mapped index must be closed before its file is replaced (Windows
+    does not allow replacing a file that is mapped).
+    """
+
+    HEADER = struct.Struct('<q')
+
+    def __init__(self, first_day: int, rates: Sequence[float], *, buf: mmap.mmap = None):
+        self.first_day = first_day
+        self._rates = rates
+        self._buf = buf
+
+    def close(self) -> None:
+        """Unmaps the index file. Afterwards, no rates are returned."""
+        if self._buf is None:
+            return
+        if isinstance(self._rates, memoryview):
+            self._rates.release()
+        self._rates = array('d')
+        self._buf.close()
+        self._buf = None
+
+    def __len__(self):
+        return len(self._rates)
+
+    def get(self, day: date) -> Decimal:
+        i = day.toordinal() - self.first_day
+        if not 0 <= i < len(self._rates):
+            return Decimal('NaN')
+        rate = self._rates[i]
+        if math.isnan(rate):
+            return Decimal('NaN')
+        # repr gives back the shortest string, i.e. what the exchange sent
+        return Decimal(repr(rate))
+
+    @classmethod
+    def from_dict(cls, h: Mapping[str, str]) -> 'DailyRates':
+        """h maps date strings (YYYY-MM-DD) to rates."""
+        days = {}
+        for date_str, rate in h.items():
+            try:
+                day = datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+                days[day] = float(rate)
+            except (ValueError, TypeError):  # guard against garbage coming from exchange
+                continue
+        if not days:
+            return cls(0, array('d'))
+        first_day = min(days)
+        rates = array('d', [math.nan]) * (max(days) - first_day + 1)
+        for day, rate in days.items():
+            rates[day - first_day] = rate
+        return cls(first_day, rates)
+
+    def write(self, filename: str) -> None:
+        rates = array('d', self._rates)
+        if sys.byteorder != 'little':
+            rates.byteswap()
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.HEADER.pack(self.first_day))
+            f.write(rates.tobytes())
+        os.replace(tmp, filename)
+
+    @classmethod
+    def read(cls, filename: str) -> Optional['DailyRates']:
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < cls.HEADER.size or (size - cls.HEADER.size) % 8:
+                return None
+            if size == cls.HEADER.size:
+                return cls(cls.HEADER.unpack(f.read())[0], array('d'))
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        first_day, = cls.HEADER.unpack_from(buf)
+        if sys.byteorder == 'little':
+            rates = memoryview(buf)[cls.HEADER.size:].cast('d')
+        else:
+            rates = array('d', buf[cls.HEADER.size:])
+            rates.byteswap()
+            buf.close()
+            buf = None
+        return cls(first_day, rates, buf=buf)
+
+
 class ExchangeBase(Logger):
 
     def __init__(self, on_quotes, on_history):
         Logger.__init__(self)
-        self._history = {}  # type: Dict[str, Dict[str, str]]
+        self._history = {}  # type: Dict[str, DailyRates]
+        self._history_timestamps = {}  # type: Dict[str, float]
         self._quotes = {}  # type: Dict[str, Optional[Decimal]]
         self._quotes_timestamp = 0  # type: Union[int, float]
         self.on_quotes = on_quotes
@@ -96,25 +190,38 @@ class ExchangeBase(Logger):
             self._quotes_timestamp = time.time()
             self.on_quotes(received_new_data=True)
 
-    def read_historical_rates(self, ccy: str, cache_dir: str) -> Optional[dict]:
+    def read_historical_rates(self, ccy: str, cache_dir: str) -> Optional[DailyRates]:
         filename = os.path.join(cache_dir, self.name() + '_'+ ccy)
         if not os.path.exists(filename):
             return None
         timestamp = os.stat(filename).st_mtime
+        index_filename = filename + '.rates'
+        h = None
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                h = json.loads(f.read())
-        except Exception:
-            return None
-        if not h:  # e.g. empty dict
+            if os.path.exists(index_filename) and os.stat(index_filename).st_mtime >= timestamp:
+                h = DailyRates.read(index_filename)
+        except OSError:
+            pass
+        if h is None:
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    h = DailyRates.from_dict(json.loads(f.read()))
+            except Exception:
+                return None
+            self._write_rates_index(h, index_filename)
+        if not len(h):  # e.g. empty dict
             return None
-        # cast rates to str
-        h = {date_str: str(rate) for (date_str, rate) in h.items()}
-        h['timestamp'] = timestamp
         self._history[ccy] = h
+        self._history_timestamps[ccy] = timestamp
         self.on_history()
         return h
 
+    def _write_rates_index(self, h: DailyRates, filename: str) -> None:
+        try:
+            h.write(filename)
+        except OSError as e:
+            self.logger.info(f"failed to write fx rates index: {repr(e)}")
+
     @log_exceptions
     async def get_historical_rates_safe(self, ccy: str, cache_dir: str) -> None:
         try:
@@ -132,8 +239,13 @@ class ExchangeBase(Logger):
         filename = os.path.join(cache_dir, self.name() + '_' + ccy)
         with open(filename, 'w', encoding='utf-8') as f:
             f.write(json.dumps(h))
-        h['timestamp'] = time.time()
-        self._history[ccy] = h
+        rates = DailyRates.from_dict(h)
+        old_rates = self._history.get(ccy)
+        self._history[ccy] = rates
+        self._history_timestamps[ccy] = time.time()
+        if old_rates is not None:
+            old_rates.close()  # it may map the index we are about to replace
+        self._write_rates_index(rates, filename + '.rates')
         self.on_history()
 
     def get_historical_rates(self, ccy: str, cache_dir: str) -> None:
@@ -142,20 +254,17 @@ class ExchangeBase(Logger):
         h = self._history.get(ccy)
         if h is None:
             h = self.read_historical_rates(ccy, cache_dir)
-        if h is None or h['timestamp'] < time.time() - 24*3600:
+        if h is None or self._history_timestamps[ccy] < time.time() - 24*3600:
             util.get_asyncio_loop().create_task(self.get_historical_rates_safe(ccy, cache_dir))
 
     def history_ccys(self) -> Sequence[str]:
         return []
 
     def historical_rate(self, ccy: str, d_t: datetime) -> Decimal:
-        date_str = d_t.strftime('%Y-%m-%d')
-        rate = self._history.get(ccy, {}).get(date_str) or 'NaN'
-        try:
-            return Decimal(rate)
-        except Exception:  # guard against garbage coming from exchange
-            #self.logger.debug(f"found corrupted historical_rate: {rate=!r}. for {ccy=} at {date_str}")
+        h = self._history.get(ccy)
+        if h is None:
             return Decimal('NaN')
+        return h.get(d_t.date())
 
     async def request_history(self, ccy: str) -> Dict[str, Union[str, float]]:
         raise NotImplementedError()  # implemented by subclasses
@@ -25,7 +25,7 @@
 
 import enum
 from enum import IntEnum
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Mapping
 
 from PyQt5.QtCore import Qt, QPersistentModelIndex, QModelIndex
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QFont
@@ -112,6 +112,8 @@ class AddressList(MyTreeView):
         self.used_button.currentIndexChanged.connect(self.toggle_used)
         for addr_usage_state in AddressUsageStateFilter.__members__.values():  # type: AddressUsageStateFilter
             self.used_button.addItem(addr_usage_state.ui_text())
+        self._addr_data = {}  # type: Dict[str, tuple]  # address -> (adb address version, *data)
+        self._addr_h160 = {}  # type: Dict[str, Optional[str]]
         self.std_model = QStandardItemModel(self)
         self.proxy = MySortModel(self, sort_role=self.ROLE_SORT_ORDER)
         self.proxy.setSourceModel(self.std_model)
@@ -178,24 +180,17 @@ class AddressList(MyTreeView):
     def update(self):
         if self.maybe_defer_update():
             return
-        current_address = self.get_role_data_for_current_item(col=0, role=self.ROLE_ADDRESS_STR)
         if self.show_change == AddressTypeFilter.RECEIVING:
             addr_list = self.wallet.get_receiving_addresses()
         elif self.show_change == AddressTypeFilter.CHANGE:
             addr_list = self.wallet.get_change_addresses()
         else:
             addr_list = self.wallet.get_addresses()
-        self.proxy.setDynamicSortFilter(False)  # temp. disable re-sorting after every change
-        self.std_model.clear()
-        self.refresh_headers()
-        fx = self.main_window.fx
-        set_address = None
-        num_shown = 0
         self.addresses_beyond_gap_limit = self.wallet.get_all_known_addresses_beyond_gap_limit()
+        shown = []
         for address in addr_list:
-            c, u, x = self.wallet.get_addr_balance(address)
-            balance = c + u + x
-            is_used_and_empty = self.wallet.adb.is_used(address) and balance == 0
+            balance, _balance_mapping, num_txs = self._get_addr_data(address)
+            is_used_and_empty = num_txs > 0 and balance == 0
             if self.show_used == AddressUsageStateFilter.UNUSED and (balance or is_used_and_empty):
                 continue
             if self.show_used == AddressUsageStateFilter.FUNDED and balance == 0:
@@ -204,38 +199,10 @@ class AddressList(MyTreeView):
                 continue
             if self.show_used == AddressUsageStateFilter.FUNDED_OR_UNUSED and is_used_and_empty:
                 continue
-            num_shown += 1
-            labels = [""] * len(self.Columns)
-            labels[self.Columns.ADDRESS] = address
-            address_item = [QStandardItem(e) for e in labels]
-            # align text and set fonts
-            for i, item in enumerate(address_item):
-                item.setTextAlignment(Qt.AlignVCenter)
-                if i not in (self.Columns.TYPE, self.Columns.LABEL):
-                    item.setFont(QFont(MONOSPACE_FONT))
-            self.set_editability(address_item)
-            address_item[self.Columns.FIAT_BALANCE].setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-            # setup column 0
-            if self.wallet.is_change(address):
-                address_item[self.Columns.TYPE].setText(_('change'))
-                address_item[self.Columns.TYPE].setBackground(ColorScheme.YELLOW.as_color(True))
-            else:
-                address_item[self.Columns.TYPE].setText(_('receiving'))
-                address_item[self.Columns.TYPE].setBackground(ColorScheme.GREEN.as_color(True))
-            address_item[0].setData(address, self.ROLE_ADDRESS_STR)
-            address_path = self.wallet.get_address_index(address)
-            address_item[self.Columns.TYPE].setData(address_path, self.ROLE_SORT_ORDER)
-            address_path_str = self.wallet.get_address_path_str(address)
-            if address_path_str is not None:
-                address_item[self.Columns.TYPE].setToolTip(address_path_str)
-            # add item
-            count = self.std_model.rowCount()
-            self.std_model.insertRow(count, address_item)
-            self.refresh_row(address, count)
-            address_idx = self.std_model.index(count, self.Columns.LABEL)
-            if address == current_address:
-                set_address = QPersistentModelIndex(address_idx)
-        self.set_current_idx(set_address)
+            shown.append(address)
+        self.proxy.setDynamicSortFilter(False)  # temp. disable re-sorting after every change
+        self.update_keyed_rows(shown, display_state=self._get_display_state(), add_row=self._add_row)
+        self.refresh_headers()
         # show/hide columns
         if self.should_show_fiat():
             self.showColumn(self.Columns.FIAT_BALANCE)
@@ -244,18 +211,86 @@ class AddressList(MyTreeView):
         self.filter()
         self.proxy.setDynamicSortFilter(True)
         # update counter
-        self.num_addr_label.setText(_("{} addresses").format(num_shown))
+        self.num_addr_label.setText(_("{} addresses").format(len(shown)))
+
+    def _add_row(self, address: str, row: int) -> QStandardItem:
+        labels = [""] * len(self.Columns)
+        labels[self.Columns.ADDRESS] = address
+        address_item = [QStandardItem(e) for e in labels]
+        # align text and set fonts
+        for i, item in enumerate(address_item):
+            item.setTextAlignment(Qt.AlignVCenter)
+            if i not in (self.Columns.TYPE, self.Columns.LABEL):
+                item.setFont(QFont(MONOSPACE_FONT))
+        self.set_editability(address_item)
+        address_item[self.Columns.FIAT_BALANCE].setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        # setup column 0
+        if self.wallet.is_change(address):
+            address_item[self.Columns.TYPE].setText(_('change'))
+            address_item[self.Columns.TYPE].setBackground(ColorScheme.YELLOW.as_color(True))
+        else:
+            address_item[self.Columns.TYPE].setText(_('receiving'))
+            address_item[self.Columns.TYPE].setBackground(ColorScheme.GREEN.as_color(True))
+        address_item[0].setData(address, self.ROLE_ADDRESS_STR)
+        address_path = self.wallet.get_address_index(address)
+        address_item[self.Columns.TYPE].setData(address_path, self.ROLE_SORT_ORDER)
+        address_path_str = self.wallet.get_address_path_str(address)
+        if address_path_str is not None:
+            address_item[self.Columns.TYPE].setToolTip(address_path_str)
+        # add item
+        self.std_model.insertRow(row, address_item)
+        return address_item[0]
+
+    def _get_addr_data(self, address: str) -> Tuple[int, Mapping[Optional[str], Tuple[int, int, int]], int]:
+        """Returns (balance, asset aware balance, number of txs) of address,
+        cached until the local history of the address changes.
+        """
+        version = self.wallet.adb.get_address_version(address)
+        data = self._addr_data.get(address)
+        if data is None or data[0] != version:
+            c, u, x = self.wallet.get_addr_balance(address)
+            balance_mapping = self.wallet.get_addr_balance(address, asset_aware=True)
+            num_txs = self.wallet.adb.get_address_history_len(address)
+            data = self._addr_data[address] = (version, c + u + x, balance_mapping, num_txs)
+        return data[1:]
+
+    def _get_tag_count(self, address: str) -> int:
+        if address not in self._addr_h160:
+            self._addr_h160[address] = b58_address_to_hash160(address)[1].hex() if is_b58_address(address) else None
+        h160 = self._addr_h160[address]
+        return len(self.wallet.adb.get_tags_for_h160(h160)) if h160 else 0
+
+    def _get_display_state(self) -> tuple:
+        config = self.config
+        return (config.decimal_point, config.num_zeros, config.amt_precision_post_satoshi,
+                config.amt_add_thousands_sep,
+                self.main_window.fx.get_currency() if self.should_show_fiat() else None)
+
+    def _get_row_state(self, address: str) -> tuple:
+        # everything refresh_row depends on, except for fiat rates and units
+        return (
+            self.wallet.adb.get_address_version(address),
+            self.wallet.get_label_for_address(address),
+            self.wallet.is_frozen_address(address),
+            address in self.addresses_beyond_gap_limit,
+            self._get_tag_count(address),
+        )
+
+    def delete_item(self, key):
+        item = self._rows.pop(key, None)
+        self._row_states.pop(key, None)
+        self._addr_data.pop(key, None)
+        if item is not None:
+            self.std_model.takeRow(item.row())
+        self.hide_if_empty()
 
     def refresh_row(self, key, row):
         assert row is not None
         address = key
+        self._row_states[address] = self._get_row_state(address)
         label = self.wallet.get_label_for_address(address)
-        num = self.wallet.adb.get_address_history_len(address)
-        balance_mapping = self.wallet.get_addr_balance(address, asset_aware=True)
-        tag_count = 0
-        if is_b58_address(address):
-            _, h160 = b58_address_to_hash160(address)
-            tag_count = len(self.wallet.adb.get_tags_for_h160(h160.hex()))
+        _balance, balance_mapping, num = self._get_addr_data(address)
+        tag_count = self._get_tag_count(address)
         base_coin_balance = sum(balance_mapping.get(None, [0]))
         balance_text = self.main_window.format_amount(base_coin_balance, whitespaces=True)
         balance_text_nots = self.main_window.format_amount(base_coin_balance, whitespaces=False, add_thousands_sep=False)
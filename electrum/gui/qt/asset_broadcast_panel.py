@@ -108,7 +108,7 @@ class MakeBroadcastPanel(QWidget, Logger):
 
         def make_tx(fee_est, *, confirmed_only=False):
             try:
-                asset_coin = next(x for x in self.parent.wallet.get_spendable_coins(nonlocal_only=False, confirmed_only=False) if x.asset == self.selected_asset)
+                asset_coin = next(iter(self.parent.wallet.get_spendable_coins(nonlocal_only=False, confirmed_only=False, assets={self.selected_asset})))
             except StopIteration:
                 self.parent.show_warning(f'Could not find coin for {self.selected_asset}')
                 return
@@ -124,7 +124,7 @@ class MakeBroadcastPanel(QWidget, Logger):
                 )
             ]
 
-            coins = [coin for coin in self.parent.window.get_coins(nonlocal_only=False, confirmed_only=confirmed_only) if not coin.asset]
+            coins = self.parent.window.get_coins(nonlocal_only=False, confirmed_only=confirmed_only, assets={None})
             coins.append(asset_coin)
 
             tx = self.parent.wallet.make_unsigned_transaction(
@@ -163,7 +163,7 @@ class FreezePanel(QWidget):
                 self.parent.parent.wallet.set_reserved_state_of_address(parent_asset_change_address, reserved=True)
                 assets = {output.asset for output in outputs}.union({None})
                 tx = self.parent.parent.wallet.make_unsigned_transaction(
-                    coins=[coin for coin in self.parent.parent.window.get_coins(nonlocal_only=False, confirmed_only=confirmed_only) if coin.asset in assets],
+                    coins=self.parent.parent.window.get_coins(nonlocal_only=False, confirmed_only=confirmed_only, assets=assets),
                     outputs=outputs,
                     fee=fee_est,
                     rbf=False,
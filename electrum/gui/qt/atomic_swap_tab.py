@@ -314,8 +314,8 @@ class CreateSwapWidget(QWidget, Logger, MessageBoxMixin, QtEventListener):
         pay_amount = self.pay_amount_e.get_amount()
         pay_asset = None if self.pay_selector.currentIndex() == 0 else self.pay_selector.currentText()
 
-        for utxo in self.parent.wallet.get_spendable_coins():
-            if utxo.asset == pay_asset and utxo.value_sats(asset_aware=True) == pay_amount:
+        for utxo in self.parent.wallet.get_spendable_coins(assets={pay_asset}):
+            if utxo.value_sats(asset_aware=True) == pay_amount:
                 self._create_swap(utxo)
                 return
         else:
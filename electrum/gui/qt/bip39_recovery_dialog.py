@@ -5,12 +5,12 @@
 import asyncio
 import concurrent.futures
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QGridLayout, QLabel, QListWidget, QListWidgetItem
 
 from electrum.i18n import _
 from electrum.network import Network
-from electrum.bip39_recovery import account_discovery
+from electrum.bip39_recovery import account_discovery, AccountDiscoveryProgress
 from electrum.logging import get_logger
 
 from .util import WindowModalDialog, MessageBoxMixin, TaskThread, Buttons, CancelButton, OkButton
@@ -23,6 +23,8 @@ class Bip39RecoveryDialog(WindowModalDialog):
 
     ROLE_ACCOUNT = Qt.UserRole
 
+    progress_signal = pyqtSignal(object)
+
     def __init__(self, parent: QWidget, get_account_xpub, on_account_select):
         self.get_account_xpub = get_account_xpub
         self.on_account_select = on_account_select
@@ -31,12 +33,16 @@ class Bip39RecoveryDialog(WindowModalDialog):
         vbox = QVBoxLayout(self)
         self.content = QVBoxLayout()
         self.content.addWidget(QLabel(_('Scanning common paths for existing accounts...')))
+        self.progress_label = QLabel('')
+        self.content.addWidget(self.progress_label)
         vbox.addLayout(self.content)
+        self.progress_signal.connect(self.on_progress)
 
         self.thread = TaskThread(self)
         self.thread.finished.connect(self.deleteLater) # see #3956
         network = Network.get_instance()
-        coro = account_discovery(network, self.get_account_xpub)
+        # progress is reported from the network thread, the signal hands it over to the GUI thread
+        coro = account_discovery(network, self.get_account_xpub, progress_cb=self.progress_signal.emit)
         fut = asyncio.run_coroutine_threadsafe(coro, network.asyncio_loop)
         self.thread.add(
             fut.result,
@@ -62,6 +68,13 @@ class Bip39RecoveryDialog(WindowModalDialog):
         account = item.data(self.ROLE_ACCOUNT)
         self.on_account_select(account)
 
+    def on_progress(self, progress: AccountDiscoveryProgress):
+        if progress.has_finished:
+            return
+        self.progress_label.setText(
+            _('Checked {} accounts, found {} so far.').format(
+                progress.num_accounts_checked, len(progress.active_accounts)))
+
     def on_recovery_success(self, accounts):
         self.clear_content()
         if len(accounts) == 0:
@@ -627,15 +627,18 @@ class HistoryList(MyTreeView, AcceptFileDragDrop):
             return datetime.datetime(date.year, date.month, date.day)
 
     def show_summary(self):
-        if not self.hm.should_show_fiat():
-            self.main_window.show_message(_("Enable fiat exchange rate with history."))
-            return
-        fx = self.main_window.fx
-        h = self.wallet.get_detailed_history(
-            from_timestamp = time.mktime(self.start_date.timetuple()) if self.start_date else None,
-            to_timestamp = time.mktime(self.end_date.timetuple()) if self.end_date else None,
-            fx=fx)
-        summary = h['summary']
+        show_fiat = self.hm.should_show_fiat()
+        from_timestamp = time.mktime(self.start_date.timetuple()) if self.start_date else None
+        to_timestamp = time.mktime(self.end_date.timetuple()) if self.end_date else None
+        if show_fiat:
+            fx = self.main_window.fx
+            h = self.wallet.get_detailed_history(from_timestamp=from_timestamp, to_timestamp=to_timestamp, fx=fx)
+            summary = h['summary']
+        else:
+            # without fiat, the balance series is enough: no need to walk the history
+            summary = self.wallet.get_balance_summary(
+                from_timestamp=int(from_timestamp) if from_timestamp is not None else None,
+                to_timestamp=int(to_timestamp) if to_timestamp is not None else None)
         if not summary:
             self.main_window.show_message(_("Nothing to summarize."))
             return
@@ -650,8 +653,9 @@ class HistoryList(MyTreeView, AcceptFileDragDrop):
         d = WindowModalDialog(self, _("Summary"))
         d.setMinimumSize(600, 150)
         vbox = QVBoxLayout()
-        msg = messages.to_rtf(messages.MSG_CAPITAL_GAINS)
-        vbox.addWidget(WWLabel(msg))
+        if show_fiat:
+            msg = messages.to_rtf(messages.MSG_CAPITAL_GAINS)
+            vbox.addWidget(WWLabel(msg))
         grid = QGridLayout()
         grid.addWidget(QLabel(_("Begin")), 0, 1)
         grid.addWidget(QLabel(_("End")), 0, 2)
@@ -663,35 +667,37 @@ class HistoryList(MyTreeView, AcceptFileDragDrop):
         grid.addWidget(QLabel(_("BTC balance")), 2, 0)
         grid.addWidget(QLabel(format_amount(start['BTC_balance'])), 2, 1)
         grid.addWidget(QLabel(format_amount(end['BTC_balance'])), 2, 2)
-        #
-        grid.addWidget(QLabel(_("BTC Fiat price")), 3, 0)
-        grid.addWidget(QLabel(format_fiat(start.get('BTC_fiat_price'))), 3, 1)
-        grid.addWidget(QLabel(format_fiat(end.get('BTC_fiat_price'))), 3, 2)
-        #
-        grid.addWidget(QLabel(_("Fiat balance")), 4, 0)
-        grid.addWidget(QLabel(format_fiat(start.get('fiat_balance'))), 4, 1)
-        grid.addWidget(QLabel(format_fiat(end.get('fiat_balance'))), 4, 2)
-        #
-        grid.addWidget(QLabel(_("Acquisition price")), 5, 0)
-        grid.addWidget(QLabel(format_fiat(start.get('acquisition_price', ''))), 5, 1)
-        grid.addWidget(QLabel(format_fiat(end.get('acquisition_price', ''))), 5, 2)
-        #
-        grid.addWidget(QLabel(_("Unrealized capital gains")), 6, 0)
-        grid.addWidget(QLabel(format_fiat(start.get('unrealized_gains', ''))), 6, 1)
-        grid.addWidget(QLabel(format_fiat(end.get('unrealized_gains', ''))), 6, 2)
+        if show_fiat:
+            #
+            grid.addWidget(QLabel(_("BTC Fiat price")), 3, 0)
+            grid.addWidget(QLabel(format_fiat(start.get('BTC_fiat_price'))), 3, 1)
+            grid.addWidget(QLabel(format_fiat(end.get('BTC_fiat_price'))), 3, 2)
+            #
+            grid.addWidget(QLabel(_("Fiat balance")), 4, 0)
+            grid.addWidget(QLabel(format_fiat(start.get('fiat_balance'))), 4, 1)
+            grid.addWidget(QLabel(format_fiat(end.get('fiat_balance'))), 4, 2)
+            #
+            grid.addWidget(QLabel(_("Acquisition price")), 5, 0)
+            grid.addWidget(QLabel(format_fiat(start.get('acquisition_price', ''))), 5, 1)
+            grid.addWidget(QLabel(format_fiat(end.get('acquisition_price', ''))), 5, 2)
+            #
+            grid.addWidget(QLabel(_("Unrealized capital gains")), 6, 0)
+            grid.addWidget(QLabel(format_fiat(start.get('unrealized_gains', ''))), 6, 1)
+            grid.addWidget(QLabel(format_fiat(end.get('unrealized_gains', ''))), 6, 2)
         #
         grid2 = QGridLayout()
         grid2.addWidget(QLabel(_("BTC incoming")), 0, 0)
         grid2.addWidget(QLabel(format_amount(flow['BTC_incoming'])), 0, 1)
-        grid2.addWidget(QLabel(_("Fiat incoming")), 1, 0)
-        grid2.addWidget(QLabel(format_fiat(flow.get('fiat_incoming'))), 1, 1)
         grid2.addWidget(QLabel(_("BTC outgoing")), 2, 0)
         grid2.addWidget(QLabel(format_amount(flow['BTC_outgoing'])), 2, 1)
-        grid2.addWidget(QLabel(_("Fiat outgoing")), 3, 0)
-        grid2.addWidget(QLabel(format_fiat(flow.get('fiat_outgoing'))), 3, 1)
-        #
-        grid2.addWidget(QLabel(_("Realized capital gains")), 4, 0)
-        grid2.addWidget(QLabel(format_fiat(flow.get('realized_capital_gains'))), 4, 1)
+        if show_fiat:
+            grid2.addWidget(QLabel(_("Fiat incoming")), 1, 0)
+            grid2.addWidget(QLabel(format_fiat(flow.get('fiat_incoming'))), 1, 1)
+            grid2.addWidget(QLabel(_("Fiat outgoing")), 3, 0)
+            grid2.addWidget(QLabel(format_fiat(flow.get('fiat_outgoing'))), 3, 1)
+            #
+            grid2.addWidget(QLabel(_("Realized capital gains")), 4, 0)
+            grid2.addWidget(QLabel(format_fiat(flow.get('realized_capital_gains'))), 4, 1)
         vbox.addLayout(grid)
         vbox.addWidget(QLabel(_('Cash flow')))
         vbox.addLayout(grid2)
@@ -711,7 +717,7 @@ class HistoryList(MyTreeView, AcceptFileDragDrop):
             )
             return
         try:
-            plt = plot_history(list(self.hm.transactions.values()))
+            plt = plot_history(list(self.hm.transactions.values()), self.wallet.get_balance_series())
             plt.show()
         except NothingToPlotException as e:
             self.main_window.show_message(str(e))
@@ -880,19 +886,8 @@ class HistoryList(MyTreeView, AcceptFileDragDrop):
         self.main_window.show_message(_("Your wallet history has been successfully exported."))
 
     def do_export_history(self, file_name, is_csv):
-        hist = self.wallet.get_detailed_history(fx=self.main_window.fx)
-        txns = hist['transactions']
-        lines = []
-        if is_csv:
-            for item in txns:
-                lines.append([item['txid'],
-                              item.get('label', ''),
-                              item['confirmations'],
-                              item['bc_value'],
-                              item.get('fiat_value', ''),
-                              item.get('fee', ''),
-                              item.get('fiat_fee', ''),
-                              item['date']])
+        # rows are written as they are produced, so that huge histories are not held in memory
+        txns = self.wallet.iter_detailed_history(fx=self.main_window.fx)
         with open(file_name, "w+", encoding='utf-8') as f:
             if is_csv:
                 import csv
@@ -905,11 +900,23 @@ class HistoryList(MyTreeView, AcceptFileDragDrop):
                                       "fee",
                                       "fiat_fee",
                                       "timestamp"])
-                for line in lines:
-                    transaction.writerow(line)
+                for item in txns:
+                    transaction.writerow([item['txid'],
+                                          item.get('label', ''),
+                                          item['confirmations'],
+                                          item['bc_value'],
+                                          item.get('fiat_value', ''),
+                                          item.get('fee', ''),
+                                          item.get('fiat_fee', ''),
+                                          item['date']])
             else:
-                from electrum.util import json_encode
-                f.write(json_encode(txns))
+                import json
+                from electrum.util import MyEncoder
+                f.write('[')
+                for i, item in enumerate(txns):
+                    f.write(',\n' if i else '\n')
+                    f.write(json.dumps(item, sort_keys=True, indent=4, cls=MyEncoder))
+                f.write('\n]')
 
     def get_text_from_coordinate(self, row, col):
         return self.get_role_data_from_coordinate(row, col, role=Qt.DisplayRole)
@@ -35,7 +35,7 @@ import base64
 from functools import partial
 import queue
 import asyncio
-from typing import Optional, TYPE_CHECKING, Sequence, List, Union, Dict, Set
+from typing import Optional, TYPE_CHECKING, Sequence, List, Union, Dict, Set, Iterable
 import concurrent.futures
 from collections import defaultdict
 
@@ -1317,12 +1317,15 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, Logger, QtEventListener):
         else:
             self.notify(_('Payment failed') + '\n\n' + reason)
 
-    def get_coins(self, **kwargs) -> Sequence[PartialTxInput]:
+    def get_coins(self, *, assets: Optional[Iterable[Optional[str]]] = None, **kwargs) -> Sequence[PartialTxInput]:
         coins = self.get_manually_selected_coins()
         if coins is not None:
+            if assets is not None:
+                assets = set(assets)
+                coins = [coin for coin in coins if coin.asset in assets]
             return coins
         else:
-            return self.wallet.get_spendable_coins(None, **kwargs)
+            return self.wallet.get_spendable_coins(None, assets=assets, **kwargs)
 
     def get_manually_selected_coins(self) -> Optional[Sequence[PartialTxInput]]:
         """Return a list of selected coins or None.
@@ -1386,7 +1389,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, Logger, QtEventListener):
 
     def mktx_for_open_channel(self, *, funding_sat, node_id):
         make_tx = lambda fee_est, *, confirmed_only=False: self.wallet.lnworker.mktx_for_open_channel(
-            coins = self.get_coins(nonlocal_only=True, confirmed_only=confirmed_only),
+            coins = self.get_coins(nonlocal_only=True, confirmed_only=confirmed_only, assets={None}),
             funding_sat=funding_sat,
             node_id=node_id,
             fee_est=fee_est)
@@ -206,6 +206,9 @@ class MyTreeView(QTreeView):
 
     Columns: Type[BaseColumnsEnum]
 
+    # above this, update_keyed_rows() rebuilds the model instead of removing rows one by one
+    MAX_ROWS_REMOVED_INCREMENTALLY = 500
+
     def __init__(
         self,
         *,
@@ -247,6 +250,11 @@ class MyTreeView(QTreeView):
         self._default_bg_brush = QStandardItem().background()
         self.proxy = None # history, and address tabs use a proxy
 
+        # used by update_keyed_rows
+        self._rows = {}  # type: Dict[str, QStandardItem]  # key -> item in column 0
+        self._row_states = {}  # type: Dict[str, tuple]  # key -> state shown in its row
+        self._display_state = None
+
     def create_menu(self, position: QPoint) -> None:
         pass
 
@@ -474,7 +482,67 @@ class MyTreeView(QTreeView):
         self._pending_update = defer
         return defer
 
+    def update_keyed_rows(
+            self,
+            keys: Sequence[str],
+            *,
+            display_state: tuple,
+            add_row: Callable[[str, int], QStandardItem],
+    ) -> None:
+        """Makes std_model show one row per key, in the order of keys, reusing
+        the rows that are already there. A row is refreshed when it is new, when
+        _get_row_state(key) changed since it was last shown, or when display_state
+        (e.g. units) changed.
+        add_row(key, row) must insert a row for key at index row of std_model,
+        and return its item in column 0.
+        If the model had to be rebuilt, the headers must be set again by the caller.
+        """
+        if display_state != self._display_state:
+            self._display_state = display_state
+            self._row_states.clear()  # all rows need to be refreshed
+        keys_set = set(keys)
+        to_remove = [key for key in self._rows if key not in keys_set]
+        current_key = None
+        if len(to_remove) > self.MAX_ROWS_REMOVED_INCREMENTALLY:
+            # removing rows one by one is slow, rebuild instead
+            current_key = self.get_role_data_for_current_item(col=0, role=self.key_role)
+            self.std_model.clear()
+            self._rows.clear()
+            self._row_states.clear()
+        else:
+            for key in to_remove:
+                self.std_model.removeRow(self._rows.pop(key).row())
+                self._row_states.pop(key, None)
+        set_current = None
+        next_row = 0
+        for key in keys:
+            item = self._rows.get(key)
+            if item is None:
+                # insert where a rebuild would put it: after the row of the previous key
+                row = next_row
+                self._rows[key] = add_row(key, row)
+                needs_refresh = True
+            else:
+                row = item.row()
+                needs_refresh = self._row_states.get(key) != self._get_row_state(key)
+            next_row = row + 1
+            if not needs_refresh:
+                continue
+            self.refresh_row(key, row)
+            if key == current_key:
+                set_current = QPersistentModelIndex(self.std_model.index(row, 0))
+        if set_current is not None:
+            self.set_current_idx(set_current)
+
+    def _get_row_state(self, key: str) -> tuple:
+        """Everything refresh_row depends on, except for the display_state
+        passed to update_keyed_rows."""
+        raise NotImplementedError()
+
     def find_row_by_key(self, key) -> Optional[int]:
+        if self._rows:
+            item = self._rows.get(key)
+            return item.row() if item is not None else None
         for row in range(0, self.std_model.rowCount()):
             item = self.std_model.item(row, 0)
             if item.data(self.key_role) == key:
@@ -77,6 +77,7 @@ class UTXOList(MyTreeView):
         )
         self._spend_set = set()
         self._utxo_dict = {}
+        self._utxos_version = None  # wallet state version of _utxo_dict
         self.wallet = self.main_window.wallet
         self.std_model = QStandardItemModel(self)
         self.setModel(self.std_model)
@@ -92,39 +93,52 @@ class UTXOList(MyTreeView):
     @profiler(min_threshold=0.05)
     def update(self):
         # not calling maybe_defer_update() as it interferes with coincontrol status bar
-        utxos = self.wallet.get_utxos()
-        utxos.sort(key=lambda x: x.block_height, reverse=True)
+        version = self.wallet.get_state_version()
+        if version == self._utxos_version:
+            utxos = list(self._utxo_dict.values())
+        else:
+            utxos = self.wallet.get_utxos()
+            utxos.sort(key=lambda x: x.block_height, reverse=True)
         self._maybe_reset_coincontrol(utxos)
-        self._utxo_dict = {}
-        self.model().clear()
+        self._utxo_dict = {utxo.prevout.to_str(): utxo for utxo in utxos}
+        self._utxos_version = version
+        display_state = (self.config.decimal_point, self.config.num_zeros, self.config.amt_precision_post_satoshi,
+                         self.config.amt_add_thousands_sep)
+        self.update_keyed_rows(list(self._utxo_dict), display_state=display_state, add_row=self._add_row)
         self.update_headers(self.__class__.headers)
-        for idx, utxo in enumerate(utxos):
-            name = utxo.prevout.to_str()
-            self._utxo_dict[name] = utxo
-            labels = [""] * len(self.Columns)
-            amount_str = self.main_window.format_amount(
-                utxo.value_sats(asset_aware=True), whitespaces=True)
-            amount_str_nots = self.main_window.format_amount(
-                utxo.value_sats(asset_aware=True), whitespaces=False, add_thousands_sep=False)
-            labels[self.Columns.OUTPOINT] = str(utxo.short_id)
-            labels[self.Columns.ADDRESS] = utxo.address
-            labels[self.Columns.AMOUNT] = amount_str
-            labels[self.Columns.ASSET] = utxo.asset
-            utxo_item = [QStandardItem(x) for x in labels]
-            self.set_editability(utxo_item)
-            utxo_item[self.Columns.OUTPOINT].setData(name, self.ROLE_PREVOUT_STR)
-            utxo_item[self.Columns.AMOUNT].setData(amount_str_nots, self.ROLE_CLIPBOARD_DATA)
-            utxo_item[self.Columns.ADDRESS].setFont(QFont(MONOSPACE_FONT))
-            utxo_item[self.Columns.AMOUNT].setFont(QFont(MONOSPACE_FONT))
-            utxo_item[self.Columns.PARENTS].setFont(QFont(MONOSPACE_FONT))
-            utxo_item[self.Columns.OUTPOINT].setFont(QFont(MONOSPACE_FONT))
-            utxo_item[self.Columns.ASSET].setFont(QFont(MONOSPACE_FONT))
-            self.model().insertRow(idx, utxo_item)
-            self.refresh_row(name, idx)
         self.filter()
         self.update_coincontrol_bar()
         self.num_coins_label.setText(_('{} unspent transaction outputs').format(len(utxos)))
 
+    def _add_row(self, name: str, row: int) -> QStandardItem:
+        utxo = self._utxo_dict[name]
+        labels = [""] * len(self.Columns)
+        labels[self.Columns.ADDRESS] = utxo.address
+        labels[self.Columns.ASSET] = utxo.asset
+        utxo_item = [QStandardItem(x) for x in labels]
+        self.set_editability(utxo_item)
+        utxo_item[self.Columns.OUTPOINT].setData(name, self.ROLE_PREVOUT_STR)
+        utxo_item[self.Columns.ADDRESS].setFont(QFont(MONOSPACE_FONT))
+        utxo_item[self.Columns.AMOUNT].setFont(QFont(MONOSPACE_FONT))
+        utxo_item[self.Columns.PARENTS].setFont(QFont(MONOSPACE_FONT))
+        utxo_item[self.Columns.OUTPOINT].setFont(QFont(MONOSPACE_FONT))
+        utxo_item[self.Columns.ASSET].setFont(QFont(MONOSPACE_FONT))
+        self.model().insertRow(row, utxo_item)
+        return utxo_item[self.Columns.OUTPOINT]
+
+    def _get_row_state(self, key: str) -> tuple:
+        # everything refresh_row depends on, except for units
+        utxo = self._utxo_dict[key]
+        txid = utxo.prevout.txid.hex()
+        return (
+            str(utxo.short_id),
+            self.wallet.get_num_parents(txid),
+            self.wallet.get_label_for_txid(txid),
+            key in self._spend_set,
+            self.wallet.is_frozen_address(utxo.address),
+            self.wallet.is_frozen_coin(utxo),
+        )
+
     def update_coincontrol_bar(self):
         # update coincontrol status bar
         if bool(self._spend_set):
@@ -140,8 +154,16 @@ class UTXOList(MyTreeView):
     def refresh_row(self, key, row):
         assert row is not None
         utxo = self._utxo_dict[key]
+        self._row_states[key] = self._get_row_state(key)
         utxo_item = [self.std_model.item(row, col) for col in self.Columns]
         txid = utxo.prevout.txid.hex()
+        amount_str = self.main_window.format_amount(
+            utxo.value_sats(asset_aware=True), whitespaces=True)
+        amount_str_nots = self.main_window.format_amount(
+            utxo.value_sats(asset_aware=True), whitespaces=False, add_thousands_sep=False)
+        utxo_item[self.Columns.OUTPOINT].setText(str(utxo.short_id))
+        utxo_item[self.Columns.AMOUNT].setText(amount_str)
+        utxo_item[self.Columns.AMOUNT].setData(amount_str_nots, self.ROLE_CLIPBOARD_DATA)
         num_parents = self.wallet.get_num_parents(txid)
         utxo_item[self.Columns.PARENTS].setText('%6s'%num_parents if num_parents else '-')
         label = self.wallet.get_label_for_txid(txid) or ''
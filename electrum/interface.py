@@ -36,6 +36,7 @@ import itertools
 import logging
 import hashlib
 import functools
+import time
 
 import aiorpcx
 from aiorpcx import RPCSession, Notification, NetAddress, NewlineFramer
@@ -179,6 +180,30 @@ class NotificationSession(RPCSession):
             self.maybe_log(f"--> {response} (id: {msg_id})")
             return response
 
+    async def send_batch_of_requests(self, method: str, params_list: Sequence[Sequence], *, timeout=None) -> List:
+        """Sends one request per params in a single JSON-RPC batch.
+        Returns the results in order. If any request failed, its error is raised.
+        """
+        if not params_list:
+            return []  # aiorpcx refuses empty batches
+        msg_id = next(self._msg_counter)
+        self.maybe_log(f"<-- batch of {len(params_list)}x {method} (id: {msg_id})")
+        async def send_batch():
+            async with self.send_batch() as batch:
+                for params in params_list:
+                    batch.add_request(method, params)
+            return batch.results
+        try:
+            results = await util.wait_for2(send_batch(), timeout)
+        except (TaskTimeout, asyncio.TimeoutError) as e:
+            raise RequestTimedOut(f'batch request timed out: {method} (id: {msg_id})') from e
+        for result in results:
+            if isinstance(result, Exception):
+                self.maybe_log(f"--> {repr(result)} (id: {msg_id})")
+                raise result
+        self.maybe_log(f"--> batch of {len(results)} results (id: {msg_id})")
+        return list(results)
+
     def set_default_timeout(self, timeout):
         self.sent_request_timeout = timeout
         self.max_send_delay = timeout
@@ -648,11 +673,20 @@ class Interface(Logger):
         if tip is not None:
             size = min(size, tip - height + 1)
             size = max(size, 0)
+        hexdata = await self._fetch_chunk(height, size)
+        conn = await self.blockchain.connect_chunk(height, hexdata)
+
+        if not conn:
+            return conn, 0
+        return conn, size
+
+    async def _fetch_chunk(self, height: int, size: int) -> str:
+        """Requests size headers starting at height, and returns them as hex."""
         try:
-            self._requested_chunks.add((height, height + size))            
+            self._requested_chunks.add((height, height + size))
             res = await self.session.send_request('blockchain.block.headers', [height, size])
         finally:
-            self._requested_chunks.discard((height, height + size))        
+            self._requested_chunks.discard((height, height + size))
         assert_dict_contains_field(res, field_name='count')
         assert_dict_contains_field(res, field_name='hex')
         assert_dict_contains_field(res, field_name='max')
@@ -668,11 +702,47 @@ class Interface(Logger):
             raise RequestCorrupted(f"server uses too low 'max' count for block.headers: {res['max']} < 2016")
         if res['count'] != size:
             raise RequestCorrupted(f"expected {size} headers but only got {res['count']}")
-        conn = await self.blockchain.connect_chunk(height, res['hex'])
-
-        if not conn:
-            return conn, 0
-        return conn, res['count']
+        return res['hex']
+
+    async def request_chunks(self, height: int, tip: int) -> Tuple[bool, int]:
+        """Downloads the headers from height to tip in chunks of 2016,
+        keeping up to NETWORK_HEADER_CHUNKS_IN_FLIGHT requests in flight.
+        Chunks are connected in order, as they arrive. Stops at the first
+        chunk that does not connect.
+        Returns whether the first chunk connected, and the number of headers
+        that were connected.
+        """
+        assert is_non_negative_integer(height), height
+        max_in_flight = max(1, self.network.config.NETWORK_HEADER_CHUNKS_IN_FLIGHT)
+        chunks = [(h, min(2016, tip - h + 1)) for h in range(height, tip + 1, 2016)]
+        pending = []  # type: List[Tuple[int, asyncio.Task]]
+        num_headers = 0
+        t0 = time.monotonic()
+        try:
+            for i, (start, size) in enumerate(chunks):
+                while len(pending) < max_in_flight and i + len(pending) < len(chunks):
+                    h, s = chunks[i + len(pending)]
+                    self.logger.info(f"requesting chunk from height {h}")
+                    pending.append((h, asyncio.create_task(self._fetch_chunk(h, s))))
+                _, task = pending.pop(0)
+                hexdata = await task
+                # fsync is batched, see sync_headers_to_disk below
+                if not await self.blockchain.connect_chunk(start, hexdata, fsync=False):
+                    break
+                num_headers += size
+                util.trigger_callback('network_updated')
+        finally:
+            for _, task in pending:
+                if task.done() and not task.cancelled():
+                    task.exception()  # retrieve it, we gave up on this chunk
+                else:
+                    task.cancel()
+            blockchain.sync_headers_to_disk()
+        if num_headers:
+            dt = time.monotonic() - t0
+            self.logger.info(f"connected {num_headers} headers in {dt:.2f} s "
+                             f"({num_headers / max(dt, 1e-6):.0f} headers/s)")
+        return num_headers > 0, num_headers
 
     def is_main_server(self) -> bool:
         return (self.network.interface == self or
@@ -813,7 +883,7 @@ class Interface(Logger):
                     # the start and end block's targets
                     height = (height // constants.net.DGW_CHECKPOINTS_SPACING) * constants.net.DGW_CHECKPOINTS_SPACING
 
-                could_connect, num_headers = await self.request_chunk(height, next_height)
+                could_connect, num_headers = await self.request_chunks(height, next_height)
 
                 if not could_connect:
                     if height <= constants.net.max_checkpoint():
@@ -821,8 +891,7 @@ class Interface(Logger):
                     last, height = await self.step(height)
                     continue
 
-                util.trigger_callback('network_updated')
-                got_less_than_spacing = num_headers < constants.net.DGW_CHECKPOINTS_SPACING
+                got_less_than_spacing = num_headers % constants.net.DGW_CHECKPOINTS_SPACING != 0
                 height = height + num_headers
                 assert height <= next_height+1, (height, self.tip)
                 last = 'catchup'
@@ -1041,7 +1110,23 @@ class Interface(Logger):
             raise Exception(f"{repr(sh)} is not a scripthash")
         # do request
         res = await self.session.send_request('blockchain.scripthash.get_history', [sh])
-        # check response
+        self._check_history_response(sh, res)
+        return res
+
+    async def get_history_for_scripthashes(self, shs: Sequence[str]) -> List[List[dict]]:
+        """Like get_history_for_scripthash, for several scripthashes in one batch request."""
+        for sh in shs:
+            if not is_hash256_str(sh):
+                raise Exception(f"{repr(sh)} is not a scripthash")
+        # do request
+        results = await self.session.send_batch_of_requests(
+            'blockchain.scripthash.get_history', [[sh] for sh in shs])
+        for sh, res in zip(shs, results):
+            self._check_history_response(sh, res)
+        return results
+
+    @classmethod
+    def _check_history_response(cls, sh: str, res) -> None:
         assert_list_or_tuple(res)
         prev_height = 1
         for tx_item in res:
@@ -1064,7 +1149,6 @@ class Interface(Logger):
             # a recently mined tx could be included in both last block and mempool?
             # Still, it's simplest to just disregard the response.
             raise RequestCorrupted(f"server history has non-unique txids for sh={sh}")
-        return res
 
     async def listunspent_for_scripthash(self, sh: str, asset) -> List[dict]:
         if not is_hash256_str(sh):
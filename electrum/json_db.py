@@ -25,7 +25,7 @@
 import threading
 import copy
 import json
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterator, Optional
 
 from . import util
 from .util import WalletFileException, profiler
@@ -104,6 +104,17 @@ class StoredObject:
         return d
 
 
+class StoredTable:
+    """Base class of compact containers that take the place of a StoredDict.
+    Serialized like a dict with str keys: subclasses implement keys(),
+    get(key), items() and __len__, so that dump_chunks can encode them a
+    few items at a time, and to_json() for json.dumps.
+    """
+
+    def to_json(self) -> dict:
+        return dict(self.items())
+
+
 _RaiseKeyError = object() # singleton for no-default behavior
 
 class StoredDict(dict):
@@ -166,6 +177,67 @@ class StoredDict(dict):
 
 
 
+JSON_CHUNK_ITEMS = 256  # dict items encoded per json call in _iter_json_chunks
+
+
+def _is_expandable(obj) -> bool:
+    if isinstance(obj, StoredTable):
+        return len(obj) > 0
+    return isinstance(obj, dict) and bool(obj) and all(isinstance(k, str) for k in obj)
+
+
+def _encode_json_value(obj, *, encoder: json.JSONEncoder, level: int) -> str:
+    s = encoder.encode(obj)
+    if encoder.indent is not None and level:
+        s = s.replace('\n', '\n' + ' ' * (encoder.indent * level))
+    return s
+
+
+def _iter_json_chunks(obj, *, encoder: json.JSONEncoder, level: int, depth: int) -> Iterator[str]:
+    # Dicts are expanded 'depth' levels deep; anything below that is encoded
+    # JSON_CHUNK_ITEMS items at a time. The output matches json.dumps.
+    if depth == 0 or not _is_expandable(obj):
+        yield _encode_json_value(obj, encoder=encoder, level=level)
+        return
+    indent = encoder.indent
+    if indent is None:
+        item_separator, closing = ', ', '}'
+    else:
+        item_separator = ','
+        closing = '\n' + ' ' * (indent * level) + '}'
+    if isinstance(obj, StoredTable):
+        # values are decoded one at a time, as they are encoded
+        items = ((k, obj.get(k)) for k in sorted(obj.keys())) if encoder.sort_keys else obj.items()
+    else:
+        items = sorted(obj.items()) if encoder.sort_keys else obj.items()
+    separator = '{'
+    group = []
+
+    def encode_group():
+        # encode the items as a dict, without the enclosing braces
+        s = _encode_json_value(dict(group), encoder=encoder, level=level)
+        group.clear()
+        return s[1:-1] if indent is None else s[1:-len(closing)]
+
+    for key, value in items:
+        if depth > 1 and _is_expandable(value):
+            if group:
+                yield separator + encode_group()
+                separator = item_separator
+            newline_indent = '' if indent is None else '\n' + ' ' * (indent * (level + 1))
+            yield separator + newline_indent + encoder.encode(key) + ': '
+            separator = item_separator
+            yield from _iter_json_chunks(value, encoder=encoder, level=level + 1, depth=depth - 1)
+            continue
+        group.append((key, value))
+        if len(group) >= JSON_CHUNK_ITEMS:
+            yield separator + encode_group()
+            separator = item_separator
+    if group:
+        yield separator + encode_group()
+    yield closing
+
+
 class JsonDB(Logger):
 
     def __init__(self, data, storage=None):
@@ -238,6 +310,17 @@ class JsonDB(Logger):
             cls=JsonDBJsonEncoder,
         )
 
+    def dump_chunks(self, *, human_readable: bool = True) -> Iterator[str]:
+        """Serializes the DB piece by piece, so that the whole string is never
+        held in memory. Joined, the pieces are equal to dump().
+        The caller must hold self.lock until the iterator is exhausted.
+        """
+        encoder = JsonDBJsonEncoder(
+            indent=4 if human_readable else None,
+            sort_keys=bool(human_readable),
+        )
+        return _iter_json_chunks(self.data, encoder=encoder, level=0, depth=2)
+
     def _should_convert_to_stored_dict(self, key) -> bool:
         return True
 
@@ -280,6 +363,6 @@ class JsonDB(Logger):
             return
         if not self.modified():
             return
-        json_str = self.dump(human_readable=not self.storage.is_encrypted())
-        self.storage.write(json_str)
+        chunks = self.dump_chunks(human_readable=not self.storage.is_encrypted())
+        self.storage.write_chunks(chunks)
         self.set_modified(False)
@@ -27,7 +27,9 @@
 from unicodedata import normalize
 import hashlib
 import re
-from typing import Tuple, TYPE_CHECKING, Union, Sequence, Optional, Dict, List, NamedTuple
+import threading
+import time
+from typing import Tuple, TYPE_CHECKING, Union, Sequence, Optional, Dict, List, NamedTuple, Mapping
 from functools import lru_cache, wraps
 from abc import ABC, abstractmethod
 
@@ -44,7 +46,7 @@ from .crypto import (pw_decode, pw_encode, sha256, sha256d, PW_HASH_VERSION_LATE
                      SUPPORTED_PW_HASH_VERSIONS, UnsupportedPasswordHashVersion, hash_160,
                      CiphertextFormatError)
 from .util import (InvalidPassword, WalletFileException,
-                   BitcoinException, bfh, inv_dict, is_hex_str)
+                   BitcoinException, bfh, inv_dict, is_hex_str, LRUCache)
 from .mnemonic import Mnemonic, Wordlist, seed_type, is_seed
 from .plugin import run_hook
 from .logging import Logger
@@ -60,6 +62,13 @@ if TYPE_CHECKING:
 class CannotDerivePubkey(Exception): pass
 
 
+# bounds of the per-keystore caches of BIP32 derivations
+BIP32_NODE_CACHE_SIZE = 64  # intermediate nodes, keyed by path prefix
+BIP32_PUBKEY_CACHE_SIZE = 1 << 16  # leaf pubkeys
+# private nodes are forgotten this long after they were first cached
+BIP32_PRIVATE_NODE_CACHE_TIMEOUT = 60  # seconds
+
+
 def also_test_none_password(check_password_fn):
     """Decorator for check_password, simply to give a friendlier exception if
     check_password(x) is called on a keystore that does not have a password set.
@@ -105,6 +114,10 @@ class KeyStore(Logger, ABC):
         """Returns whether the keystore can be encrypted with a password."""
         pass
 
+    def clear_private_key_cache(self) -> None:
+        """Forgets private key material cached from previous calls that had the password."""
+        pass
+
     def _get_tx_derivations(self, tx: 'PartialTransaction') -> Dict[str, Union[Sequence[int], str]]:
         keypairs = {}
         for txin in tx.inputs():
@@ -229,13 +242,20 @@ class Software_KeyStore(KeyStore):
         # Raise if password is not correct.
         self.check_password(password)
         # Add private keys
-        keypairs = self._get_tx_derivations(tx)
-        for k, v in keypairs.items():
-            keypairs[k] = self.get_private_key(v, password)
+        keypairs = self._get_private_keys(self._get_tx_derivations(tx), password)
         # Sign
         if keypairs:
             tx.sign(keypairs, wallet)
 
+    def _get_private_keys(
+            self,
+            derivations: Mapping[str, 'AddressIndexGeneric'],
+            password,
+    ) -> Dict[str, Tuple[bytes, bool]]:
+        """Returns pubkey_hex -> (privkey, is_compressed), for all derivations at once."""
+        return {pubkey: self.get_private_key(sequence, password)
+                for pubkey, sequence in derivations.items()}
+
     @abstractmethod
     def update_password(self, old_password, new_password):
         pass
@@ -489,9 +509,10 @@ class Xpub(MasterPublicKeyMixin):
 
     def __init__(self, *, derivation_prefix: str = None, root_fingerprint: str = None):
         self.xpub = None
-        self.xpub_receive = None
-        self.xpub_change = None
         self._xpub_bip32_node = None  # type: Optional[BIP32Node]
+        self._xpub_standard_xkey = None  # type: Optional[str]
+        self._public_nodes = LRUCache(maxsize=BIP32_NODE_CACHE_SIZE)  # type: Dict[Tuple[int, ...], BIP32Node]
+        self._pubkeys = LRUCache(maxsize=BIP32_PUBKEY_CACHE_SIZE)  # type: Dict[Tuple[int, ...], bytes]
 
         # "key origin" info (subclass should persist these):
         self._derivation_prefix = derivation_prefix  # type: Optional[str]
@@ -562,10 +583,14 @@ class Xpub(MasterPublicKeyMixin):
         strpath = convert_bip32_intpath_to_strpath(sequence)
         strpath = strpath[1:]  # cut leading "m"
         bip32node = self.get_bip32_node_for_xpub()
+        if self._xpub_standard_xkey is None:
+            self._xpub_standard_xkey = bip32node._replace(xtype="standard").to_xkey()
         return PubkeyProvider(
             origin=self.get_key_origin_info(),
-            pubkey=bip32node._replace(xtype="standard").to_xkey(),
+            pubkey=self._xpub_standard_xkey,
             deriv_path=strpath,
+            extkey=bip32node._replace(xtype="standard"),
+            pubkey_bytes=self.get_pubkey_at_path(sequence) if strpath else None,
         )
 
     def add_key_origin_from_root_node(self, *, derivation_prefix: str, root_node: BIP32Node):
@@ -595,20 +620,33 @@ class Xpub(MasterPublicKeyMixin):
             self._derivation_prefix = derivation_prefix
         self.is_requesting_to_be_rewritten_to_wallet_file = True
 
-    @lru_cache(maxsize=None)
     def derive_pubkey(self, for_change: int, n: int) -> bytes:
         for_change = int(for_change)
         if for_change not in (0, 1):
             raise CannotDerivePubkey("forbidden path")
-        xpub = self.xpub_change if for_change else self.xpub_receive
-        if xpub is None:
-            rootnode = self.get_bip32_node_for_xpub()
-            xpub = rootnode.subkey_at_public_derivation((for_change,)).to_xpub()
-            if for_change:
-                self.xpub_change = xpub
+        return self.get_pubkey_at_path((for_change, n))
+
+    def _get_public_node(self, path: Tuple[int, ...]) -> BIP32Node:
+        node = self._public_nodes.get(path)
+        if node is None:
+            node = self.get_bip32_node_for_xpub().subkey_at_public_derivation(path)
+            self._public_nodes[path] = node
+        return node
+
+    def get_pubkey_at_path(self, sequence: Sequence[int]) -> bytes:
+        """Returns the pubkey at the given (non-hardened) path below our xpub.
+        The parent node of the path is cached, so only the last step is derived.
+        """
+        sequence = tuple(sequence)
+        pubkey = self._pubkeys.get(sequence)
+        if pubkey is None:
+            if not sequence:
+                node = self.get_bip32_node_for_xpub()
             else:
-                self.xpub_receive = xpub
-        return self.get_pubkey_from_xpub(xpub, (n,))
+                node = self._get_public_node(sequence[:-1]).subkey_at_public_derivation(sequence[-1:])
+            pubkey = node.eckey.get_public_key_bytes(compressed=True)
+            self._pubkeys[sequence] = pubkey
+        return pubkey
 
     @classmethod
     def get_pubkey_from_xpub(self, xpub: str, sequence) -> bytes:
@@ -625,6 +663,12 @@ class BIP32_KeyStore(Xpub, Deterministic_KeyStore):
         Deterministic_KeyStore.__init__(self, d)
         self.xpub = d.get('xpub')
         self.xprv = d.get('xprv')
+        # private nodes derived from the decrypted xprv, see _get_private_node
+        self._private_nodes = LRUCache(maxsize=BIP32_NODE_CACHE_SIZE)  # type: Dict[Tuple[int, ...], BIP32Node]
+        self._private_nodes_xprv_hash = None  # type: Optional[bytes]
+        self._private_nodes_expiry = 0
+        self._private_nodes_timer = None  # type: Optional[threading.Timer]  # clears the cache on expiry
+        self._private_nodes_lock = threading.RLock()
 
     def format_seed(self, seed):
         return ' '.join(seed.split())
@@ -664,6 +708,41 @@ class BIP32_KeyStore(Xpub, Deterministic_KeyStore):
             b = pw_decode(self.xprv, old_password, version=self.pw_hash_version)
             self.xprv = pw_encode(b, new_password, version=PW_HASH_VERSION_LATEST)
         self.pw_hash_version = PW_HASH_VERSION_LATEST
+        self.clear_private_key_cache()
+
+    def clear_private_key_cache(self):
+        with self._private_nodes_lock:
+            self._private_nodes.clear()
+            self._private_nodes_xprv_hash = None
+            self._private_nodes_expiry = 0
+            if self._private_nodes_timer:
+                self._private_nodes_timer.cancel()
+                self._private_nodes_timer = None
+
+    def _get_private_node(self, xprv: str, path: Tuple[int, ...]) -> BIP32Node:
+        """Returns the node at path below xprv, which must be our decrypted xprv.
+        Callers decrypt it each time, so a wrong password still fails even if cached.
+        The cache is wiped BIP32_PRIVATE_NODE_CACHE_TIMEOUT seconds after it was filled,
+        whether or not there are further calls.
+        """
+        with self._private_nodes_lock:
+            xprv_hash = sha256(xprv)
+            now = time.monotonic()
+            if self._private_nodes_xprv_hash != xprv_hash or now > self._private_nodes_expiry:
+                self.clear_private_key_cache()
+                self._private_nodes_xprv_hash = xprv_hash
+                self._private_nodes_expiry = now + BIP32_PRIVATE_NODE_CACHE_TIMEOUT
+                self._private_nodes_timer = threading.Timer(BIP32_PRIVATE_NODE_CACHE_TIMEOUT, self.clear_private_key_cache)
+                self._private_nodes_timer.daemon = True
+                self._private_nodes_timer.start()
+            node = self._private_nodes.get(path)
+            if node is None:
+                if not path:
+                    node = BIP32Node.from_xkey(xprv)
+                else:
+                    node = self._get_private_node(xprv, path[:-1]).subkey_at_private_derivation(path[-1:])
+                self._private_nodes[path] = node
+            return node
 
     def is_watching_only(self):
         return self.xprv is None
@@ -687,9 +766,23 @@ class BIP32_KeyStore(Xpub, Deterministic_KeyStore):
         
     def get_private_key(self, sequence: Sequence[int], password):
         xprv = self.get_master_private_key(password)
-        node = BIP32Node.from_xkey(xprv).subkey_at_private_derivation(sequence)
-        pk = node.eckey.get_secret_bytes()
-        return pk, True
+        return self._get_private_key_from_xprv(xprv, sequence), True
+
+    def _get_private_key_from_xprv(self, xprv: str, sequence: Sequence[int]) -> bytes:
+        # leaf nodes are not cached, only their parents. The leaf step is a bare CKD_priv,
+        # as building a full BIP32Node would cost two more EC multiplications.
+        sequence = tuple(sequence)
+        node = self._get_private_node(xprv, sequence[:-1])
+        if not sequence:
+            return node.eckey.get_secret_bytes()
+        privkey, _ = bip32.CKD_priv(node.eckey.get_secret_bytes(), node.chaincode, sequence[-1])
+        return privkey
+
+    def _get_private_keys(self, derivations, password):
+        # decrypt the xprv only once
+        xprv = self.get_master_private_key(password)
+        return {pubkey: (self._get_private_key_from_xprv(xprv, sequence), True)
+                for pubkey, sequence in derivations.items()}
 
     def get_keypair(self, sequence, password):
         k, _ = self.get_private_key(sequence, password)
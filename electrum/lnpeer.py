@@ -72,6 +72,8 @@ class Peer(Logger):
         'ping', 'pong', 'channel_announcement', 'node_announcement', 'channel_update',)
 
     DELAY_INC_MSG_PROCESSING_SLEEP = 0.01
+    # if this many gossip messages are waiting to be processed, we stop reading from the peer
+    GOSSIP_QUEUE_MAX_SIZE = 5000
 
     def __init__(
             self,
@@ -101,6 +103,7 @@ class Peer(Logger):
         self.reply_channel_range = asyncio.Queue()
         # gossip uses a single queue to preserve message order
         self.gossip_queue = asyncio.Queue()
+        self._gossip_queue_full = asyncio.Event()
         self.ordered_message_queues = defaultdict(asyncio.Queue)  # type: Dict[bytes, asyncio.Queue] # for messages that are ordered
         self.temp_id_to_id = {}  # type: Dict[bytes, Optional[bytes]]   # to forward error messages
         self.funding_created_sent = set() # for channels in PREOPENING
@@ -436,8 +439,11 @@ class Peer(Logger):
 
     async def process_gossip(self):
         while True:
-            await asyncio.sleep(5)
-            if not self.network.lngossip:
+            # wait a bit to accumulate a batch, unless the queue is already full
+            async with ignore_after(5):
+                await self._gossip_queue_full.wait()
+            self._gossip_queue_full.clear()
+            if self.gossip_queue.empty():
                 continue
             chan_anns = []
             chan_upds = []
@@ -583,6 +589,11 @@ class Peer(Logger):
                 # rate-limit message-processing a bit, to make it harder
                 # for a single peer to bog down the event loop / cpu:
                 await asyncio.sleep(self.DELAY_INC_MSG_PROCESSING_SLEEP)
+            if self.gossip_queue.qsize() >= self.GOSSIP_QUEUE_MAX_SIZE:
+                # backpressure: stop reading from the peer until its gossip backlog has been processed
+                self._gossip_queue_full.set()
+                while self.gossip_queue.qsize() >= self.GOSSIP_QUEUE_MAX_SIZE:
+                    await asyncio.sleep(0.1)
 
     def on_reply_short_channel_ids_end(self, payload):
         self.querying.set()
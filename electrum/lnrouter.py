@@ -23,8 +23,8 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import queue
-from collections import defaultdict
+import heapq
+import functools
 from typing import Sequence, Tuple, Optional, Dict, TYPE_CHECKING, Set
 import time
 import threading
@@ -36,7 +36,7 @@ from .util import profiler, with_lock
 from .logging import Logger
 from .lnutil import (NUM_MAX_EDGES_IN_PAYMENT_PATH, ShortChannelID, LnFeatures,
                      NBLOCK_CLTV_EXPIRY_TOO_FAR_INTO_FUTURE)
-from .channel_db import ChannelDB, Policy, NodeInfo
+from .channel_db import ChannelDB, Policy, NodeInfo, ChannelInfo
 
 if TYPE_CHECKING:
     from .lnchannel import Channel
@@ -106,14 +106,10 @@ class RouteEdge(PathEdge):
             node_features=node_info.features if node_info else 0)
 
     def is_sane_to_use(self, amount_msat: int) -> bool:
-        # TODO revise ad-hoc heuristics
-        # cltv cannot be more than 2 weeks
-        if self.cltv_expiry_delta > 14 * 144:
-            return False
-        total_fee = self.fee_for_edge(amount_msat)
-        if not is_fee_sane(total_fee, payment_amount_msat=amount_msat):
-            return False
-        return True
+        return is_edge_sane_to_use(
+            fee_msat=self.fee_for_edge(amount_msat),
+            cltv_expiry_delta=self.cltv_expiry_delta,
+            amount_msat=amount_msat)
 
     def has_feature_varonion(self) -> bool:
         features = LnFeatures(self.node_features)
@@ -161,6 +157,21 @@ def is_route_sane_to_use(route: LNPaymentRoute, invoice_amount_msat: int, min_fi
     return True
 
 
+def is_edge_sane_to_use(*, fee_msat: int, cltv_expiry_delta: int, amount_msat: int) -> bool:
+    # TODO revise ad-hoc heuristics
+    # cltv cannot be more than 2 weeks
+    if cltv_expiry_delta > 14 * 144:
+        return False
+    if not is_fee_sane(fee_msat, payment_amount_msat=amount_msat):
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=1024)
+def _node_features_support_varonion(features: int) -> bool:
+    return LnFeatures(features).supports(LnFeatures.VAR_ONION_OPT)
+
+
 def is_fee_sane(fee_msat: int, *, payment_amount_msat: int) -> bool:
     # fees <= 5 sat are fine
     if fee_msat <= 5_000:
@@ -460,6 +471,7 @@ class LNPathFinder(Logger):
             self,
             *,
             short_channel_id: ShortChannelID,
+            channel_info: Optional[ChannelInfo],
             start_node: bytes,
             end_node: bytes,
             payment_amt_msat: int,
@@ -471,13 +483,13 @@ class LNPathFinder(Logger):
     ) -> Tuple[float, int]:
         """Heuristic cost (distance metric) of going through a channel.
         Returns (heuristic_cost, fee_for_edge_msat).
+        channel_info is the one returned by get_neighbours_for_node, so that it is
+        not looked up again for every relaxation.
         """
         if self._is_edge_blacklisted(short_channel_id, now=now):
             return float('inf'), 0
         if private_route_edges is None:
             private_route_edges = {}
-        channel_info = self.channel_db.get_channel_info(
-            short_channel_id, my_channels=my_channels, private_route_edges=private_route_edges)
         if channel_info is None:
             return float('inf'), 0
         channel_policy = self.channel_db.get_policy_for_node(
@@ -507,16 +519,22 @@ class LNPathFinder(Logger):
             if node_info:
                 # it's ok if we are missing the node_announcement (node_info) for this node,
                 # but if we have it, we enforce that they support var_onion_optin
-                node_features = LnFeatures(node_info.features)
-                if not node_features.supports(LnFeatures.VAR_ONION_OPT):  # note: this is kind of slow. could be cached.
+                if not _node_features_support_varonion(node_info.features):
                     return float('inf'), 0
-            route_edge = RouteEdge.from_channel_policy(
-                channel_policy=channel_policy,
-                short_channel_id=short_channel_id,
-                start_node=start_node,
-                end_node=end_node,
-                node_info=node_info)
-        if not route_edge.is_sane_to_use(payment_amt_msat):
+            # note: we don't construct a RouteEdge here, as this runs for every relaxation
+            fee_base_msat = channel_policy.fee_base_msat
+            fee_proportional_millionths = channel_policy.fee_proportional_millionths
+            cltv_expiry_delta = channel_policy.cltv_expiry_delta
+        else:
+            fee_base_msat = route_edge.fee_base_msat
+            fee_proportional_millionths = route_edge.fee_proportional_millionths
+            cltv_expiry_delta = route_edge.cltv_expiry_delta
+        fee_msat = fee_for_edge_msat(
+            forwarded_amount_msat=payment_amt_msat,
+            fee_base_msat=fee_base_msat,
+            fee_proportional_millionths=fee_proportional_millionths)
+        if not is_edge_sane_to_use(
+                fee_msat=fee_msat, cltv_expiry_delta=cltv_expiry_delta, amount_msat=payment_amt_msat):
             return float('inf'), 0  # thanks but no thanks
         # Distance metric notes:  # TODO constants are ad-hoc
         # ( somewhat based on https://github.com/lightningnetwork/lnd/pull/1358 )
@@ -526,8 +544,7 @@ class LNPathFinder(Logger):
         # - Paying lower fees is better. :)
         if ignore_costs:
             return DEFAULT_PENALTY_BASE_MSAT, 0
-        fee_msat = route_edge.fee_for_edge(payment_amt_msat)
-        cltv_cost = route_edge.cltv_expiry_delta * payment_amt_msat * 15 / 1_000_000_000
+        cltv_cost = cltv_expiry_delta * payment_amt_msat * 15 / 1_000_000_000
         # the liquidty penalty takes care we favor edges that should be able to forward
         # the payment and penalize edges that cannot
         liquidity_penalty = self.liquidity_hints.penalty(start_node, end_node, short_channel_id, payment_amt_msat)
@@ -549,45 +566,38 @@ class LNPathFinder(Logger):
         # run Dijkstra
         # The search is run in the REVERSE direction, from nodeB to nodeA,
         # to properly calculate compound routing fees.
-        distance_from_start = defaultdict(lambda: float('inf'))
-        distance_from_start[nodeB] = 0
+        distance_from_start = {nodeB: 0}  # type: Dict[bytes, float]
         previous_hops = {}  # type: Dict[bytes, PathEdge]
-        nodes_to_explore = queue.PriorityQueue()
-        nodes_to_explore.put((0, invoice_amount_msat, nodeB))  # order of fields (in tuple) matters!
+        nodes_to_explore = [(0, invoice_amount_msat, nodeB)]  # order of fields (in tuple) matters!
+        if my_sending_channels is None:
+            my_sending_channels = {}
         now = int(time.time())
 
         # main loop of search
-        while nodes_to_explore.qsize() > 0:
-            dist_to_edge_endnode, amount_msat, edge_endnode = nodes_to_explore.get()
+        while nodes_to_explore:
+            dist_to_edge_endnode, amount_msat, edge_endnode = heapq.heappop(nodes_to_explore)
             if edge_endnode == nodeA and previous_hops:  # previous_hops check for circular paths
                 self.logger.info("found a path")
                 break
-            if dist_to_edge_endnode != distance_from_start[edge_endnode]:
-                # queue.PriorityQueue does not implement decrease_priority,
+            if dist_to_edge_endnode != distance_from_start.get(edge_endnode, inf):
+                # heapq does not implement decrease_priority,
                 # so instead of decreasing priorities, we add items again into the queue.
                 # so there are duplicates in the queue, that we discard now:
                 continue
 
             if nodeA == nodeB:  # we want circular paths
                 if not previous_hops:  # in the first node exploration step, we only take receiving channels
-                    channels_for_endnode = self.channel_db.get_channels_for_node(
+                    neighbours = self.channel_db.get_neighbours_for_node(
                         edge_endnode, my_channels={}, private_route_edges=private_route_edges)
                 else:  # in the next steps, we only take sending channels
-                    channels_for_endnode = self.channel_db.get_channels_for_node(
+                    neighbours = self.channel_db.get_neighbours_for_node(
                         edge_endnode, my_channels=my_sending_channels, private_route_edges={})
             else:
-                channels_for_endnode = self.channel_db.get_channels_for_node(
+                neighbours = self.channel_db.get_neighbours_for_node(
                     edge_endnode, my_channels=my_sending_channels, private_route_edges=private_route_edges)
 
-            for edge_channel_id in channels_for_endnode:
+            for edge_channel_id, edge_startnode, channel_info in neighbours:
                 assert isinstance(edge_channel_id, bytes)
-                if self._is_edge_blacklisted(edge_channel_id, now=now):
-                    continue
-                channel_info = self.channel_db.get_channel_info(
-                    edge_channel_id, my_channels=my_sending_channels, private_route_edges=private_route_edges)
-                if channel_info is None:
-                    continue
-                edge_startnode = channel_info.node2_id if channel_info.node1_id == edge_endnode else channel_info.node1_id
                 is_mine = edge_channel_id in my_sending_channels
                 if is_mine:
                     if edge_startnode == nodeA:  # payment outgoing, on our channel
@@ -595,6 +605,7 @@ class LNPathFinder(Logger):
                             continue
                 edge_cost, fee_for_edge_msat = self._edge_cost(
                     short_channel_id=edge_channel_id,
+                    channel_info=channel_info,
                     start_node=edge_startnode,
                     end_node=edge_endnode,
                     payment_amt_msat=amount_msat,
@@ -604,19 +615,19 @@ class LNPathFinder(Logger):
                     private_route_edges=private_route_edges,
                     now=now,
                 )
-                alt_dist_to_neighbour = distance_from_start[edge_endnode] + edge_cost
-                if alt_dist_to_neighbour < distance_from_start[edge_startnode]:
+                alt_dist_to_neighbour = dist_to_edge_endnode + edge_cost
+                if alt_dist_to_neighbour < distance_from_start.get(edge_startnode, inf):
                     distance_from_start[edge_startnode] = alt_dist_to_neighbour
                     previous_hops[edge_startnode] = PathEdge(
                         start_node=edge_startnode,
                         end_node=edge_endnode,
                         short_channel_id=ShortChannelID(edge_channel_id))
                     amount_to_forward_msat = amount_msat + fee_for_edge_msat
-                    nodes_to_explore.put((alt_dist_to_neighbour, amount_to_forward_msat, edge_startnode))
+                    heapq.heappush(nodes_to_explore, (alt_dist_to_neighbour, amount_to_forward_msat, edge_startnode))
             # for circular paths, we already explored the end node, but this
             # is also our start node, so set it to unexplored
             if edge_endnode == nodeB and nodeA == nodeB:
-                distance_from_start[edge_endnode] = float('inf')
+                distance_from_start[edge_endnode] = inf
         return previous_hops
 
     @profiler
@@ -6,7 +6,7 @@ from typing import NamedTuple, Iterable, TYPE_CHECKING
 import os
 import asyncio
 from enum import IntEnum, auto
-from typing import NamedTuple, Dict
+from typing import NamedTuple, Dict, Optional
 
 from . import util
 from .sql_db import SqlDB, sql
@@ -148,6 +148,11 @@ class LNWatcher(Logger, EventListener):
         self.config = network.config
         self.callbacks = {} # address -> lambda: coroutine
         self.network = network
+        # results of inspect_tx_candidate per channel. They only change when a tx spending
+        # one of their outpoints is added or removed, see on_event_adb_added_tx
+        self._spenders_cache = {}  # type: Dict[str, Dict[str, Optional[str]]]  # funding_outpoint -> spenders
+        self._channel_by_outpoint = {}  # type: Dict[str, str]  # outpoint in spenders -> funding_outpoint
+        self._num_addresses_added = 0  # by inspect_tx_candidate
         self.register_callbacks()
         # status gets populated when we run
         self.channel_status = {}
@@ -167,10 +172,32 @@ class LNWatcher(Logger, EventListener):
     async def unwatch_channel(self, address, funding_outpoint):
         self.logger.info(f'unwatching {funding_outpoint}')
         self.remove_callback(address)
+        self._forget_spenders(funding_outpoint)
 
     def remove_callback(self, address):
         self.callbacks.pop(address, None)
 
+    def _cache_spenders(self, funding_outpoint: str, spenders: Dict[str, Optional[str]]) -> None:
+        self._forget_spenders(funding_outpoint)
+        self._spenders_cache[funding_outpoint] = spenders
+        for outpoint in spenders:
+            self._channel_by_outpoint[outpoint] = funding_outpoint
+
+    def _forget_spenders(self, funding_outpoint: str) -> None:
+        spenders = self._spenders_cache.pop(funding_outpoint, {})
+        for outpoint in spenders:
+            self._channel_by_outpoint.pop(outpoint, None)
+
+    def _forget_spenders_touched_by_tx(self, tx: Optional[Transaction]) -> None:
+        if tx is None:
+            self._spenders_cache.clear()
+            self._channel_by_outpoint.clear()
+            return
+        for txin in tx.inputs():
+            funding_outpoint = self._channel_by_outpoint.get(txin.prevout.to_str())
+            if funding_outpoint is not None:
+                self._forget_spenders(funding_outpoint)
+
     def add_callback(self, address, callback):
         self.adb.add_address(address)
         self.callbacks[address] = callback
@@ -193,6 +220,18 @@ class LNWatcher(Logger, EventListener):
             return
         await self.trigger_callbacks()
 
+    @event_listener
+    def on_event_adb_added_tx(self, adb, tx_hash, tx):
+        if adb != self.adb:
+            return
+        self._forget_spenders_touched_by_tx(tx)
+
+    @event_listener
+    def on_event_adb_removed_tx(self, adb, tx_hash, tx):
+        if adb != self.adb:
+            return
+        self._forget_spenders_touched_by_tx(tx)
+
     @event_listener
     async def on_event_adb_set_up_to_date(self, adb):
         if adb != self.adb:
@@ -211,10 +250,20 @@ class LNWatcher(Logger, EventListener):
         # early return if address has not been added yet
         if not self.adb.is_mine(address):
             return
-        spenders = self.inspect_tx_candidate(funding_outpoint, 0)
-        # inspect_tx_candidate might have added new addresses, in which case we return early
-        if not self.adb.is_up_to_date():
-            return
+        spenders = self._spenders_cache.get(funding_outpoint)
+        if spenders is None:
+            num_addresses_added = self._num_addresses_added
+            spenders = self.inspect_tx_candidate(funding_outpoint, 0)
+            # inspect_tx_candidate might have added new addresses, in which case we return early
+            if not self.adb.is_up_to_date():
+                return
+            # the walk stops at addresses it just added, the next one will go further
+            if self._num_addresses_added == num_addresses_added:
+                self._cache_spenders(funding_outpoint, spenders)
+        else:
+            self._update_channel_status(funding_outpoint, spenders[funding_outpoint])
+            if not self.adb.is_up_to_date():
+                return
         funding_txid = funding_outpoint.split(':')[0]
         funding_height = self.adb.get_tx_height(funding_txid)
         closing_txid = spenders.get(funding_outpoint)
@@ -258,12 +307,7 @@ class LNWatcher(Logger, EventListener):
         spender_txid = self.adb.db.get_spent_outpoint(prev_txid, int(index))
         result = {outpoint:spender_txid}
         if n == 0:
-            if spender_txid is None:
-                self.channel_status[outpoint] = 'open'
-            elif not self.is_deeply_mined(spender_txid):
-                self.channel_status[outpoint] = 'closed (%d)' % self.adb.get_tx_height(spender_txid).conf
-            else:
-                self.channel_status[outpoint] = 'closed (deep)'
+            self._update_channel_status(outpoint, spender_txid)
         if spender_txid is None:
             return result
         spender_tx = self.adb.get_transaction(spender_txid)
@@ -292,11 +336,20 @@ class LNWatcher(Logger, EventListener):
                 continue
             if not self.adb.is_mine(o.address):
                 self.adb.add_address(o.address)
+                self._num_addresses_added += 1
             elif n < 2:
                 r = self.inspect_tx_candidate(spender_txid+':%d'%i, n+1)
                 result.update(r)
         return result
 
+    def _update_channel_status(self, funding_outpoint: str, closing_txid: Optional[str]) -> None:
+        if closing_txid is None:
+            self.channel_status[funding_outpoint] = 'open'
+        elif not self.is_deeply_mined(closing_txid):
+            self.channel_status[funding_outpoint] = 'closed (%d)' % self.adb.get_tx_height(closing_txid).conf
+        else:
+            self.channel_status[funding_outpoint] = 'closed (deep)'
+
     def get_tx_mined_depth(self, txid: str):
         if not txid:
             return TxMinedDepth.FREE
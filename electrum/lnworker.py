@@ -79,7 +79,7 @@ from .lnwatcher import LNWalletWatcher
 from .crypto import pw_encode_with_version_and_mac, pw_decode_with_version_and_mac
 from .lnutil import ImportedChannelBackupStorage, OnchainChannelBackupStorage
 from .lnchannel import ChannelBackup
-from .channel_db import UpdateStatus, ChannelDBNotLoaded
+from .channel_db import UpdateStatus, ChannelDBNotLoaded, verify_gossip_msgs
 from .channel_db import get_mychannel_info, get_mychannel_policy
 from .submarine_swaps import SwapManager
 from .channel_db import ChannelInfo, Policy
@@ -583,6 +583,7 @@ class LNGossip(LNWorker):
             if len(self.unknown_ids) == 0:
                 self.channel_db.prune_old_policies(self.max_age)
                 self.channel_db.prune_orphaned_channels()
+            self.channel_db.save_graph_snapshot()
             await asyncio.sleep(120)
 
     async def add_new_ids(self, ids: Iterable[bytes]):
@@ -631,14 +632,15 @@ class LNGossip(LNWorker):
         self.logger.debug(f'process_gossip {len(chan_anns)} {len(node_anns)} {len(chan_upds)}')
         # channel announcements
         def process_chan_anns():
-            for payload in chan_anns:
-                self.channel_db.verify_channel_announcement(payload)
-            self.channel_db.add_channel_announcements(chan_anns)
+            # no need to verify signatures of channels we already have
+            new_chan_anns = [payload for payload in chan_anns
+                             if self.channel_db.get_channel_info(ShortChannelID(payload['short_channel_id'])) is None]
+            verify_gossip_msgs(self.channel_db.verify_channel_announcement, new_chan_anns)
+            self.channel_db.add_channel_announcements(new_chan_anns)
         await run_in_thread(process_chan_anns)
         # node announcements
         def process_node_anns():
-            for payload in node_anns:
-                self.channel_db.verify_node_announcement(payload)
+            verify_gossip_msgs(self.channel_db.verify_node_announcement, node_anns)
             self.channel_db.add_node_announcements(node_anns)
         await run_in_thread(process_node_anns)
         # channel updates
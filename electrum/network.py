@@ -362,11 +362,11 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         return self.channel_db is not None
 
     def start_gossip(self):
+        if not self.config.LIGHTNING_ENABLED or not self.config.LIGHTNING_USE_GOSSIP:
+            return
         from . import lnrouter
         from . import channel_db
         from . import lnworker
-        if not self.config.LIGHTNING_USE_GOSSIP:
-            return
         if self.lngossip is None:
             self.channel_db = channel_db.ChannelDB(self)
             self.path_finder = lnrouter.LNPathFinder(self.channel_db)
@@ -1152,6 +1152,13 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             raise RequestTimedOut()
         return await self.interface.get_history_for_scripthash(sh)
 
+    @best_effort_reliable
+    @catch_server_exceptions
+    async def get_history_for_scripthashes(self, shs: Sequence[str]) -> List[List[dict]]:
+        if self.interface is None:  # handled by best_effort_reliable
+            raise RequestTimedOut()
+        return await self.interface.get_history_for_scripthashes(shs)
+
     @best_effort_reliable
     @catch_server_exceptions
     async def listunspent_for_scripthash(self, sh: str, *, asset=False) -> List[dict]:
@@ -1388,6 +1395,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.interfaces = {}
         self._connecting_ifaces.clear()
         self._closing_ifaces.clear()
+        blockchain.sync_headers_to_disk()
         if not full_shutdown:
             util.trigger_callback('network_updated')
 
@@ -17,7 +17,12 @@ class NothingToPlotException(Exception):
         return _("Nothing to plot.")
 
 
-def plot_history(history):
+# number of points of the balance plot, however long the history is
+BALANCE_PLOT_POINTS = 500
+
+
+def plot_history(history, balance_series=None):
+    """balance_series: optional wallet.BalanceSeries, plotted below the volumes"""
     if len(history) == 0:
         raise NothingToPlotException()
     hist_in = defaultdict(int)
@@ -36,7 +41,8 @@ def plot_history(history):
         else:
             hist_out[datenum] -= value
 
-    f, axarr = plt.subplots(2, sharex=True)
+    show_balance = balance_series is not None and len(balance_series) > 0
+    f, axarr = plt.subplots(3 if show_balance else 2, sharex=True)
     plt.subplots_adjust(bottom=0.2)
     plt.xticks(rotation=25)
     ax = plt.gca()
@@ -63,4 +69,10 @@ def plot_history(history):
         axarr[1].legend(loc='upper left')
     if r1 is None and r2 is None:
         raise NothingToPlotException()
+    if show_balance:
+        points = balance_series.downsample(BALANCE_PLOT_POINTS)
+        dates = [md.date2num(datetime.datetime.fromtimestamp(t)) for t, _ in points]
+        values = [b / COIN for _, b in points]
+        axarr[2].step(dates, values, where='post', label='balance')
+        axarr[2].legend(loc='upper left')
     return plt
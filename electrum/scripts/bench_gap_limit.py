@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+#
+# Benchmark for gap limit handling while restoring a wallet with a large gap limit.
+#
+# usage:
+#   bench_gap_limit.py [--gap-limit 5000] [--used N] [--spacing S]
+#
+# Restores an in-memory standard wallet with the given gap limit, then feeds it
+# server history (confirmed, no SPV) for N receiving addresses, S addresses apart,
+# calling wallet.synchronize() after each one, as the synchronizer would.
+# It then times:
+#  - restore: history updates and the address generation they trigger
+#  - sync (idle): one wallet.synchronize() with nothing to do, as done on every poll
+#  - beyond gap: get_all_known_addresses_beyond_gap_limit()
+#  - min gap: min_acceptable_gap()
+
+import argparse
+import tempfile
+import time
+
+from electrum import keystore, storage, util
+from electrum.simple_config import SimpleConfig
+from electrum.wallet import Standard_Wallet
+
+
+SEED = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+TIP_HEIGHT = 1_000_000
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - t0
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = SimpleConfig({'electrum_path': tmp_dir})
+        config.NETWORK_SKIPMERKLECHECK = True
+        db = storage.WalletDB('', storage=None, manual_upgrades=False)
+        db.put('keystore', keystore.from_seed(SEED, '', False).dump())
+        db.put('gap_limit', args.gap_limit)
+        db.put('stored_height', TIP_HEIGHT)
+        wallet, t_create = timed(lambda: Standard_Wallet(db, config=config))
+        print(f"created wallet with {len(wallet.get_addresses())} addresses in {t_create:.2f}s")
+
+        def restore():
+            for i in range(args.used):
+                addr = wallet.get_receiving_addresses()[i * args.spacing]
+                db.set_addr_history(addr, [(i.to_bytes(32, 'big').hex(), TIP_HEIGHT - 10)])
+                wallet.synchronize()
+        _, t_restore = timed(restore)
+        # derivation cost is the same either way, report it apart
+        num_addrs = len(wallet.get_receiving_addresses())
+        _, t_sync = timed(wallet.synchronize)
+        beyond, t_beyond = timed(wallet.get_all_known_addresses_beyond_gap_limit)
+        min_gap, t_min_gap = timed(wallet.min_acceptable_gap)
+        print(f"restore: {args.used} used addresses, {num_addrs} receiving addresses in {t_restore:.2f}s")
+        print(f"sync (idle): {t_sync * 1000:.2f}ms")
+        print(f"beyond gap: {len(beyond)} addresses in {t_beyond * 1000:.2f}ms")
+        print(f"min gap: {min_gap} in {t_min_gap * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gap-limit', type=int, default=5000)
+    parser.add_argument('--used', type=int, default=200, help='number of used receiving addresses')
+    parser.add_argument('--spacing', type=int, default=50, help='distance between used addresses')
+    args = parser.parse_args()
+    loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+    try:
+        main(args)
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# Benchmark for writing the headers file, as done during the initial sync.
+#
+# usage:
+#   bench_headers_write.py [--blocks N] [--fsync-interval K ...]
+#
+# N random mainnet-sized (legacy, 80 byte) headers are saved in chunks of
+# 2016 with Blockchain.save_chunk into a temporary headers file, once per
+# fsync interval K (see config 'headers_fsync_interval'). Headers are not
+# verified, so this only measures padding and disk writes. The time to pad
+# one chunk is also compared with the previous implementation, which built
+# the result with repeated bytes concatenation.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+
+from electrum import constants, blockchain
+from electrum.blockchain import Blockchain, LEGACY_HEADER_SIZE, HEADER_SIZE, pad_headers_to_kawpow_len
+from electrum.simple_config import SimpleConfig
+
+
+def pad_by_concatenation(start_height: int, chunk: bytes) -> bytes:
+    r = b''
+    p = 0
+    s = start_height
+    while p < len(chunk):
+        if s < constants.net.KawpowActivationHeight:
+            r += chunk[p:p + LEGACY_HEADER_SIZE] + bytes(40)
+            p += LEGACY_HEADER_SIZE
+        else:
+            r += chunk[p:p + HEADER_SIZE]
+            p += HEADER_SIZE
+        s += 1
+    return r
+
+
+def bench_padding(chunk: bytes, runs: int = 20) -> None:
+    for name, func in (('concatenation', pad_by_concatenation), ('bytearray', pad_headers_to_kawpow_len)):
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            func(0, chunk)
+        print(f"  pad one chunk, {name:<14} {(time.perf_counter() - t0) / runs * 1000:8.3f} ms")
+
+
+def bench_write(chunks, fsync_interval: int) -> float:
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': tmp_dir, 'headers_fsync_interval': fsync_interval})
+        blockchain.blockchains = {}
+        chain = Blockchain(config=config, forkpoint=0, parent=None,
+                           forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        blockchain.blockchains[constants.net.GENESIS] = chain
+        os.makedirs(os.path.dirname(chain.path()), exist_ok=True)
+        open(chain.path(), 'wb').close()
+        t0 = time.perf_counter()
+        for start_height, chunk in chunks:
+            chain.save_chunk(start_height, chunk, fsync=False)
+        blockchain.sync_headers_to_disk()
+        return time.perf_counter() - t0
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main(args):
+    num_chunks = (args.blocks + 2015) // 2016
+    chunks = []
+    for i in range(num_chunks):
+        size = min(2016, args.blocks - i * 2016)
+        chunks.append((i * 2016, os.urandom(size * LEGACY_HEADER_SIZE)))
+    print(f"{args.blocks} headers, {num_chunks} chunks:")
+    bench_padding(chunks[0][1])
+    for fsync_interval in args.fsync_interval:
+        dt = bench_write(chunks, fsync_interval)
+        print(f"  write chain, fsync every {fsync_interval:4d} chunks {dt:8.2f} s "
+              f"({args.blocks / dt:9.0f} headers/s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=500_000)
+    parser.add_argument('--fsync-interval', type=int, nargs='+', default=[1, 10, 100])
+    main(parser.parse_args())
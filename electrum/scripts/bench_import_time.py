@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Benchmark for the import time of electrum modules, as seen by a fresh
+# interpreter (e.g. each invocation of the command line client).
+#
+# usage:
+#   bench_import_time.py [--runs R] [--budget MODULE=MS ...] [MODULE ...]
+#
+# Every module is imported R times in a new `python -X importtime` process,
+# the best cumulative time is reported, together with the number of electrum
+# submodules it pulled in. With --budget, exits with status 1 if a module
+# takes longer than its budget, so that it can be used as a CI check.
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Tuple
+
+
+DEFAULT_MODULES = [
+    'electrum',
+    'electrum.util',
+    'electrum.simple_config',
+    'electrum.transaction',
+    'electrum.commands',
+    'electrum.daemon',
+]
+
+
+def measure(module: str) -> Tuple[float, int]:
+    """Returns the cumulative import time of module in ms,
+    and the number of electrum submodules it loaded."""
+    code = f"import sys, {module}; print(len([m for m in sys.modules if m.startswith('electrum.')]))"
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    p = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, check=True, cwd=root)
+    # lines look like "import time: self [us] | cumulative | imported package"
+    cumulative_us = 0
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _self_us, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, int(p.stdout)
+
+
+def main(args):
+    budgets = {}
+    for b in args.budget:
+        module, ms = b.split('=')
+        budgets[module] = float(ms)
+    modules = list(args.modules or DEFAULT_MODULES)
+    for module in budgets:
+        if module not in modules:
+            modules.append(module)
+    print(f"{'module':<28} {'best ms':>9} {'submodules':>11} {'budget':>8}")
+    over_budget = []
+    for module in modules:
+        results = [measure(module) for _ in range(args.runs)]
+        best_ms = min(ms for ms, _ in results)
+        num_submodules = results[0][1]
+        budget = budgets.get(module)
+        print(f"{module:<28} {best_ms:9.1f} {num_submodules:11d} {budget if budget is not None else '-':>8}")
+        if budget is not None and best_ms > budget:
+            over_budget.append(module)
+    if over_budget:
+        print(f"over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', help="modules to import (default: a selection)")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=MS',
+                        help="maximum import time of MODULE, in milliseconds")
+    main(parser.parse_args())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# Benchmark for keystore derivations on address-heavy PSBT operations.
+#
+# usage:
+#   bench_keystore.py [--inputs N] [--runs R] [--multisig]
+#
+# Creates an in-memory wallet with N addresses (standard p2pkh, or 2of3
+# p2sh multisig with --multisig), builds an N-input PSBT spending one coin
+# from each address, and times over R runs:
+#  - add_info: tx.add_info_from_wallet(), i.e. wallet.add_input_info per input
+#  - descriptors: expanding the script descriptor of each input
+#  - sign: wallet.sign_transaction() of the PSBT (one keystore)
+# The first run starts from cold keystore caches; later runs are warm.
+
+import argparse
+import tempfile
+import time
+
+from electrum import keystore, storage, util
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum.crypto import sha256
+from electrum.wallet import Standard_Wallet, Multisig_Wallet
+
+
+SEEDS = [
+    'cycle rocket west magnet parrot shuffle foot correct salt library feed song',
+    'bitter grass shiver impose acquire brush forget axis eager alone wine silver',
+    'crouch dumb relax small truck age shine pink invite spatial object tenant',
+]
+
+
+def create_wallet(config: SimpleConfig, *, num_addresses: int, multisig: bool):
+    db = storage.WalletDB('', storage=None, manual_upgrades=False)
+    db.put('gap_limit', num_addresses)
+    if multisig:
+        for i, seed in enumerate(SEEDS):
+            ks = keystore.from_bip43_rootseed(keystore.bip39_to_seed(seed, ''), derivation="m/45'/0", xtype='standard')
+            db.put('x%d/' % (i + 1), ks.dump())
+        db.put('wallet_type', '2of3')
+        w = Multisig_Wallet(db, config=config)
+    else:
+        ks = keystore.from_seed(SEEDS[0], '', False)
+        db.put('keystore', ks.dump())
+        w = Standard_Wallet(db, config=config)
+    w.synchronize()
+    return w
+
+
+def make_psbt(wallet, num_inputs: int) -> PartialTransaction:
+    inputs = []
+    for i, addr in enumerate(wallet.get_receiving_addresses()[:num_inputs]):
+        txin = PartialTxInput(prevout=TxOutpoint(txid=sha256(i.to_bytes(4, 'big')), out_idx=0))
+        txin._trusted_address = addr
+        txin._trusted_value_sats = 100_000
+        inputs.append(txin)
+    outputs = [PartialTxOutput.from_address_and_value(wallet.get_change_addresses()[0], 1000)]
+    return PartialTransaction.from_io(inputs, outputs, BIP69_sort=False)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = SimpleConfig({'electrum_path': tmp_dir})
+        t0 = time.perf_counter()
+        wallet = create_wallet(config, num_addresses=args.inputs, multisig=args.multisig)
+        print(f"wallet with {len(wallet.get_addresses())} addresses created in {time.perf_counter() - t0:.2f}s")
+        # let the wallet's own background synchronization settle, it holds the adb lock
+        time.sleep(args.settle)
+        print(f"{'run':>4} {'add_info':>10} {'descriptors':>12} {'sign':>10}")
+        for run in range(args.runs):
+            tx = make_psbt(wallet, args.inputs)
+            t0 = time.perf_counter()
+            tx.add_info_from_wallet(wallet)
+            t_add_info = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            for txin in tx.inputs():
+                txin.script_descriptor.expand()
+            t_desc = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            wallet.get_keystores()[0].sign_transaction(tx, None, wallet)
+            t_sign = time.perf_counter() - t0
+            print(f"{run:>4} {t_add_info:9.3f}s {t_desc:11.3f}s {t_sign:9.3f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--multisig', action='store_true', help='use a 2of3 p2sh wallet')
+    parser.add_argument('--settle', type=float, default=5, help='seconds to wait after wallet creation')
+    args = parser.parse_args()
+    loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+    try:
+        main(args)
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+#
+# Benchmark for LNPathFinder over a gossip graph.
+#
+# usage:
+#   bench_pathfinding.py [--gossip-db PATH] [--nodes N] [--channels M] [--runs R]
+#
+# With --gossip-db, the graph is loaded from a recorded gossip_db file
+# (e.g. ~/.electrum-yai/testnet/gossip_db). The file is copied to a temp dir
+# first, so it is not modified. Otherwise a random graph is generated.
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from electrum import constants, util
+from electrum.channel_db import ChannelDB
+from electrum.lnrouter import LNPathFinder
+from electrum.lnutil import ShortChannelID
+from electrum.simple_config import SimpleConfig
+from electrum.util import get_headers_dir
+
+
+def node_id(i: int) -> bytes:
+    return b'\x02' + i.to_bytes(32, 'big')
+
+
+def fill_random_graph(cdb: ChannelDB, *, num_nodes: int, num_channels: int) -> None:
+    rng = random.Random(0)
+    chain_hash = constants.net.rev_genesis_bytes()
+    for scid in range(1, num_channels + 1):
+        # preferential attachment-ish: low node indices become hubs
+        n1 = int(num_nodes * rng.random() ** 2)
+        n2 = rng.randrange(num_nodes)
+        if n1 == n2:
+            continue
+        node1, node2 = sorted([node_id(n1), node_id(n2)])
+        short_channel_id = ShortChannelID(scid.to_bytes(8, 'big'))
+        cdb.add_verified_channel_info({
+            'node_id_1': node1, 'node_id_2': node2,
+            'short_channel_id': short_channel_id,
+            'chain_hash': chain_hash,
+            'features': b'',
+        }, capacity_sat=rng.randrange(100_000, 10_000_000))
+        for direction in (b'\x00', b'\x01'):
+            cdb.add_channel_update({
+                'short_channel_id': short_channel_id,
+                'message_flags': b'\x00',
+                'channel_flags': direction,
+                'cltv_expiry_delta': rng.choice([40, 80, 144]),
+                'htlc_minimum_msat': 1000,
+                'fee_base_msat': rng.randrange(0, 2000),
+                'fee_proportional_millionths': rng.randrange(0, 1000),
+                'chain_hash': chain_hash,
+                'timestamp': int(time.time()),
+            }, verify=False, verbose=False)
+
+
+async def main(args):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': tmp_dir})
+
+        class fake_network:
+            asyncio_loop = util.get_asyncio_loop()
+            interface = None
+        fake_network.config = config
+        if args.gossip_db:
+            shutil.copy(args.gossip_db, os.path.join(get_headers_dir(config), 'gossip_db'))
+        cdb = ChannelDB(fake_network())
+        if args.gossip_db:
+            await cdb.load_data()
+        else:
+            cdb.data_loaded.set()
+            fill_random_graph(cdb, num_nodes=args.nodes, num_channels=args.channels)
+        nodes = list(cdb._channels_for_node.keys())
+        print(f"graph: {len(nodes)} nodes, {len(cdb._channels)} channels, {len(cdb._policies)} policies")
+
+        path_finder = LNPathFinder(cdb)
+        rng = random.Random(1)
+        found = 0
+        durations = []
+        for _ in range(args.runs):
+            nodeA, nodeB = rng.sample(nodes, 2)
+            t0 = time.perf_counter()
+            path = path_finder.find_path_for_payment(
+                nodeA=nodeA, nodeB=nodeB, invoice_amount_msat=args.amount_msat)
+            durations.append(time.perf_counter() - t0)
+            found += bool(path)
+        durations.sort()
+        print(f"{args.runs} runs, {found} paths found")
+        print(f"median: {1000 * durations[len(durations) // 2]:.1f} ms, "
+              f"max: {1000 * durations[-1]:.1f} ms, "
+              f"total: {sum(durations):.2f} s")
+        cdb.stop()
+        await cdb.stopped_event.wait()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gossip-db', help='path to a recorded gossip_db file')
+    parser.add_argument('--nodes', type=int, default=10_000)
+    parser.add_argument('--channels', type=int, default=40_000)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--amount-msat', type=int, default=100_000_000)
+    parser.add_argument('--testnet', action='store_true')
+    args = parser.parse_args()
+    if args.testnet:
+        constants.set_testnet()
+    loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(main(args), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
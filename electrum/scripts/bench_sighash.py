@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#
+# Benchmark for pre-segwit sighash computation when signing wide transactions.
+#
+# usage:
+#   bench_sighash.py [--inputs 10 100 1000 5000] [--outputs N] [--sign]
+#                    [--no-baseline]
+#
+# For each input count, a tx spending that many p2pkh inputs of a single key
+# is built. It then times:
+#  - baseline: hashing every input's preimage with the per-input
+#    hex re-serialization the signer used to do (skipped above 2000 inputs,
+#    or with --no-baseline)
+#  - template: hashing every input's preimage from a shared LegacySighashTemplate
+#  - sign (with --sign): PartialTransaction.sign() end to end, incl. ECDSA
+# The template and baseline digests are compared, so a run doubles as a check.
+
+import argparse
+import time
+
+from electrum import descriptor
+from electrum.bitcoin import var_int
+from electrum.crypto import sha256, sha256d, sha256d_chunks
+from electrum.ecc import ECPrivkey
+from electrum.transaction import (PartialTransaction, PartialTxInput, PartialTxOutput,
+                                  TxOutpoint, Sighash, int_to_hex)
+from electrum.util import bfh
+
+
+BASELINE_MAX_INPUTS = 2000
+
+
+def make_tx(num_inputs: int, num_outputs: int, pubkey: str) -> PartialTransaction:
+    desc = descriptor.get_singlesig_descriptor_from_legacy_leaf(pubkey=pubkey, script_type='p2pkh')
+    scriptpubkey = desc.expand().output_script
+    inputs = []
+    for i in range(num_inputs):
+        txin = PartialTxInput(prevout=TxOutpoint(txid=sha256(i.to_bytes(4, 'big')), out_idx=i % 3))
+        txin.script_descriptor = desc
+        txin._trusted_value_sats = 10_000
+        txin.nsequence = 0xfffffffd
+        inputs.append(txin)
+    outputs = [PartialTxOutput(scriptpubkey=scriptpubkey, value=1000) for _ in range(num_outputs)]
+    return PartialTransaction.from_io(inputs, outputs, locktime=0, version=2, BIP69_sort=False)
+
+
+def baseline_preimage(tx: PartialTransaction, txin_index: int) -> str:
+    # the SIGHASH_ALL path of the per-input serializer this replaces
+    inputs = tx.inputs()
+    preimage_script = bfh(tx.get_preimage_script(inputs[txin_index], None))
+    txins = var_int(len(inputs)) + ''.join(
+        txin.serialize_to_network(script_sig=preimage_script if txin_index == k else b"").hex()
+        for k, txin in enumerate(inputs))
+    txouts = var_int(len(tx.outputs())) + ''.join(o.serialize_to_network().hex() for o in tx.outputs())
+    return (int_to_hex(tx.version, 4) + txins + txouts
+            + int_to_hex(tx.locktime, 4) + int_to_hex(Sighash.ALL, 4))
+
+
+def main(args):
+    privkey = ECPrivkey(sha256(b'bench_sighash'))
+    pubkey = privkey.get_public_key_hex(compressed=True)
+    print(f"{'inputs':>8} {'baseline':>12} {'template':>12} {'sign':>12}")
+    for num_inputs in args.inputs:
+        tx = make_tx(num_inputs, args.outputs, pubkey)
+        n = len(tx.inputs())
+
+        baseline = None
+        if not args.no_baseline and n <= BASELINE_MAX_INPUTS:
+            t0 = time.perf_counter()
+            baseline_hashes = [sha256d(bfh(baseline_preimage(tx, i))) for i in range(n)]
+            baseline = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        template = tx._calc_legacy_sighash_template()
+        template_hashes = [sha256d_chunks(tx._serialize_preimage_chunks(i, None, legacy_sighash_template=template))
+                           for i in range(n)]
+        templated = time.perf_counter() - t0
+        if baseline is not None:
+            assert baseline_hashes == template_hashes, 'digest mismatch'
+
+        signing = None
+        if args.sign:
+            t0 = time.perf_counter()
+            tx.sign({pubkey: (privkey.get_secret_bytes(), True)}, None)
+            signing = time.perf_counter() - t0
+            assert tx.is_complete()
+
+        fmt = lambda x: f"{x:11.3f}s" if x is not None else f"{'-':>12}"
+        print(f"{n:>8} {fmt(baseline)} {fmt(templated)} {fmt(signing)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--outputs', type=int, default=2)
+    parser.add_argument('--sign', action='store_true', help='also time a full tx.sign()')
+    parser.add_argument('--no-baseline', action='store_true')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+#
+# Offline benchmark for wallet synchronisation.
+#
+# An in-process ElectrumX stand-in (aiorpcx server on localhost) serves a
+# synthetic regtest-style chain: kawpow headers whose merkle roots commit to
+# the served transactions, address histories, raw txs and merkle proofs.
+# The asset/tag/broadcast methods are answered as "nothing there".
+# Network, Blockchain, Synchronizer and SPV are then driven end to end for an
+# imported wallet of each requested size.
+#
+# usage:
+#   bench_sync.py [--addresses 1000 10000 100000] [--blocks N] [--used-ratio R]
+#                 [--txs-per-address K] [--fixture PATH] [--save-fixture PATH]
+#                 [--latency MS] [--chunks-in-flight K] [--profile]
+#
+# For each phase (headers, wallet creation, history + SPV), reports wall time,
+# process CPU time, time spent in the stand-in server, RPC counts per method
+# and the peak RSS so far; the headers phase also reports headers/s.
+# --latency delays every response of the stand-in, to mimic e.g. Tor round
+# trips, and --chunks-in-flight sets how many header chunks the client
+# requests concurrently. With --profile, a cProfile of the event loop thread
+# is printed per phase.
+#
+# --save-fixture writes the generated chain and histories to a JSON file, and
+# --fixture replays such a file instead of generating a new one, so that runs
+# can be compared against the exact same data.
+
+import argparse
+import asyncio
+import cProfile
+import hashlib
+import io
+import json
+import pstats
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from aiorpcx import RPCSession, RPCError, serve_rs
+from aiorpcx.jsonrpc import JSONRPC
+
+from electrum import bitcoin, blockchain, constants, util, version
+from electrum.crypto import sha256d
+from electrum.network import Network
+from electrum.simple_config import SimpleConfig
+from electrum.synchronizer import history_status
+from electrum.bitcoin import hash_encode
+from electrum.util import bfh
+from electrum.wallet import restore_wallet_from_text
+
+
+class BenchNet(constants.YottafluxRegtest):
+    NET_NAME = "regtest"
+    GENESIS = None  # set once the synthetic chain is generated
+    DGW_CHECKPOINTS = []
+    KawpowActivationTS = 0
+    KawpowActivationHeight = 0
+
+
+GENESIS_TIMESTAMP = 1_700_000_000
+
+
+def make_tx(prev_txid: bytes, script: bytes, value: int) -> bytes:
+    # version 2, one input with empty scriptSig, one output, locktime 0
+    return (b'\x02\x00\x00\x00' + b'\x01' + prev_txid + b'\x00\x00\x00\x00' + b'\x00' + b'\xff\xff\xff\xff'
+            + b'\x01' + value.to_bytes(8, 'little') + bytes([len(script)]) + script
+            + b'\x00\x00\x00\x00')
+
+
+def merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        if len(level) % 2:
+            level = level + [level[-1]]
+        levels.append([sha256d(level[i] + level[i + 1]) for i in range(0, len(level), 2)])
+    return levels
+
+
+def merkle_branch(levels: List[List[bytes]], pos: int) -> List[str]:
+    branch = []
+    for level in levels[:-1]:
+        sibling = pos ^ 1
+        branch.append(hash_encode(level[sibling] if sibling < len(level) else level[pos]))
+        pos >>= 1
+    return branch
+
+
+class SyntheticChain:
+
+    def __init__(self, *, headers: List[str], block_txids: List[List[str]],
+                 txs: Dict[str, str], addresses: List[str], histories: Dict[str, List[Tuple[str, int]]]):
+        self.headers = headers  # raw header hex, by height
+        self.block_txids = block_txids  # txids by height, coinbase first
+        self.txs = txs  # txid -> raw tx hex
+        self.addresses = addresses
+        self.histories = histories  # scripthash -> [(txid, height)]
+        self.tx_heights = {txid: height for height, txids in enumerate(block_txids) for txid in txids}
+        self._merkle_levels = {}  # type: Dict[int, List[List[bytes]]]
+
+    @classmethod
+    def generate(cls, *, num_addresses: int, num_blocks: int, used_ratio: float,
+                 txs_per_address: int, seed: int = 0) -> 'SyntheticChain':
+        rng = random.Random(seed)
+        addresses = []
+        histories = {}
+        block_txids = [[] for _ in range(num_blocks)]
+        txs = {}
+        tx_scripthash = {}
+        for i in range(num_addresses):
+            h160 = hashlib.sha256(b'bench_sync address %d' % i).digest()[:20]
+            addr = bitcoin.hash160_to_p2pkh(h160)
+            addresses.append(addr)
+            if rng.random() >= used_ratio:
+                continue
+            script = bfh(bitcoin.address_to_script(addr))
+            sh = bitcoin.script_to_scripthash(script.hex())
+            for k in range(txs_per_address):
+                prev_txid = hashlib.sha256(b'bench_sync funding %d %d' % (i, k)).digest()
+                raw = make_tx(prev_txid, script, rng.randrange(10_000, 10**9))
+                txid = hash_encode(sha256d(raw))
+                txs[txid] = raw.hex()
+                tx_scripthash[txid] = sh
+                block_txids[rng.randrange(1, num_blocks)].append(txid)
+        for height, txids in enumerate(block_txids):
+            coinbase = hash_encode(sha256d(b'bench_sync coinbase %d' % height))
+            txids.insert(0, coinbase)
+        for height, txids in enumerate(block_txids):
+            for txid in txids[1:]:
+                histories.setdefault(tx_scripthash[txid], []).append((txid, height))
+        headers = []
+        prev_hash = '00' * 32
+        for height, txids in enumerate(block_txids):
+            levels = merkle_levels([bfh(txid)[::-1] for txid in txids])
+            header = {
+                'version': 0x30000000,
+                'prev_block_hash': prev_hash,
+                'merkle_root': hash_encode(levels[-1][0]),
+                'timestamp': GENESIS_TIMESTAMP + 60 * height,
+                'bits': 0x207fffff,
+                'nheight': height,
+                'nonce': height,
+                'mix_hash': '00' * 32,
+                'block_height': height,
+            }
+            headers.append(blockchain.serialize_header(header))
+            prev_hash = blockchain.hash_header(header)
+        return cls(headers=headers, block_txids=block_txids, txs=txs,
+                   addresses=addresses, histories=histories)
+
+    @classmethod
+    def load(cls, path: str) -> 'SyntheticChain':
+        with open(path, 'r', encoding='utf-8') as f:
+            d = json.load(f)
+        histories = {sh: [tuple(item) for item in hist] for sh, hist in d['histories'].items()}
+        return cls(headers=d['headers'], block_txids=d['block_txids'], txs=d['txs'],
+                   addresses=d['addresses'], histories=histories)
+
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'headers': self.headers,
+                'block_txids': self.block_txids,
+                'txs': self.txs,
+                'addresses': self.addresses,
+                'histories': self.histories,
+            }, f)
+
+    def genesis_hash(self) -> str:
+        return blockchain.hash_raw_header_kawpow(self.headers[0])
+
+    def merkle_levels_for_block(self, height: int) -> List[List[bytes]]:
+        levels = self._merkle_levels.get(height)
+        if levels is None:
+            levels = merkle_levels([bfh(txid)[::-1] for txid in self.block_txids[height]])
+            self._merkle_levels[height] = levels
+        return levels
+
+
+class ElectrumXStandIn:
+    """Answers the ElectrumX methods used by the client from a SyntheticChain."""
+
+    def __init__(self, chain: SyntheticChain):
+        self.chain = chain
+        self.rpc_counts = Counter()
+        self.busy_time = 0.0
+        self.lock = threading.Lock()
+        empty = lambda *args: None
+        self.handlers = {
+            'server.version': lambda client_name, protocol_version: ['ElectrumX stand-in', version.PROTOCOL_VERSION],
+            'server.banner': lambda: '',
+            'server.donation_address': lambda: '',
+            'server.peers.subscribe': lambda: [],
+            'server.ping': empty,
+            'blockchain.relayfee': lambda: 0.0001,
+            'blockchain.estimatefee': lambda number: -1,
+            'mempool.get_fee_histogram': lambda: [],
+            'blockchain.headers.subscribe': self.headers_subscribe,
+            'blockchain.block.header': self.block_header,
+            'blockchain.block.headers': self.block_headers,
+            'blockchain.scripthash.subscribe': self.scripthash_subscribe,
+            'blockchain.scripthash.get_history': self.scripthash_get_history,
+            'blockchain.transaction.get': self.transaction_get,
+            'blockchain.transaction.get_merkle': self.transaction_get_merkle,
+        }
+        for method in ('blockchain.asset.subscribe', 'blockchain.asset.get_meta',
+                       'blockchain.asset.broadcasts.subscribe', 'blockchain.asset.is_frozen.subscribe',
+                       'blockchain.asset.verifier_string.subscribe',
+                       'blockchain.asset.restricted_associations.subscribe',
+                       'blockchain.tag.qualifier.subscribe', 'blockchain.tag.h160.subscribe'):
+            self.handlers[method] = empty
+        for method in ('blockchain.asset.broadcasts', 'blockchain.tag.qualifier.list',
+                       'blockchain.tag.h160.list'):
+            self.handlers[method] = lambda *args: []
+
+    def handle(self, method: str, args) -> object:
+        t0 = time.perf_counter()
+        try:
+            handler = self.handlers.get(method)
+            if handler is None:
+                raise RPCError(JSONRPC.METHOD_NOT_FOUND, f'unknown method {method}')
+            return handler(*args)
+        finally:
+            with self.lock:
+                self.rpc_counts[method] += 1
+                self.busy_time += time.perf_counter() - t0
+
+    def headers_subscribe(self):
+        height = len(self.chain.headers) - 1
+        return {'hex': self.chain.headers[height], 'height': height}
+
+    def block_header(self, height):
+        return self.chain.headers[height]
+
+    def block_headers(self, start_height, count):
+        headers = self.chain.headers[start_height:start_height + count]
+        return {'hex': ''.join(headers), 'count': len(headers), 'max': 2016}
+
+    def scripthash_subscribe(self, sh):
+        return history_status(self.chain.histories.get(sh))
+
+    def scripthash_get_history(self, sh):
+        return [{'tx_hash': txid, 'height': height} for txid, height in self.chain.histories.get(sh, [])]
+
+    def transaction_get(self, txid, verbose=False):
+        try:
+            return self.chain.txs[txid]
+        except KeyError:
+            raise RPCError(2, 'No such mempool or blockchain transaction')
+
+    def transaction_get_merkle(self, txid, height):
+        height = self.chain.tx_heights[txid]
+        pos = self.chain.block_txids[height].index(txid)
+        levels = self.chain.merkle_levels_for_block(height)
+        return {'block_height': height, 'merkle': merkle_branch(levels, pos), 'pos': pos}
+
+
+class StandInSession(RPCSession):
+
+    def __init__(self, *args, stand_in: ElectrumXStandIn, latency: float, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stand_in = stand_in
+        self.latency = latency
+
+    async def handle_request(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.stand_in.handle(request.method, request.args)
+
+
+def start_stand_in_server(stand_in: ElectrumXStandIn, *, latency: float = 0) -> int:
+    """Runs the server on its own event loop thread. Returns the port."""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    port = []
+
+    async def serve():
+        session_factory = lambda *args, **kwargs: StandInSession(*args, stand_in=stand_in, latency=latency, **kwargs)
+        server = await serve_rs(session_factory, '127.0.0.1', 0)
+        port.append(server.sockets[0].getsockname()[1])
+        started.set()
+
+    threading.Thread(target=loop.run_forever, name='ElectrumXStandIn', daemon=True).start()
+    asyncio.run_coroutine_threadsafe(serve(), loop)
+    started.wait()
+    return port[0]
+
+
+class PhaseStats:
+
+    def __init__(self, stand_in: ElectrumXStandIn, loop: asyncio.AbstractEventLoop, *, profile: bool):
+        self.stand_in = stand_in
+        self.loop = loop
+        self.profile = profile
+
+    def __enter__(self):
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.process_time()
+        with self.stand_in.lock:
+            self.rpc0 = Counter(self.stand_in.rpc_counts)
+            self.busy0 = self.stand_in.busy_time
+        self.profiler = None
+        if self.profile:
+            # sys.setprofile is per thread: enable it on the event loop thread
+            self.profiler = cProfile.Profile()
+            self.loop.call_soon_threadsafe(self.profiler.enable)
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler:
+            done = threading.Event()
+            self.loop.call_soon_threadsafe(lambda: (self.profiler.disable(), done.set()))
+            done.wait()
+        self.wall = time.perf_counter() - self.wall0
+        self.cpu = time.process_time() - self.cpu0
+        with self.stand_in.lock:
+            self.rpcs = self.stand_in.rpc_counts - self.rpc0
+            self.server_time = self.stand_in.busy_time - self.busy0
+        self.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def report(self, name: str) -> None:
+        print(f"  {name}: wall {self.wall:.2f} s, cpu {self.cpu:.2f} s "
+              f"(server {self.server_time:.2f} s), {sum(self.rpcs.values())} rpcs, "
+              f"peak rss {self.peak_rss_mb:.0f} MB")
+        for method, count in sorted(self.rpcs.items(), key=lambda x: -x[1]):
+            print(f"      {count:8d} {method}")
+        if self.profiler:
+            s = io.StringIO()
+            pstats.Stats(self.profiler, stream=s).sort_stats('tottime').print_stats(25)
+            print(s.getvalue())
+
+
+async def wait_until(predicate, *, timeout: float) -> None:
+    t0 = time.monotonic()
+    while not predicate():
+        if time.monotonic() - t0 > timeout:
+            raise TimeoutError('benchmark phase did not complete')
+        await asyncio.sleep(0.02)
+
+
+def run(args, chain: SyntheticChain) -> None:
+    stand_in = ElectrumXStandIn(chain)
+    port = start_stand_in_server(stand_in, latency=args.latency / 1000)
+    loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+    tip = len(chain.headers) - 1
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({
+            'electrum_path': tmp_dir,
+            'server': f'127.0.0.1:{port}:t',
+            'oneserver': True,
+            'auto_connect': False,
+            'header_chunks_in_flight': args.chunks_in_flight,
+        })
+        # Network is a singleton, so headers are synced once and shared by all wallet sizes
+        print(f"chain of {len(chain.headers)} blocks:")
+        with PhaseStats(stand_in, loop, profile=args.profile) as stats:
+            network = Network(config)
+            network.start()
+            fut = asyncio.run_coroutine_threadsafe(
+                wait_until(lambda: network.get_local_height() >= tip, timeout=args.timeout), loop)
+            fut.result()
+        stats.report('headers')
+        print(f"      {len(chain.headers) / stats.wall:8.0f} headers/s")
+
+        for num_addresses in args.addresses:
+            print(f"wallet with {num_addresses} addresses:")
+            with PhaseStats(stand_in, loop, profile=args.profile) as stats:
+                text = ' '.join(chain.addresses[:num_addresses])
+                wallet = restore_wallet_from_text(text, path=None, config=config)['wallet']
+            stats.report('wallet creation')
+
+            with PhaseStats(stand_in, loop, profile=args.profile) as stats:
+                wallet.start_network(network)
+                fut = asyncio.run_coroutine_threadsafe(
+                    wait_until(lambda: wallet.is_up_to_date(), timeout=args.timeout), loop)
+                fut.result()
+            stats.report('history + spv')
+            print(f"  {len(wallet.db.list_transactions())} txs, balance {wallet.get_balance()}")
+            asyncio.run_coroutine_threadsafe(wallet.stop(), loop).result()
+
+        asyncio.run_coroutine_threadsafe(network.stop(), loop).result()
+    finally:
+        shutil.rmtree(tmp_dir)
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--addresses', type=int, nargs='+', default=[1000],
+                        help='wallet sizes to benchmark, e.g. 1000 10000 100000')
+    parser.add_argument('--blocks', type=int, default=5000)
+    parser.add_argument('--used-ratio', type=float, default=0.5,
+                        help='fraction of addresses that have a history')
+    parser.add_argument('--txs-per-address', type=int, default=2)
+    parser.add_argument('--fixture', help='replay a chain saved with --save-fixture')
+    parser.add_argument('--save-fixture', help='save the generated chain to this file')
+    parser.add_argument('--timeout', type=float, default=3600)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='delay of every server response, in milliseconds')
+    parser.add_argument('--chunks-in-flight', type=int, default=4,
+                        help='number of header chunks requested concurrently')
+    parser.add_argument('--profile', action='store_true', help='print a cProfile of each phase')
+    args = parser.parse_args()
+
+    if args.blocks < 2016:
+        # the client verifies the first chunk of headers as a full 2016-header checkpoint chunk
+        parser.error('--blocks must be at least 2016')
+
+    constants.net = BenchNet
+    if args.fixture:
+        chain = SyntheticChain.load(args.fixture)
+    else:
+        t0 = time.perf_counter()
+        chain = SyntheticChain.generate(
+            num_addresses=max(args.addresses), num_blocks=args.blocks, used_ratio=args.used_ratio,
+            txs_per_address=args.txs_per_address)
+        print(f"generated {len(chain.headers)} blocks, {len(chain.txs)} txs "
+              f"in {time.perf_counter() - t0:.1f} s")
+    if args.save_fixture:
+        chain.save(args.save_fixture)
+    if len(chain.addresses) < max(args.addresses):
+        parser.error(f'fixture only has {len(chain.addresses)} addresses')
+    BenchNet.GENESIS = chain.genesis_hash()
+    run(args, chain)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Benchmark for raw transaction parsing throughput.
+#
+# usage:
+#   bench_txparse.py [--corpus FILE] [--txs N] [--runs R]
+#
+# FILE holds one raw tx per line, in hex (e.g. dumped from a node with
+# getrawtransaction). Without it, a synthetic corpus of N asset transactions
+# is generated: segwit and legacy inputs, asset transfer outputs with and
+# without memo, owner and issuance outputs, and a change output each.
+# Every run deserializes the whole corpus from fresh Transaction objects, then
+# also decodes the asset data of each output, as the wallet does on receipt.
+
+import argparse
+import random
+import time
+
+from electrum import constants
+from electrum.asset import (AssetMemo, generate_create_script, generate_owner_script,
+                            generate_transfer_script_from_base)
+from electrum.bitcoin import address_to_script, hash160_to_p2pkh, hash_to_segwit_addr
+from electrum.transaction import (PartialTransaction, PartialTxInput, PartialTxOutput, Transaction,
+                                  TxOutpoint, construct_witness)
+from electrum.util import bfh
+
+
+def make_asset_tx(rng: random.Random) -> str:
+    inputs = []
+    for i in range(rng.randint(1, 4)):
+        txin = PartialTxInput(prevout=TxOutpoint(txid=rng.randbytes(32), out_idx=rng.randint(0, 5)))
+        if rng.random() < 0.5:
+            txin.script_sig = b''
+            txin.witness = bfh(construct_witness([rng.randbytes(71), rng.randbytes(33)]))
+        else:
+            txin.script_sig = bytes([71]) + rng.randbytes(71) + bytes([33]) + rng.randbytes(33)
+            txin.witness = b'\x00'
+        inputs.append(txin)
+    asset = 'BENCH' + ''.join(rng.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=rng.randint(0, 20)))
+    outputs = []
+    for i in range(rng.randint(1, 3)):
+        script = address_to_script(hash160_to_p2pkh(rng.randbytes(20)))
+        memo = AssetMemo(b'\x12\x20' + rng.randbytes(32)) if rng.random() < 0.3 else None
+        outputs.append(PartialTxOutput(
+            scriptpubkey=bfh(generate_transfer_script_from_base(asset, rng.randint(1, 10**12), script, memo=memo)),
+            value=0))
+    if rng.random() < 0.2:
+        outputs.append(PartialTxOutput(
+            scriptpubkey=bfh(generate_create_script(hash160_to_p2pkh(rng.randbytes(20)), asset, 10**8, 0, True, None)),
+            value=0))
+        outputs.append(PartialTxOutput(
+            scriptpubkey=bfh(generate_owner_script(hash160_to_p2pkh(rng.randbytes(20)), asset)),
+            value=0))
+    change_address = hash_to_segwit_addr(rng.randbytes(20), witver=0)
+    outputs.append(PartialTxOutput.from_address_and_value(change_address, rng.randint(10**4, 10**9)))
+    tx = PartialTransaction.from_io(inputs, outputs, locktime=rng.randint(0, 10**6), BIP69_sort=False)
+    return Transaction(tx.serialize_to_network()).serialize()
+
+
+def load_corpus(args) -> list:
+    if args.corpus:
+        with open(args.corpus) as f:
+            return [line.strip() for line in f if line.strip()]
+    rng = random.Random(0)
+    return [make_asset_tx(rng) for _ in range(args.txs)]
+
+
+def main(args):
+    corpus = load_corpus(args)
+    num_bytes = sum(len(raw) // 2 for raw in corpus)
+    print(f"corpus: {len(corpus)} txs, {num_bytes / 1e6:.2f} MB")
+    print(f"{'run':>4} {'deserialize':>12} {'tx/s':>10} {'MB/s':>8} {'+assets':>10}")
+    for run in range(args.runs):
+        txs = [Transaction(raw) for raw in corpus]
+        t0 = time.perf_counter()
+        for tx in txs:
+            tx.deserialize()
+        t_parse = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for tx in txs:
+            for txout in tx.outputs():
+                txout.asset_aware_value()
+        t_assets = time.perf_counter() - t0
+        print(f"{run:>4} {t_parse:11.3f}s {len(txs) / t_parse:10.0f} {num_bytes / 1e6 / t_parse:8.2f}"
+              f" {t_assets:9.3f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help='file with one hex-encoded raw tx per line')
+    parser.add_argument('--txs', type=int, default=20000, help='size of the synthetic corpus')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--testnet', action='store_true')
+    args = parser.parse_args()
+    if args.testnet:
+        constants.BitcoinTestnet.set_as_network()
+    main(args)
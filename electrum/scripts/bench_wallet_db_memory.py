@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+#
+# Benchmark for the memory used by the largest parts of a wallet db:
+# the address histories ('addr_history') and the SPV info ('verified_tx3').
+#
+# usage:
+#   bench_wallet_db_memory.py [--txs N] [--txs-per-address K]
+#
+# Synthetic data for N transactions is generated, spread over addresses with
+# K transactions each. Reports the memory held by the plain json objects (as
+# kept by a StoredDict) and by the compact tables of WalletDB, measured with
+# tracemalloc, together with the time to load the tables and to read them.
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+
+from electrum.wallet_db import AddrHistoryTable, VerifiedTxTable
+
+
+def generate(num_txs: int, txs_per_address: int) -> str:
+    history = {}
+    verified_tx = {}
+    for i in range(num_txs):
+        txid = os.urandom(32).hex()
+        height = 100_000 + i // 10
+        header_hash = height.to_bytes(32, 'big').hex()
+        verified_tx[txid] = [height, 1_600_000_000 + 60 * height, i % 10 + 1, header_hash]
+        addr = f'address_{i // txs_per_address}'
+        history.setdefault(addr, []).append([txid, height])
+    return json.dumps({'addr_history': history, 'verified_tx3': verified_tx})
+
+
+def measure(build):
+    """Returns (result, bytes held by result, seconds).
+    The time is taken from a second run, without tracemalloc."""
+    tracemalloc.start()
+    result = build()
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    build()
+    return result, size, time.perf_counter() - t0
+
+
+def main(args):
+    s = generate(args.txs, args.txs_per_address)
+    print(f"{args.txs} txs, {args.txs_per_address} per address:")
+    data, json_size, dt = measure(lambda: json.loads(s))
+    print(f"  json objects   {json_size / 2**20:8.1f} MB  (parsed in {dt:.2f} s)")
+
+    def build_tables():
+        d = json.loads(s)
+        return AddrHistoryTable(d['addr_history'], None), VerifiedTxTable(d['verified_tx3'], None)
+    (history, verified_tx), tables_size, dt = measure(build_tables)
+    print(f"  tables         {tables_size / 2**20:8.1f} MB  (parsed and packed in {dt:.2f} s)")
+
+    t0 = time.perf_counter()
+    for txid in data['verified_tx3']:
+        verified_tx.get(txid)
+    dt = time.perf_counter() - t0
+    print(f"  get verified tx  {dt / len(data['verified_tx3']) * 1e6:6.2f} us")
+    t0 = time.perf_counter()
+    for addr in data['addr_history']:
+        history.get(addr)
+    dt = time.perf_counter() - t0
+    print(f"  get addr history {dt / len(data['addr_history']) * 1e6:6.2f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--txs', type=int, default=500_000)
+    parser.add_argument('--txs-per-address', type=int, default=2)
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Benchmark for loading several wallets in one process, as a daemon does,
+# with lightning enabled and disabled (config 'enable_lightning').
+#
+# usage:
+#   bench_wallet_startup.py [--wallets N]
+#
+# N standard segwit wallets (which have a lightning key) are created in a
+# temporary directory. Each mode then loads all of them in a fresh
+# interpreter, and reports the wall time (including imports), the peak RSS
+# and the number of electrum modules that were loaded.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def create_wallets(path: str, num_wallets: int):
+    from electrum import util, constants
+    from electrum.simple_config import SimpleConfig
+    from electrum.wallet import create_new_wallet
+    constants.set_testnet()
+    loop, stop_loop, loop_thread = util.create_and_start_event_loop()
+    config = SimpleConfig({'electrum_path': path})
+    for i in range(num_wallets):
+        create_new_wallet(path=os.path.join(path, f'wallet_{i}'), config=config, encrypt_file=False, gap_limit=20)
+
+
+def load_wallets(path: str, lightning: bool):
+    import resource
+    import time
+    t0 = time.monotonic()
+    from electrum import util, constants
+    from electrum.simple_config import SimpleConfig
+    from electrum.storage import WalletStorage
+    from electrum.wallet_db import WalletDB
+    from electrum.wallet import Wallet
+    constants.set_testnet()
+    loop, stop_loop, loop_thread = util.create_and_start_event_loop()
+    config = SimpleConfig({'electrum_path': path, 'enable_lightning': lightning})
+    wallets = []
+    for name in sorted(os.listdir(path)):
+        if not name.startswith('wallet_'):
+            continue
+        storage = WalletStorage(os.path.join(path, name))
+        db = WalletDB(storage.read(), storage=storage, manual_upgrades=False)
+        wallets.append(Wallet(db, config=config))
+    result = {
+        'seconds': time.monotonic() - t0,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'modules': len([m for m in sys.modules if m.startswith('electrum.')]),
+        'lnworkers': len([w for w in wallets if w.lnworker]),
+    }
+    print(json.dumps(result))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as path:
+        subprocess.run([sys.executable, __file__, '--create', path, '--wallets', str(args.wallets)],
+                       check=True, cwd=ROOT)
+        print(f"{'lightning':<10} {'seconds':>8} {'max rss MB':>11} {'modules':>8} {'lnworkers':>10}")
+        for lightning in (True, False):
+            p = subprocess.run([sys.executable, __file__, '--load', path] + ([] if lightning else ['--no-lightning']),
+                               capture_output=True, text=True, check=True, cwd=ROOT)
+            r = json.loads(p.stdout.splitlines()[-1])
+            print(f"{'on' if lightning else 'off':<10} {r['seconds']:8.2f} {r['max_rss_mb']:11.1f} "
+                  f"{r['modules']:8d} {r['lnworkers']:10d}")
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--wallets', type=int, default=10)
+    parser.add_argument('--create', metavar='DIR', help=argparse.SUPPRESS)
+    parser.add_argument('--load', metavar='DIR', help=argparse.SUPPRESS)
+    parser.add_argument('--no-lightning', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.create:
+        create_wallets(args.create, args.wallets)
+        os._exit(0)
+    elif args.load:
+        load_wallets(args.load, lightning=not args.no_lightning)
+    else:
+        main(args)
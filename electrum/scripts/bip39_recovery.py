@@ -26,9 +26,9 @@ network.start()
 @log_exceptions
 async def f():
     try:
+        root_seed = bip39_to_seed(mnemonic, passphrase)
+        root_node = BIP32Node.from_rootseed(root_seed, xtype="standard")
         def get_account_xpub(account_path):
-            root_seed = bip39_to_seed(mnemonic, passphrase)
-            root_node = BIP32Node.from_rootseed(root_seed, xtype="standard")
             account_node = root_node.subkey_at_private_derivation(account_path)
             account_xpub = account_node.to_xpub()
             return account_xpub
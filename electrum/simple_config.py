@@ -876,6 +876,8 @@ class SimpleConfig(Logger):
     NETWORK_SERVERFINGERPRINT = ConfigVar('serverfingerprint', default=None, type_=str)
     NETWORK_MAX_INCOMING_MSG_SIZE = ConfigVar('network_max_incoming_msg_size', default=1_000_000, type_=int)  # in bytes
     NETWORK_TIMEOUT = ConfigVar('network_timeout', default=None, type_=int)
+    NETWORK_HEADER_CHUNKS_IN_FLIGHT = ConfigVar('header_chunks_in_flight', default=4, type_=int)
+    HEADERS_FSYNC_INTERVAL = ConfigVar('headers_fsync_interval', default=10, type_=int)  # in chunks
 
     WALLET_BATCH_RBF = ConfigVar('batch_rbf', default=False, type_=bool)
     WALLET_SPEND_CONFIRMED_ONLY = ConfigVar('confirmed_only', default=False, type_=bool)
@@ -896,6 +898,7 @@ class SimpleConfig(Logger):
     FX_HISTORY_RATES_CAPITAL_GAINS = ConfigVar('history_rates_capital_gains', default=False, type_=bool)
     FX_SHOW_FIAT_BALANCE_FOR_ADDRESSES = ConfigVar('fiat_address', default=False, type_=bool)
 
+    LIGHTNING_ENABLED = ConfigVar('enable_lightning', default=True, type_=bool)
     LIGHTNING_LISTEN = ConfigVar('lightning_listen', default=None, type_=str)
     LIGHTNING_PEERS = ConfigVar('lightning_peers', default=None)
     LIGHTNING_USE_GOSSIP = ConfigVar('use_gossip', default=False, type_=bool)
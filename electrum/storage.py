@@ -29,7 +29,7 @@ import hashlib
 import base64
 import zlib
 from enum import IntEnum
-from typing import Optional
+from typing import Optional, Iterable, Iterator
 
 from . import ecc
 from .util import (profiler, InvalidPassword, WalletFileException, bfh, standardize_path,
@@ -57,6 +57,8 @@ class StorageReadWriteError(Exception): pass
 # TODO: Rename to Storage
 class WalletStorage(Logger):
 
+    WRITE_BATCH_SIZE = 1 << 16  # chars of plaintext processed at a time when saving
+
     def __init__(self, path):
         Logger.__init__(self)
         self.path = standardize_path(path)
@@ -69,9 +71,14 @@ class WalletStorage(Logger):
         except IOError as e:
             raise StorageReadWriteError(e) from e
         if self.file_exists():
-            with open(self.path, "r", encoding='utf-8') as f:
-                self.raw = f.read()
-            self._encryption_version = self._init_encryption_version()
+            with open(self.path, "rb") as f:
+                self._encryption_version = self._init_encryption_version(f.read(64))
+            if self.is_encrypted():
+                # encrypted files are streamed from disk in decrypt()
+                self.raw = None
+            else:
+                with open(self.path, "r", encoding='utf-8') as f:
+                    self.raw = f.read()
         else:
             self.raw = ''
             self._encryption_version = StorageEncryptionVersion.PLAINTEXT
@@ -80,10 +87,17 @@ class WalletStorage(Logger):
         return self.decrypted if self.is_encrypted() else self.raw
 
     def write(self, data: str) -> None:
-        s = self.encrypt_before_writing(data)
+        self.write_chunks([data])
+
+    def write_chunks(self, chunks: Iterable[str]) -> None:
+        """Writes the concatenation of 'chunks'. The chunks are compressed,
+        encrypted and written out as they come, so the whole file content
+        is never held in memory.
+        """
         temp_path = "%s.tmp.%s" % (self.path, os.getpid())
         with open(temp_path, "w", encoding='utf-8') as f:
-            f.write(s)
+            for s in self.encrypt_chunks_before_writing(self._batch_chunks(chunks)):
+                f.write(s)
             f.flush()
             os.fsync(f.fileno())
 
@@ -100,6 +114,18 @@ class WalletStorage(Logger):
         self._file_exists = True
         self.logger.info(f"saved {self.path}")
 
+    def _batch_chunks(self, chunks: Iterable[str]) -> Iterator[str]:
+        batch = []
+        batch_len = 0
+        for s in chunks:
+            batch.append(s)
+            batch_len += len(s)
+            if batch_len >= self.WRITE_BATCH_SIZE:
+                yield ''.join(batch)
+                batch = []
+                batch_len = 0
+        yield ''.join(batch)
+
     def file_exists(self) -> bool:
         return self._file_exists
 
@@ -133,9 +159,10 @@ class WalletStorage(Logger):
         """
         return self._encryption_version
 
-    def _init_encryption_version(self):
+    @staticmethod
+    def _init_encryption_version(head: bytes):
         try:
-            magic = base64.b64decode(self.raw)[0:4]
+            magic = base64.b64decode(head.translate(None, b' \t\r\n')[0:8])[0:4]
             if magic == b'BIE1':
                 return StorageEncryptionVersion.USER_PASSWORD
             elif magic == b'BIE2':
@@ -167,9 +194,16 @@ class WalletStorage(Logger):
         if self.is_past_initial_decryption():
             return
         ec_key = self.get_eckey_from_password(password)
-        if self.raw:
+        if self.file_exists():
             enc_magic = self._get_encryption_magic()
-            s = zlib.decompress(ec_key.decrypt_message(self.raw, enc_magic))
+            decompressor = zlib.decompressobj()
+            s = bytearray()
+            with open(self.path, "rb") as f:
+                for chunk in ec_key.decrypt_message_stream(f, enc_magic):
+                    s += decompressor.decompress(chunk)
+            s += decompressor.flush()
+            if not decompressor.eof:
+                raise WalletFileException('Cannot read wallet file. (truncated)')
             s = s.decode('utf8')
         else:
             s = ''
@@ -177,15 +211,23 @@ class WalletStorage(Logger):
         self.decrypted = s
 
     def encrypt_before_writing(self, plaintext: str) -> str:
-        s = plaintext
-        if self.pubkey:
-            s = bytes(s, 'utf8')
-            c = zlib.compress(s, level=zlib.Z_BEST_SPEED)
-            enc_magic = self._get_encryption_magic()
-            public_key = ecc.ECPubkey(bfh(self.pubkey))
-            s = public_key.encrypt_message(c, enc_magic)
-            s = s.decode('utf8')
-        return s
+        return ''.join(self.encrypt_chunks_before_writing([plaintext]))
+
+    def encrypt_chunks_before_writing(self, chunks: Iterable[str]) -> Iterator[str]:
+        if not self.pubkey:
+            yield from chunks
+            return
+        compressor = zlib.compressobj(level=zlib.Z_BEST_SPEED)
+
+        def compressed():
+            for s in chunks:
+                yield compressor.compress(bytes(s, 'utf8'))
+            yield compressor.flush()
+
+        enc_magic = self._get_encryption_magic()
+        public_key = ecc.ECPubkey(bfh(self.pubkey))
+        for s in public_key.encrypt_message_stream(compressed(), enc_magic):
+            yield s.decode('utf8')
 
     def check_password(self, password: Optional[str]) -> None:
         """Raises an InvalidPassword exception on invalid password"""
@@ -0,0 +1,68 @@
+from electrum import bitcoin
+from electrum.bip32 import BIP32Node
+from electrum.bip39_recovery import account_discovery, get_scripthashes_for_account
+from electrum.keystore import bip39_to_seed
+
+from . import ElectrumTestCase
+
+
+MNEMONIC = 'abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about'
+
+
+class FakeNetwork:
+
+    def __init__(self, active_scripthashes):
+        self.active_scripthashes = set(active_scripthashes)
+        self.num_batches = 0
+
+    async def get_history_for_scripthashes(self, shs):
+        self.num_batches += 1
+        return [[{'tx_hash': '00' * 32, 'height': 1}] if sh in self.active_scripthashes else []
+                for sh in shs]
+
+
+class TestBip39Recovery(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.root_node = BIP32Node.from_rootseed(bip39_to_seed(MNEMONIC, ''), xtype='standard')
+
+    def get_account_xpub(self, account_path):
+        return self.root_node.subkey_at_private_derivation(account_path).to_xpub()
+
+    def scripthash_at(self, account_path: str, for_change: int, n: int, script_type='p2pkh') -> str:
+        node = self.root_node.subkey_at_private_derivation(account_path).subkey_at_public_derivation((for_change, n))
+        address = bitcoin.pubkey_to_address(script_type, node.eckey.get_public_key_hex())
+        return bitcoin.script_to_scripthash(bitcoin.address_to_script(address))
+
+    def test_get_scripthashes_for_account(self):
+        account_node = self.root_node.subkey_at_private_derivation("m/44h/0h/0h")
+        shs = get_scripthashes_for_account(account_node, 'p2pkh', gap_limit=3, gap_limit_for_change=2)
+        self.assertEqual(5, len(shs))
+        self.assertEqual(self.scripthash_at("m/44h/0h/0h", 0, 2), shs[2])
+        self.assertEqual(self.scripthash_at("m/44h/0h/0h", 1, 1), shs[4])
+
+    async def test_account_discovery(self):
+        # accounts 0, 1, 2 and 5 of BIP44 legacy are used. 5 is past the first unused account.
+        network = FakeNetwork([
+            self.scripthash_at("m/44h/0h/0h", 0, 19),
+            self.scripthash_at("m/44h/0h/1h", 1, 0),
+            self.scripthash_at("m/44h/0h/2h", 0, 0),
+            self.scripthash_at("m/44h/0h/5h", 0, 0),
+        ])
+        progress = []
+        accounts = await account_discovery(network, self.get_account_xpub, progress_cb=progress.append)
+        self.assertEqual(["m/44h/0h/0h", "m/44h/0h/1h", "m/44h/0h/2h"],
+                         [account['derivation_path'] for account in accounts])
+        self.assertEqual('Standard BIP44 legacy (Account 1)', accounts[1]['description'])
+        # one batch request per checked account
+        self.assertEqual(network.num_batches, progress[-1].num_accounts_checked)
+        self.assertTrue(progress[-1].has_finished)
+        self.assertEqual(accounts, progress[-1].active_accounts)
+        self.assertFalse(any(p.has_finished for p in progress[:-1]))
+
+    async def test_account_discovery_gap_limit(self):
+        network = FakeNetwork([self.scripthash_at("m/44h/0h/0h", 0, 25)])
+        self.assertEqual([], await account_discovery(network, self.get_account_xpub))
+        accounts = await account_discovery(network, self.get_account_xpub, gap_limit=30)
+        self.assertEqual(["m/44h/0h/0h"], [account['derivation_path'] for account in accounts])
@@ -1,5 +1,6 @@
 import asyncio
 import base64
+import io
 import sys
 
 from electrum.bitcoin import (public_key_to_p2pkh, address_from_private_key,
@@ -9,7 +10,8 @@ from electrum.bitcoin import (public_key_to_p2pkh, address_from_private_key,
                               is_b58_address, address_to_scripthash, is_minikey,
                               is_compressed_privkey, EncodeBase58Check, DecodeBase58Check,
                               script_num_to_hex, push_script, add_number_to_script, int_to_hex,
-                              opcodes, base_encode, base_decode, BitcoinException)
+                              opcodes, base_encode, base_decode, BitcoinException,
+                              get_scriptpubkey_address_part, hash160_to_p2sh)
 from electrum import bip32
 from electrum import segwit_addr
 from electrum.segwit_addr import DecodedBech32
@@ -301,6 +303,20 @@ class Test_bitcoin(ElectrumTestCase):
             self.assertEqual(plaintext, key.decrypt_message(ciphertext2))
             self.assertNotEqual(ciphertext1, ciphertext2)
 
+    @needs_test_with_all_aes_implementations
+    def test_encrypt_message_stream(self):
+        key = WalletStorage.get_eckey_from_password('secret_password77')
+        for plaintext in (b'', b'x' * 15, b'x' * 16, bytes(range(256)) * 300):
+            chunks = [plaintext[i:i+1000] for i in range(0, len(plaintext), 1000)]
+            ciphertext = b''.join(key.encrypt_message_stream(chunks))
+            self.assertEqual(plaintext, key.decrypt_message(ciphertext))
+            self.assertEqual(plaintext, b''.join(key.decrypt_message_stream(io.BytesIO(ciphertext))))
+            self.assertEqual(plaintext, b''.join(key.decrypt_message_stream(io.BytesIO(key.encrypt_message(plaintext)))))
+        ciphertext = b''.join(key.encrypt_message_stream([b'hello']))
+        wrong_key = WalletStorage.get_eckey_from_password('wrong password')
+        with self.assertRaises(InvalidPassword):
+            list(wrong_key.decrypt_message_stream(io.BytesIO(ciphertext)))
+
     def test_sign_transaction(self):
         eckey1 = ecc.ECPrivkey(bfh('7e1255fddb52db1729fc3ceb21a46f95b8d9fe94cc83425e936a6c5223bb679d'))
         sig1 = eckey1.sign_transaction(bfh('5a548b12369a53faaa7e51b5081829474ebdd9c924b3a8230b69aa0be254cd94'))
@@ -521,6 +537,25 @@ class Test_bitcoin(ElectrumTestCase):
         self.assertEqual(add_number_to_script(8388608), bfh('0400008000'))
         self.assertEqual(add_number_to_script(2147483647), bfh('04ffffff7f'))
 
+    def test_get_scriptpubkey_address_part(self):
+        from electrum.asset import generate_transfer_script_from_base
+        from electrum.transaction import get_address_from_output_script
+        for addr in ('yc1qw508d6qejxtdg4y5r3zarvary0c5xw7kau8qtd',
+                     'yc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqe3lf57',
+                     'yc1sw50q8h4ea2',
+                     public_key_to_p2pkh(bfh('0321f0ad37ac11b9e0e4d07d1f7ae8cd1b1f8d2b0f4a0cf85ad9bdb6c0d5ff2e45')),
+                     hash160_to_p2sh(bytes(20))):
+            script = bfh(address_to_script(addr))
+            self.assertEqual(script, get_scriptpubkey_address_part(script))
+            asset_script = bfh(generate_transfer_script_from_base('ASSET', 100, script.hex()))
+            self.assertEqual(addr, get_address_from_output_script(asset_script))
+            self.assertEqual(script, get_scriptpubkey_address_part(asset_script))
+        # not a minimally encoded template: caller needs to decode
+        p2pkh_script = bfh(address_to_script(public_key_to_p2pkh(bfh('0321f0ad37ac11b9e0e4d07d1f7ae8cd1b1f8d2b0f4a0cf85ad9bdb6c0d5ff2e45'))))
+        self.assertIsNone(get_scriptpubkey_address_part(p2pkh_script[:2] + bytes([opcodes.OP_PUSHDATA1]) + p2pkh_script[2:]))
+        self.assertIsNone(get_scriptpubkey_address_part(bytes([opcodes.OP_RETURN]) + bytes(20)))
+        self.assertIsNone(get_scriptpubkey_address_part(b''))
+
     def test_address_to_script(self):
         # bech32/bech32m native segwit
         # test vectors adapted for Yottaflux (yc HRP)
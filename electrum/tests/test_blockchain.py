@@ -1,10 +1,12 @@
 import shutil
 import tempfile
 import os
+from unittest import mock
 
 from electrum import constants, blockchain
 from electrum.simple_config import SimpleConfig
-from electrum.blockchain import Blockchain, deserialize_header, hash_header, InvalidHeader, HEADER_SIZE
+from electrum.blockchain import (Blockchain, deserialize_header, serialize_header, hash_header, InvalidHeader,
+                                 HEADER_SIZE, LEGACY_HEADER_SIZE, pad_headers_to_kawpow_len)
 from electrum.util import bfh, make_dir
 
 from . import ElectrumTestCase
@@ -385,6 +387,43 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual([chain_u], self.get_chains_that_contain_header_helper(self.HEADERS['O']))
         self.assertEqual([chain_z, chain_l], self.get_chains_that_contain_header_helper(self.HEADERS['I']))
 
+    def test_pad_headers_to_kawpow_len(self):
+        legacy = [bfh(serialize_header(self.HEADERS[x]))[:LEGACY_HEADER_SIZE] for x in 'ABC']
+        kawpow = [bytes(range(i, i + HEADER_SIZE)) for i in range(2)]
+        with mock.patch.object(constants.net, 'KawpowActivationHeight', 3):
+            padded = pad_headers_to_kawpow_len(0, b''.join(legacy + kawpow))
+            self.assertEqual(b''.join([h + bytes(40) for h in legacy] + kawpow), padded)
+            # a chunk starting after activation is unchanged
+            self.assertEqual(b''.join(kawpow), pad_headers_to_kawpow_len(3, b''.join(kawpow)))
+            with self.assertRaises(Exception):
+                pad_headers_to_kawpow_len(0, b''.join(legacy + kawpow)[:-1])
+
+    def test_save_chunk_fsync_interval(self):
+        self.config.HEADERS_FSYNC_INTERVAL = 3
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        with mock.patch.object(os, 'fsync') as fsync:
+            # height 0 is served as a legacy header on regtest
+            chain_u.save_chunk(0, bfh(serialize_header(self.HEADERS['A']))[:LEGACY_HEADER_SIZE], fsync=False)
+            for height, x in enumerate('BCDE', start=1):
+                chain_u.save_chunk(height, bfh(serialize_header(self.HEADERS[x])), fsync=False)
+            self.assertEqual(1, fsync.call_count)
+            blockchain.sync_headers_to_disk()
+            self.assertEqual(2, fsync.call_count)
+            blockchain.sync_headers_to_disk()
+            self.assertEqual(2, fsync.call_count)
+            # chunks saved by other callers are always fsynced
+            chain_u.save_chunk(4, bfh(serialize_header(self.HEADERS['E'])))
+            self.assertEqual(3, fsync.call_count)
+            # tip headers are always fsynced
+            chain_u.save_header(self.HEADERS['F'])
+            self.assertEqual(4, fsync.call_count)
+        self.assertEqual(5, chain_u.height())
+        for height, x in enumerate('ABCDEF'):
+            self.assertEqual(self.HEADERS[x], chain_u.read_header(height))
+
     def test_target_to_bits(self):
         # https://github.com/bitcoin/bitcoin/blob/7fcf53f7b4524572d1d0c9a5fdc388e87eb02416/src/arith_uint256.h#L269
         self.assertEqual(0x05123456, Blockchain.target_to_bits(0x1234560000))
@@ -1,4 +1,6 @@
 import unittest
+import json
+import os
 from unittest import mock
 from decimal import Decimal
 
@@ -327,3 +329,61 @@ class TestCommandsTestnet(ElectrumTestCase):
         # test "from_coins" arg
         self.assertEqual("02000000000101b9723dfc69af058ef6613539a000d2cd098a2c8a74e802b6d8739db708ba8c9a0100000000fdffffff02a00f00000000000016001429e1fd187f0cac845946ae1b11dc136c536bfc0f84b2000000000000160014100611bcb3aee7aad176936cf4ed56ade03027aa0247304402203aa63539b673a3bd70a76482b17f35f8843974fab28f84143a00450789010bc40220779c2ce2d0217f973f1f6c9f718e19fc7ebd14dd8821a962f002437cda3082ec012102ee3f00141178006c78b0b458aab21588388335078c655459afe544211f15aee000000000",
                          await cmds.bumpfee(tx=orig_rawtx, new_fee_rate='1.6', from_coins="9a8cba08b79d73d8b602e8748a2c8a09cdd200a0393561f68e05af69fc3d72b9:1", wallet=wallet))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_onchain_history_jsonl(self, mock_save_db):
+        wallet = restore_wallet_from_text('disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+                                          gap_limit=2,
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        funding_tx = Transaction('0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00')
+        funding_txid = funding_tx.txid()
+        wallet.adb.receive_tx_callback(funding_txid, funding_tx, TX_HEIGHT_UNCONFIRMED)
+
+        cmds = Commands(config=self.config)
+        history = await cmds.onchain_history(wallet=wallet)
+        lines = (await cmds.onchain_history(jsonl=True, wallet=wallet)).split('\n')
+        self.assertEqual(2, len(lines))
+        self.assertEqual(history['transactions'], [json.loads(lines[0])])
+        self.assertEqual(funding_txid, json.loads(lines[0])['txid'])
+        self.assertEqual({'summary': history['summary']}, json.loads(lines[1]))
+        # written to a file as they are produced
+        path = os.path.join(self.electrum_path, 'history.jsonl')
+        self.assertTrue(await cmds.onchain_history(jsonl=True, output_file=path, wallet=wallet))
+        with open(path, 'r', encoding='utf-8') as f:
+            self.assertEqual(lines, f.read().splitlines())
+        # output_file needs jsonl
+        os.remove(path)
+        with self.assertRaises(UserFacingException):
+            await cmds.onchain_history(output_file=path, wallet=wallet)
+        self.assertFalse(os.path.exists(path))
+        # filters
+        self.assertEqual([], list(wallet.iter_detailed_history(assets={'SOME_ASSET'})))
+        self.assertEqual([], list(wallet.iter_detailed_history(to_height=1000)))
+        self.assertEqual({}, (await cmds.onchain_history(to_height=1000, wallet=wallet))['summary'])
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_versioned_balance_and_unspent(self, mock_save_db):
+        wallet = restore_wallet_from_text('disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+                                          gap_limit=2,
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        cmds = Commands(config=self.config, daemon=mock.Mock(get_wallets=lambda: {'w1': wallet}))
+        self.assertEqual([], await cmds.listunspent(wallet=wallet))
+        self.assertEqual({"confirmed": "0"}, await cmds.getbalance(wallet=wallet))
+        res = await cmds.getbalance(known_version='', wallet=wallet)
+        version = res['version']
+        self.assertEqual({'version': version, 'balance': {"confirmed": "0"}}, res)
+        self.assertEqual({'version': version}, await cmds.getbalance(known_version=version, wallet=wallet))
+        self.assertEqual({'w1': {'version': version}}, await cmds.getbalances(known_versions={'w1': version}))
+
+        funding_tx = Transaction('0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00')
+        wallet.adb.receive_tx_callback(funding_tx.txid(), funding_tx, TX_HEIGHT_UNCONFIRMED)
+        res = await cmds.getbalance(known_version=version, wallet=wallet)
+        self.assertNotEqual(version, res['version'])
+        self.assertEqual({"confirmed": "0", "unconfirmed": "0.005348"}, res['balance'])
+        self.assertEqual({'w1': res}, await cmds.getbalances(known_versions={'w1': version}))
+        res = await cmds.listunspent(known_version=version, wallet=wallet)
+        self.assertEqual(1, len(res['unspent']))
+        self.assertEqual("0.005348", res['unspent'][0]['value'])
+        self.assertEqual({'version': res['version']}, await cmds.listunspent(known_version=res['version'], wallet=wallet))
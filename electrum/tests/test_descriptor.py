@@ -388,3 +388,16 @@ class TestDescriptor(ElectrumTestCase):
         # invalid:
         with self.assertRaises(ValueError):
             pp = PubkeyProvider(origin=None, pubkey=pubkey_hex, deriv_path="/1/7")
+
+    def test_pubkey_provider_known_pubkey(self):
+        xpub = "xpub68W3CJPrQzHhTQcHM6tbCvNVB9ih4tbzsFBLwe7zZUj5uHuhxBUhvnXe1RQhbKCTiTj3D7kXni6yAD88i2xnjKHaJ5NqTtHawKnPFCDnmo4"
+        pp = PubkeyProvider(origin=None, pubkey=xpub, deriv_path="/1/7")
+        pubkey = pp.get_pubkey_bytes()
+        self.assertEqual(pubkey, PubkeyProvider(origin=None, pubkey=xpub, deriv_path="/1/*").get_pubkey_bytes(pos=7))
+        # a known pubkey and a pre-parsed xpub are taken as is
+        pp2 = PubkeyProvider(origin=None, pubkey=xpub, deriv_path="/1/7", extkey=pp.extkey, pubkey_bytes=pubkey)
+        self.assertIs(pp.extkey, pp2.extkey)
+        self.assertEqual(pubkey, pp2.get_pubkey_bytes())
+        self.assertEqual(pp.to_string(), pp2.to_string())
+        with self.assertRaises(ValueError):
+            PubkeyProvider(origin=None, pubkey=xpub, deriv_path="/1/*", pubkey_bytes=pubkey)
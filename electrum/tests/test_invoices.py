@@ -1,5 +1,6 @@
 import os
 import time
+from unittest import mock
 
 from . import ElectrumTestCase
 
@@ -267,6 +268,40 @@ class TestWalletPaymentRequests(ElectrumTestCase):
         self.assertEqual(PR_UNCONFIRMED, wallet1.get_invoice_status(pr2))
         self.assertEqual(pr2, wallet1.get_request_by_addr(addr1))
 
+    async def test_wallet_onchain_payment_status_follows_chain(self):
+        text = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+        d = restore_wallet_from_text(text, path=self.wallet1_path, gap_limit=3, config=self.config)
+        wallet1 = d['wallet']  # type: Standard_Wallet
+        wallet1.db.put('stored_height', 1000)
+        addr1, addr2 = wallet1.get_receiving_addresses()[:2]
+        pr1_key = wallet1.create_request(amount_sat=10000, asset=None, message="msg", address=addr1, exp_delay=86400)
+        pr2_key = wallet1.create_request(amount_sat=10000, asset=None, message="msg", address=addr2, exp_delay=86400)
+        pr1, pr2 = wallet1.get_request(pr1_key), wallet1.get_request(pr2_key)
+        self.assertEqual({pr1_key, pr2_key}, {r.get_id() for r in wallet1.get_sorted_requests()})
+        self.assertEqual(2, len(wallet1.get_unpaid_requests()))
+        # pr1 gets paid onchain
+        wallet2 = self.create_wallet2()  # type: Standard_Wallet
+        outputs = [PartialTxOutput.from_address_and_value(addr1, 10000)]
+        tx = wallet2.mktx(outputs=outputs, fee=5000)
+        wallet1.adb.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual(PR_UNCONFIRMED, wallet1.get_invoice_status(pr1))
+        self.assertEqual(PR_UNPAID, wallet1.get_invoice_status(pr2))
+        wallet1.db.put('stored_height', 1001)
+        tx_info = TxMinedInfo(height=1001, timestamp=pr1.get_time() + 100, txpos=1, header_hash="01"*32)
+        wallet1.adb.add_verified_tx(tx.txid(), tx_info)
+        self.assertEqual(PR_PAID, wallet1.get_invoice_status(pr1))
+        self.assertEqual([pr2], wallet1.get_unpaid_requests())
+        self.assertEqual(1, wallet1.export_request(pr1)['confirmations'])
+        # confirmations grow with the chain
+        wallet1.db.put('stored_height', 1010)
+        self.assertEqual(10, wallet1.export_request(pr1)['confirmations'])
+        # reorg
+        wallet1.adb.undo_verifications(mock.Mock(read_header=lambda height: None), 1000)
+        self.assertEqual(PR_UNCONFIRMED, wallet1.get_invoice_status(pr1))
+        # deleting a request updates the sorted requests
+        wallet1.delete_request(pr2_key)
+        self.assertEqual([pr1], wallet1.get_sorted_requests())
+
 
 class TestBaseInvoice(ElectrumTestCase):
     TESTNET = True
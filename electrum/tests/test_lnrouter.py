@@ -3,18 +3,23 @@ import unittest
 import tempfile
 import shutil
 import asyncio
+import time
 from typing import Optional
 
 from electrum import util
 from electrum.util import bfh
-from electrum.lnutil import ShortChannelID
+from electrum.lnutil import ShortChannelID, InvalidGossipMsg
 from electrum.lnonion import (OnionHopsDataSingle, new_onion_packet,
                               process_onion_packet, _decode_onion_error, decode_onion_error,
                               OnionFailureCode, OnionPacket)
-from electrum import bitcoin, lnrouter
+from electrum import bitcoin, lnrouter, ecc
+from electrum.crypto import sha256d
 from electrum.constants import BitcoinTestnet
 from electrum.simple_config import SimpleConfig
 from electrum.lnrouter import PathEdge, LiquidityHintMgr, DEFAULT_PENALTY_PROPORTIONAL_MILLIONTH, DEFAULT_PENALTY_BASE_MSAT, fee_for_edge_msat
+from electrum.channel_db import (ChannelInfo, Policy, NodeInfo, GraphSnapshotRowids,
+                                 serialize_graph_snapshot, deserialize_graph_snapshot)
+from electrum.lnmsg import encode_msg
 
 from . import ElectrumTestCase
 from .test_bitcoin import needs_test_with_all_chacha20_implementations
@@ -28,6 +33,10 @@ def node(character: str) -> bytes:
     return b'\x02' + f'{character}'.encode() * 32
 
 
+def neighbour_pairs(neighbours) -> set:
+    return {(short_channel_id, other) for short_channel_id, other, _ in neighbours}
+
+
 class Test_LNRouter(ElectrumTestCase):
     TESTNET = True
 
@@ -158,6 +167,44 @@ class Test_LNRouter(ElectrumTestCase):
         self.assertEqual(node('b'), route[0].node_id)
         self.assertEqual(channel(3), route[0].short_channel_id)
 
+    async def test_neighbours_for_node(self):
+        self.prepare_graph()
+        self.assertEqual(
+            {(channel(3), node('b')), (channel(6), node('d'))},
+            neighbour_pairs(self.cdb.get_neighbours_for_node(node('a'))))
+        # adjacency cache is invalidated when channels are added/removed
+        self.cdb.remove_channel(channel(3))
+        self.assertEqual(
+            {(channel(6), node('d'))},
+            neighbour_pairs(self.cdb.get_neighbours_for_node(node('a'))))
+        self.assertEqual(
+            {(channel(1), node('c')), (channel(2), node('e'))},
+            neighbour_pairs(self.cdb.get_neighbours_for_node(node('b'))))
+        self.cdb.add_channel_announcements({
+            'node_id_1': node('a'), 'node_id_2': node('e'),
+            'bitcoin_key_1': node('a'), 'bitcoin_key_2': node('e'),
+            'short_channel_id': channel(8),
+            'chain_hash': BitcoinTestnet.rev_genesis_bytes(),
+            'len': 0, 'features': b''
+        }, trusted=True)
+        self.assertEqual(
+            {(channel(6), node('d')), (channel(8), node('e'))},
+            neighbour_pairs(self.cdb.get_neighbours_for_node(node('a'))))
+        # private route edges are merged in
+        route_edge = lnrouter.RouteEdge(
+            start_node=node('f'), end_node=node('a'), short_channel_id=channel(9),
+            fee_base_msat=0, fee_proportional_millionths=0, cltv_expiry_delta=10, node_features=0)
+        self.assertEqual(
+            {(channel(6), node('d')), (channel(8), node('e')), (channel(9), node('f'))},
+            neighbour_pairs(self.cdb.get_neighbours_for_node(node('a'), private_route_edges={channel(9): route_edge})))
+        # with the same channel_info as get_channel_info
+        private_route_edges = {channel(9): route_edge}
+        for short_channel_id, _, channel_info in self.cdb.get_neighbours_for_node(
+                node('a'), private_route_edges=private_route_edges):
+            self.assertEqual(
+                self.cdb.get_channel_info(short_channel_id, private_route_edges=private_route_edges),
+                channel_info)
+
     async def test_find_path_liquidity_hints(self):
         self.prepare_graph()
         amount_to_send = 100000
@@ -253,6 +300,128 @@ class Test_LNRouter(ElectrumTestCase):
         self.assertEqual(channel(3), path[0].short_channel_id)
         self.assertEqual(channel(2), path[1].short_channel_id)
 
+    async def test_load_data_from_graph_snapshot(self):
+        class fake_network:
+            config = self.config
+            asyncio_loop = util.get_asyncio_loop()
+            interface = None
+
+        def chan_ann(scid: int, n1: str, n2: str) -> dict:
+            payload = {
+                'node_signature_1': bytes(64), 'node_signature_2': bytes(64),
+                'bitcoin_signature_1': bytes(64), 'bitcoin_signature_2': bytes(64),
+                'len': 0, 'features': b'',
+                'chain_hash': BitcoinTestnet.rev_genesis_bytes(),
+                'short_channel_id': channel(scid),
+                'node_id_1': node(n1), 'node_id_2': node(n2),
+                'bitcoin_key_1': node(n1), 'bitcoin_key_2': node(n2),
+            }
+            payload['raw'] = encode_msg('channel_announcement', **payload)
+            return payload
+
+        def chan_upd(scid: int, direction: bytes, fee_base_msat: int, timestamp: int) -> dict:
+            payload = {
+                'signature': bytes(64),
+                'chain_hash': BitcoinTestnet.rev_genesis_bytes(),
+                'short_channel_id': channel(scid), 'timestamp': timestamp,
+                'message_flags': b'\x01', 'channel_flags': direction,
+                'cltv_expiry_delta': 40, 'htlc_minimum_msat': 1000,
+                'fee_base_msat': fee_base_msat, 'fee_proportional_millionths': 10,
+                'htlc_maximum_msat': 10**9,
+            }
+            payload['raw'] = encode_msg('channel_update', **payload)
+            return payload
+
+        now = int(time.time())
+        cdb = lnrouter.ChannelDB(fake_network())
+        await cdb.load_data()
+        for scid, n1, n2 in [(1, 'a', 'b'), (2, 'b', 'c'), (3, 'c', 'd')]:
+            cdb.add_channel_announcements(chan_ann(scid, n1, n2), trusted=True)
+            cdb.add_channel_update(chan_upd(scid, b'\x00', 100, now - 1000), verify=False)
+            cdb.add_channel_update(chan_upd(scid, b'\x01', 100, now - 1000), verify=False)
+        cdb.GRAPH_SNAPSHOT_MIN_NEW_ROWS = 0
+        await cdb.save_graph_snapshot()
+        # changes after the snapshot was taken
+        cdb.add_channel_announcements(chan_ann(4, 'd', 'e'), trusted=True)
+        cdb.add_channel_update(chan_upd(1, b'\x00', 200, now), verify=False)
+        cdb.remove_channel(channel(2))
+        # note: db requests are processed in order, so awaiting the last one is enough
+        await cdb._db_delete_policy(node('b'), channel(2))
+        expected_channels = dict(cdb._channels)
+        expected_policies = {k: v for k, v in cdb._policies.items() if k != (node('b'), channel(2))}
+        cdb.stop()
+        await cdb.stopped_event.wait()
+
+        cdb = lnrouter.ChannelDB(fake_network())
+        await cdb.load_data()
+        self.assertEqual(expected_channels, cdb._channels)
+        self.assertEqual(expected_policies, cdb._policies)
+        self.assertEqual(200, cdb.get_policy_for_node(channel(1), node('a')).fee_base_msat)
+        self.assertEqual(
+            {(channel(3), node('c')), (channel(4), node('e'))},
+            neighbour_pairs(cdb.get_neighbours_for_node(node('d'))))
+        cdb.stop()
+        await cdb.stopped_event.wait()
+
+    async def test_add_channel_updates_verifies_batch(self):
+        self.prepare_graph()
+        privkey = ecc.ECPrivkey(bytes([7] * 32))
+        now = int(time.time())
+
+        def signed_chan_upd(scid: int, timestamp: int) -> dict:
+            payload = {
+                'signature': bytes(64),
+                'chain_hash': BitcoinTestnet.rev_genesis_bytes(),
+                'short_channel_id': channel(scid), 'timestamp': timestamp,
+                'message_flags': b'\x01', 'channel_flags': b'\x01',  # sent by node_id_2
+                'cltv_expiry_delta': 40, 'htlc_minimum_msat': 1000,
+                'fee_base_msat': 1, 'fee_proportional_millionths': 10,
+                'htlc_maximum_msat': 10**9,
+            }
+            raw = encode_msg('channel_update', **payload)
+            payload['signature'] = privkey.sign(sha256d(raw[2+64:]), ecc.sig_string_from_r_and_s)
+            payload['raw'] = encode_msg('channel_update', **payload)
+            return payload
+
+        for scid in range(100, 400):
+            self.cdb.add_verified_channel_info({
+                'node_id_1': node('z'), 'node_id_2': privkey.get_public_key_bytes(),
+                'short_channel_id': channel(scid), 'features': b'',
+            })
+        payloads = [signed_chan_upd(scid, now) for scid in range(100, 400)]
+        # one bad signature in the batch: nothing gets added
+        bad_payload = dict(payloads[250])
+        bad_payload['raw'] = bad_payload['raw'][:-1] + b'\xff'
+        with self.assertRaises(InvalidGossipMsg):
+            self.cdb.add_channel_updates(payloads[:250] + [bad_payload])
+        self.assertIsNone(self.cdb.get_policy_for_node(channel(100), privkey.get_public_key_bytes()))
+        # all signatures valid
+        categorized = self.cdb.add_channel_updates(payloads + [signed_chan_upd(999, now)])
+        self.assertEqual(300, len(categorized.good))
+        self.assertEqual(1, len(categorized.orphaned))
+        categorized = self.cdb.add_channel_updates(payloads[:10])
+        self.assertEqual(10, len(categorized.deprecated))
+
+    def test_graph_snapshot_serialization(self):
+        channels = [ChannelInfo(short_channel_id=channel(1), node1_id=node('a'), node2_id=node('b'), capacity_sat=None)]
+        policies = [
+            Policy(key=channel(1) + node('a'), cltv_expiry_delta=40, htlc_minimum_msat=1, htlc_maximum_msat=None,
+                   fee_base_msat=1000, fee_proportional_millionths=1, channel_flags=0, message_flags=0, timestamp=7),
+            Policy(key=channel(1) + node('b'), cltv_expiry_delta=144, htlc_minimum_msat=0, htlc_maximum_msat=10**10,
+                   fee_base_msat=0, fee_proportional_millionths=0, channel_flags=3, message_flags=1, timestamp=8),
+        ]
+        nodes = [
+            NodeInfo(node_id=node('a'), features=0, timestamp=5, alias=''),
+            NodeInfo(node_id=node('b'), features=1 << 300, timestamp=6, alias='bob ⚡'),
+        ]
+        rowids = GraphSnapshotRowids(channel_info=3, policy=5, node_info=2)
+        data = serialize_graph_snapshot(rowids=rowids, channels=channels, policies=policies, nodes=nodes)
+        self.assertEqual((rowids, channels, policies, nodes), deserialize_graph_snapshot(data))
+        with self.assertRaises(ValueError):
+            deserialize_graph_snapshot(data[:-1])
+        with self.assertRaises(ValueError):
+            deserialize_graph_snapshot(b'ELGS' + bytes(4) + data[8:])
+
     def test_liquidity_hints(self):
         liquidity_hints = LiquidityHintMgr()
         node_from = bytes(0)
@@ -0,0 +1,85 @@
+from unittest import mock
+
+from electrum import bitcoin
+from electrum.address_synchronizer import AddressSynchronizer
+from electrum.ecc import ECPrivkey
+from electrum.lnwatcher import LNWatcher
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum.wallet_db import WalletDB
+
+from . import ElectrumTestCase
+
+
+def make_address(secret: int) -> str:
+    pubkey = ECPrivkey.from_secret_scalar(secret).get_public_key_hex()
+    return bitcoin.pubkey_to_address('p2wpkh', pubkey)
+
+
+def make_tx(prevout: TxOutpoint, address: str, value: int) -> Transaction:
+    txin = PartialTxInput(prevout=prevout)
+    txin.script_sig = b''
+    outputs = [PartialTxOutput.from_address_and_value(address, value)]
+    return Transaction(PartialTransaction.from_io([txin], outputs, BIP69_sort=False).serialize_to_network())
+
+
+class CountingWatcher(LNWatcher):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_inspections = 0
+        self.closing_txids = []
+
+    def inspect_tx_candidate(self, outpoint, n):
+        if n == 0:
+            self.num_inspections += 1
+        return super().inspect_tx_candidate(outpoint, n)
+
+    async def do_breach_remedy(self, funding_outpoint, closing_tx, spenders):
+        return True
+
+    async def update_channel_state(self, *, closing_txid, **kwargs):
+        self.closing_txids.append(closing_txid)
+
+
+class TestLNWatcher(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+
+    async def test_spenders_are_cached_until_outpoints_are_touched(self):
+        db = WalletDB({}, storage=None, manual_upgrades=False)
+        db._load_assets()  # usually done by the wallet
+        adb = AddressSynchronizer(db, self.config)
+        watcher = CountingWatcher(adb, mock.Mock(config=self.config))
+        channel_address, sweep_address = make_address(1), make_address(2)
+        funding_tx = make_tx(TxOutpoint(txid=bytes(range(32)), out_idx=0), channel_address, 100_000)
+        funding_outpoint = funding_tx.txid() + ':0'
+        watcher.add_channel(funding_outpoint, channel_address)
+        adb.receive_tx_callback(funding_tx.txid(), funding_tx, 1000)
+
+        with mock.patch.object(adb, 'is_up_to_date', return_value=True):
+            await watcher.check_onchain_situation(channel_address, funding_outpoint)
+            await watcher.check_onchain_situation(channel_address, funding_outpoint)
+            self.assertEqual(1, watcher.num_inspections)
+            self.assertEqual([None, None], watcher.closing_txids)
+            self.assertEqual('open', watcher.get_channel_status(funding_outpoint))
+            # a tx spending the funding outpoint invalidates the cached spenders
+            closing_tx = make_tx(TxOutpoint.from_str(funding_outpoint), sweep_address, 99_000)
+            adb.receive_tx_callback(closing_tx.txid(), closing_tx, 1001)
+            await watcher.check_onchain_situation(channel_address, funding_outpoint)
+            self.assertEqual(2, watcher.num_inspections)
+            self.assertEqual(closing_tx.txid(), watcher.closing_txids[-1])
+            # the walk added sweep_address, so it is redone once more before being cached
+            self.assertTrue(adb.is_mine(sweep_address))
+            await watcher.check_onchain_situation(channel_address, funding_outpoint)
+            await watcher.check_onchain_situation(channel_address, funding_outpoint)
+            self.assertEqual(3, watcher.num_inspections)
+            self.assertEqual(closing_tx.txid(), watcher.closing_txids[-1])
+            # removing the closing tx brings back the open channel
+            adb.remove_transaction(closing_tx.txid())
+            await watcher.check_onchain_situation(channel_address, funding_outpoint)
+            self.assertEqual(4, watcher.num_inspections)
+            self.assertEqual(None, watcher.closing_txids[-1])
+        await watcher.stop()
@@ -1,6 +1,7 @@
 import asyncio
 import tempfile
 import unittest
+from unittest import mock
 
 from electrum import constants
 from electrum.simple_config import SimpleConfig
@@ -126,6 +127,48 @@ class TestNetwork(ElectrumTestCase):
         self.assertEqual(('catchup', 7), res)
         self.assertEqual(self.interface.q.qsize(), 0)
 
+    def _mock_chunk_server(self, *, bad_chunk=None):
+        ifa = self.interface
+        in_flight = []
+        max_in_flight = [0]
+        connected = []
+        async def fetch_chunk(height, size):
+            in_flight.append(height)
+            max_in_flight[0] = max(max_in_flight[0], len(in_flight))
+            # later chunks arrive first
+            await asyncio.sleep(0.01 * (10 - len(in_flight)))
+            in_flight.remove(height)
+            return f'{height}:{size}'
+        async def connect_chunk(height, hexdata, *, fsync=True):
+            self.assertFalse(fsync)
+            self.assertEqual(f'{height}:', hexdata[:len(str(height)) + 1])
+            if height == bad_chunk:
+                return False
+            connected.append(height)
+            return True
+        ifa._fetch_chunk = fetch_chunk
+        ifa.blockchain.connect_chunk = connect_chunk
+        return connected, max_in_flight
+
+    @mock.patch.object(blockchain, 'blockchains', {})
+    async def test_request_chunks_pipelined(self):
+        self.config.NETWORK_HEADER_CHUNKS_IN_FLIGHT = 3
+        connected, max_in_flight = self._mock_chunk_server()
+        res = await self.interface.request_chunks(0, 5 * 2016 + 99)
+        self.assertEqual((True, 5 * 2016 + 100), res)
+        self.assertEqual([0, 2016, 4032, 6048, 8064, 10080], connected)
+        self.assertEqual(3, max_in_flight[0])
+
+    @mock.patch.object(blockchain, 'blockchains', {})
+    async def test_request_chunks_stops_at_chunk_that_does_not_connect(self):
+        connected, max_in_flight = self._mock_chunk_server(bad_chunk=4032)
+        res = await self.interface.request_chunks(0, 10 * 2016)
+        self.assertEqual((True, 2 * 2016), res)
+        self.assertEqual([0, 2016], connected)
+        connected, max_in_flight = self._mock_chunk_server(bad_chunk=2016)
+        res = await self.interface.request_chunks(2016, 10 * 2016)
+        self.assertEqual((False, 0), res)
+
 
 if __name__=="__main__":
     constants.set_regtest()
@@ -1,3 +1,4 @@
+import struct
 from typing import NamedTuple, Union
 
 from electrum import transaction, bitcoin
@@ -9,6 +10,8 @@ from electrum.util import bfh
 from electrum.bitcoin import (deserialize_privkey, opcodes,
                               construct_script, construct_witness)
 from electrum.ecc import ECPrivkey
+from electrum.crypto import sha256d
+from electrum import ecc
 from electrum import descriptor
 
 from .test_bitcoin import disable_ecdsa_r_value_grinding
@@ -78,6 +81,45 @@ class TestBCDataStream(ElectrumTestCase):
         self.assertEqual(b'\x01\x00', s.read_bytes(2))
         self.assertFalse(s.can_read_more())
 
+    def test_write_does_not_modify_caller_bytes(self):
+        raw = b'\x01\x02'
+        s = transaction.BCDataStream()
+        s.write(raw)
+        s.write(b'\x03')
+        s.write_uint16(4)
+        self.assertEqual(b'\x01\x02', raw)
+        self.assertEqual(b'\x01\x02\x03', s.read_bytes(3))
+        self.assertEqual(4, s.read_uint16())
+        self.assertIs(bytes, type(s.read_bytes(0)))
+
+    def test_read_view_and_struct(self):
+        s = transaction.BCDataStream()
+        s.write(bytes(range(10)))
+        self.assertEqual((0x0100, 0x05040302), s.read_struct(struct.Struct('<HI')))
+        view = s.read_view(3)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(b'\x06\x07\x08', view)
+        with self.assertRaises(transaction.SerializationError):
+            s.read_view(2)
+        with self.assertRaises(transaction.SerializationError):
+            s.read_struct(struct.Struct('<H'))
+        self.assertEqual(9, s.read_compact_size())
+        self.assertFalse(s.can_read_more())
+
+    def test_parse_witness(self):
+        witness = bfh(construct_witness([b'', bytes(300), b'\x01']))
+        s = transaction.BCDataStream()
+        s.write(witness + b'\xff')
+        txin = transaction.TxInput(prevout=transaction.TxOutpoint(txid=bytes(32), out_idx=0))
+        transaction.parse_witness(s, txin)
+        self.assertEqual(witness, txin.witness)
+        self.assertEqual([b'', bytes(300), b'\x01'], txin.witness_elements())
+        self.assertEqual(b'\xff', s.read_bytes(1))
+        s = transaction.BCDataStream()
+        s.write(witness[:-1])
+        with self.assertRaises(transaction.SerializationError):
+            transaction.parse_witness(s, txin)
+
 
 class TestTransaction(ElectrumTestCase):
     def test_match_against_script_template(self):
@@ -992,3 +1034,95 @@ class TestSighashTypes(ElectrumTestCase):
         sig = tx.sign_txin(0, privkey, wallet=None)
         self.assertEqual('30440220525406a1482936d5a21888260dc165497a90a15669636d8edca6b9fe490d309c022032af0c646a34a44d1f4576bf6a4a74b67940f8faa84c7df9abe12a01a11e2b4783',
                          sig)
+
+
+def _legacy_preimage_reference(tx: PartialTransaction, txin_index: int) -> str:
+    # straightforward per-input serialization, as specified by the original sighash algorithm
+    inputs, outputs = tx.inputs(), tx.outputs()
+    txin = inputs[txin_index]
+    sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
+    preimage_script = txin.redeem_script
+    if sighash & Sighash.ANYONECANPAY:
+        txins = transaction.var_int(1) + txin.serialize_to_network(script_sig=preimage_script).hex()
+    else:
+        sers = []
+        for k, other in enumerate(inputs):
+            if (sighash & 0x1f) in (Sighash.NONE, Sighash.SINGLE) and k != txin_index:
+                other = PartialTxInput.from_txin(other, strip_witness=False)
+                other.nsequence = 0
+            sers.append(other.serialize_to_network(script_sig=preimage_script if k == txin_index else b"").hex())
+        txins = transaction.var_int(len(inputs)) + ''.join(sers)
+    if (sighash & 0x1f) == Sighash.NONE:
+        txouts = transaction.var_int(0)
+    elif (sighash & 0x1f) == Sighash.SINGLE:
+        sers = []
+        for k, txout in enumerate(outputs[:txin_index + 1]):
+            if k < txin_index:
+                txout = PartialTxOutput(scriptpubkey=b'', value=(1 << 64) - 1)
+            sers.append(txout.serialize_to_network().hex())
+        txouts = transaction.var_int(len(sers)) + ''.join(sers)
+    else:
+        txouts = transaction.var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
+    return (transaction.int_to_hex(tx.version, 4) + txins + txouts
+            + transaction.int_to_hex(tx.locktime, 4) + transaction.int_to_hex(sighash, 4))
+
+
+class TestLegacySighashTemplate(ElectrumTestCase):
+
+    def _make_tx(self, num_inputs: int, num_outputs: int) -> PartialTransaction:
+        inputs = []
+        for i in range(num_inputs):
+            txin = PartialTxInput(prevout=TxOutpoint(txid=bitcoin.sha256(bytes([i])), out_idx=i))
+            txin.nsequence = 0xffffffff - i
+            txin.redeem_script = bfh(construct_script([bytes([i]) * 33, opcodes.OP_CHECKSIG]))
+            inputs.append(txin)
+        outputs = [PartialTxOutput(scriptpubkey=bfh('76a914' + '%02x' % i * 20 + '88ac'), value=1000 * (i + 1))
+                   for i in range(num_outputs)]
+        return PartialTransaction.from_io(inputs, outputs, locktime=1234, version=2, BIP69_sort=False)
+
+    def test_preimage_matches_reference_for_all_sighash_types(self):
+        tx = self._make_tx(num_inputs=5, num_outputs=6)
+        template = tx._calc_legacy_sighash_template()
+        for sighash in (Sighash.ALL, Sighash.NONE, Sighash.SINGLE,
+                        Sighash.ALL | Sighash.ANYONECANPAY,
+                        Sighash.NONE | Sighash.ANYONECANPAY,
+                        Sighash.SINGLE | Sighash.ANYONECANPAY):
+            for i, txin in enumerate(tx.inputs()):
+                txin.sighash = sighash
+                expected = _legacy_preimage_reference(tx, i)
+                self.assertEqual(expected, tx.serialize_preimage(i, wallet=None))
+                self.assertEqual(expected, tx.serialize_preimage(i, wallet=None, legacy_sighash_template=template))
+
+    def test_sighash_single_needs_matching_output(self):
+        tx = self._make_tx(num_inputs=3, num_outputs=2)
+        tx.inputs()[2].sighash = Sighash.SINGLE
+        with self.assertRaises(Exception) as ctx:
+            tx.serialize_preimage(2, wallet=None)
+        self.assertIn('Not enough outputs for SIGHASH_SINGLE', str(ctx.exception))
+
+    def test_sign_txin_with_template(self):
+        tx = self._make_tx(num_inputs=4, num_outputs=1)
+        privkey = bfh('730fff80e1413068a05b57d6a58261f07551163369787f349438ea38ca80fac6')
+        template = tx._calc_legacy_sighash_template()
+        for i in range(4):
+            self.assertEqual(tx.sign_txin(i, privkey, wallet=None),
+                             tx.sign_txin(i, privkey, wallet=None, legacy_sighash_template=template))
+        pre_hash = sha256d(bfh(_legacy_preimage_reference(tx, 3)))
+        sig = bfh(tx.sign_txin(3, privkey, wallet=None))
+        self.assertTrue(ECPrivkey(privkey).verify_message_hash(ecc.sig_string_from_der_sig(sig[:-1]), pre_hash))
+
+    def test_sign_wide_tx_matches_sign_txin(self):
+        # enough inputs for the signing pool to be used
+        num_inputs = 3 * transaction.TX_SIGNING_CHUNK_SIZE + 1
+        privkeys = [sha256d(bytes([i])) for i in range(3)]
+        pubkeys = [ECPrivkey(k).get_public_key_hex(compressed=True) for k in privkeys]
+        tx = self._make_tx(num_inputs=num_inputs, num_outputs=2)
+        for i, txin in enumerate(tx.inputs()):
+            txin.redeem_script = None
+            txin.script_descriptor = descriptor.get_singlesig_descriptor_from_legacy_leaf(
+                pubkey=pubkeys[i % 3], script_type='p2pkh')
+        expected = [tx.sign_txin(i, privkeys[i % 3], wallet=None) for i in range(num_inputs)]
+        tx.sign({pk: (k, True) for pk, k in zip(pubkeys, privkeys)}, wallet=None)
+        self.assertTrue(tx.is_complete())
+        for i, txin in enumerate(tx.inputs()):
+            self.assertEqual([bfh(expected[i])], list(txin.part_sigs.values()))
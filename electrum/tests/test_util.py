@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+import threading
 from datetime import datetime
 from decimal import Decimal
 
@@ -435,3 +439,49 @@ class TestUtil(ElectrumTestCase):
                          util.age(from_date=now.timestamp()+103012200, since_date=now))
 
 
+
+    def test_lru_cache(self):
+        cache = util.LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.get('a'))  # 'b' is now least recently used
+        cache['c'] = 3
+        self.assertEqual(['a', 'c'], list(cache))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('x', cache.get('b', 'x'))
+        cache['a'] = 4
+        cache['d'] = 5
+        self.assertEqual({'a': 4, 'd': 5}, dict(cache))
+
+    def test_lru_cache_from_several_threads(self):
+        cache = util.LRUCache(maxsize=8)
+        errors = []
+        def run(offset):
+            try:
+                for i in range(20000):
+                    key = (i + offset) % 16
+                    cache[key] = i
+                    cache.get((key + 1) % 16)
+                    if i % 1000 == 0:
+                        cache.clear()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(offset,)) for offset in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        self.assertLessEqual(len(cache), 8)
+
+    def test_package_import_is_lazy(self):
+        # importing a single submodule must not load the wallet, network and lightning stacks
+        code = ("import sys, electrum.bitcoin; "
+                "print(','.join(m for m in ('electrum.wallet', 'electrum.network', 'electrum.commands', "
+                "'electrum.daemon', 'electrum.lnworker') if m in sys.modules))")
+        p = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                           cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        self.assertEqual('', p.stdout.strip())
+        # the re-exports still work
+        from electrum import Transaction, SimpleConfig, transaction
+        self.assertIs(transaction.Transaction, Transaction)
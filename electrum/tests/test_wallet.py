@@ -3,19 +3,24 @@ import tempfile
 import sys
 import os
 import json
+from datetime import datetime
 from decimal import Decimal
 import time
 from io import StringIO
 import asyncio
+from unittest import mock
 
-from electrum.storage import WalletStorage
+from electrum.storage import WalletStorage, StorageEncryptionVersion
 from electrum.wallet_db import FINAL_SEED_VERSION
 from electrum.wallet import (Abstract_Wallet, Standard_Wallet, create_new_wallet,
                              restore_wallet_from_text, Imported_Wallet, Wallet)
-from electrum.exchange_rate import ExchangeBase, FxThread
+from electrum.exchange_rate import ExchangeBase, FxThread, DailyRates
 from electrum.util import TxMinedInfo, InvalidPassword
+from electrum.transaction import Transaction, PartialTxOutput
+from electrum.address_synchronizer import TX_HEIGHT_UNCONFIRMED
 from electrum.bitcoin import COIN
 from electrum.wallet_db import WalletDB
+from electrum import json_db
 from electrum.simple_config import SimpleConfig
 from electrum import util
 
@@ -84,6 +89,32 @@ class TestWalletStorage(WalletTestCase):
         for key, value in some_dict.items():
             self.assertEqual(d[key], value)
 
+    def test_dump_chunks_equals_dump(self):
+        db = WalletDB('', storage=None, manual_upgrades=True)
+        db.put('seed_version', FINAL_SEED_VERSION)
+        db.put('a', {'x': [1, 2, {'y': None}], 'z': {'q': {'r': 'é\n'}}, 'empty': {}})
+        db.put('b', {})
+        db.put('c', {1: 'int keys', 2: True})
+        for human_readable in (True, False):
+            self.assertEqual(db.dump(human_readable=human_readable),
+                             ''.join(db.dump_chunks(human_readable=human_readable)))
+
+    def test_write_and_read_encrypted_file(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password('secret', enc_version=StorageEncryptionVersion.USER_PASSWORD)
+        db = WalletDB('', storage=storage, manual_upgrades=True)
+        db.put('seed_version', FINAL_SEED_VERSION)
+        db.put('labels', {'%064x' % i: 'label' * 40 for i in range(2000)})
+        db.write()
+
+        storage = WalletStorage(self.wallet_path)
+        self.assertTrue(storage.is_encrypted_with_user_pw())
+        with self.assertRaises(InvalidPassword):
+            storage.decrypt('wrong password')
+        storage.decrypt('secret')
+        db2 = WalletDB(storage.read(), storage=storage, manual_upgrades=True)
+        self.assertEqual(db.dump(), db2.dump())
+
 class FakeExchange(ExchangeBase):
     def __init__(self, rate):
         super().__init__(lambda self: None, lambda self: None)
@@ -113,9 +144,12 @@ class FakeWallet:
         self.db = WalletDB("{}", storage=None, manual_upgrades=True)
         self.adb = FakeADB()
         self.db.transactions = self.db.verified_tx = {'abc':'Tx'}
+        self._acquisition_prices = {}
+        self._price_memo_key = None
 
     default_fiat_value = Abstract_Wallet.default_fiat_value
     price_at_timestamp = Abstract_Wallet.price_at_timestamp
+    _forget_acquisition_prices = Abstract_Wallet._forget_acquisition_prices
     class storage:
         put = lambda self, x: None
 
@@ -154,6 +188,58 @@ class TestFiat(ElectrumTestCase):
         self.assertNotIn(ccy, self.fiat_value)
 
 
+class TestDailyRates(ElectrumTestCase):
+
+    def test_read_historical_rates_builds_index(self):
+        with open(os.path.join(self.electrum_path, 'FakeExchange_TEST'), 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'2024-01-01': '100.5', '2024-01-03': '102', '2024-01-04': 'garbage', 'bad': '1'}))
+        for _ in range(2):  # from json, then from the index
+            exchange = FakeExchange(Decimal('1'))
+            exchange.on_history = lambda: None
+            rates = exchange.read_historical_rates('TEST', self.electrum_path)
+            self.assertEqual(3, len(rates))
+            self.assertEqual(Decimal('100.5'), exchange.historical_rate('TEST', datetime(2024, 1, 1, 12)))
+            self.assertEqual(Decimal('102'), exchange.historical_rate('TEST', datetime(2024, 1, 3)))
+            for day in (datetime(2023, 12, 31), datetime(2024, 1, 2), datetime(2024, 1, 4), datetime(2024, 1, 5)):
+                self.assertTrue(exchange.historical_rate('TEST', day).is_nan())
+            self.assertTrue(exchange.historical_rate('OTHER', datetime(2024, 1, 1)).is_nan())
+        self.assertTrue(os.path.exists(os.path.join(self.electrum_path, 'FakeExchange_TEST.rates')))
+        self.assertIsInstance(rates._rates, memoryview)
+
+    async def test_save_history_twice_to_the_same_index(self):
+        exchange = FakeExchange(Decimal('1'))
+        exchange.on_history = lambda: None
+        day = datetime(2024, 1, 1)
+        for rate in ('100', '200'):
+            async def request_history(ccy, rate=rate):
+                return {'2024-01-01': rate}
+            exchange.request_history = request_history
+            await exchange.get_historical_rates_safe('TEST', self.electrum_path)
+            self.assertEqual(Decimal(rate), exchange.historical_rate('TEST', day))
+            # load the index from disk, mapped, as on the next start
+            exchange._history.clear()
+            rates = exchange.read_historical_rates('TEST', self.electrum_path)
+            self.assertIsInstance(rates._rates, memoryview)
+            self.assertEqual(Decimal(rate), exchange.historical_rate('TEST', day))
+        # the mapping is closed before the index is replaced
+        real_replace = os.replace
+        def replace(src, dst):
+            self.assertIsNone(rates._buf)
+            real_replace(src, dst)
+        exchange.request_history = request_history
+        with mock.patch.object(os, 'replace', replace):
+            await exchange.get_historical_rates_safe('TEST', self.electrum_path)
+        self.assertTrue(rates.get(day.date()).is_nan())
+        self.assertEqual(Decimal('200'), exchange.historical_rate('TEST', day))
+
+    def test_empty_rates(self):
+        path = os.path.join(self.electrum_path, 'rates')
+        DailyRates.from_dict({}).write(path)
+        rates = DailyRates.read(path)
+        self.assertEqual(0, len(rates))
+        self.assertTrue(rates.get(datetime(2024, 1, 1).date()).is_nan())
+
+
 class TestCreateRestoreWallet(WalletTestCase):
 
     async def test_create_new_wallet(self):
@@ -176,6 +262,33 @@ class TestCreateRestoreWallet(WalletTestCase):
         self.assertEqual(d['seed'], wallet.keystore.get_seed(password))
         self.assertEqual(encrypt_file, wallet.storage.is_encrypted())
 
+    async def test_create_new_wallet_with_lightning_disabled(self):
+        self.config.LIGHTNING_ENABLED = False
+        d = create_new_wallet(path=self.wallet_path, gap_limit=1, config=self.config)
+        wallet = d['wallet']  # type: Standard_Wallet
+        # the key is still derived, so that lightning can be enabled later
+        self.assertTrue(wallet.db.get('lightning_xprv').startswith('zprv'))
+        self.assertIsNone(wallet.lnworker)
+        self.assertFalse(wallet.has_lightning())
+        self.assertFalse(wallet.can_have_lightning())
+        # re-enabling lightning brings the lnworker back on the next load
+        self.config.LIGHTNING_ENABLED = True
+        wallet2 = Standard_Wallet(wallet.db, config=self.config)
+        self.assertIsNotNone(wallet2.lnworker)
+
+    async def test_lightning_disabled_keeps_lnworker_of_wallet_with_channels(self):
+        d = create_new_wallet(path=self.wallet_path, gap_limit=1, config=self.config)
+        wallet = d['wallet']  # type: Standard_Wallet
+        wallet.db.get_dict('channels')['00' * 32] = {}
+        self.config.LIGHTNING_ENABLED = False
+        from electrum import lnworker
+        with mock.patch.object(lnworker, 'Channel'):
+            with self.assertLogs(level='WARNING') as logs:
+                wallet2 = Standard_Wallet(wallet.db, config=self.config)
+        self.assertIsNotNone(wallet2.lnworker)
+        self.assertTrue(wallet2.can_have_lightning())
+        self.assertIn('has channels', logs.output[0])
+
     async def test_restore_wallet_from_text_mnemonic(self):
         text = 'bitter grass shiver impose acquire brush forget axis eager alone wine silver'
         passphrase = 'mypassphrase'
@@ -238,6 +351,21 @@ class TestCreateRestoreWallet(WalletTestCase):
         wallet.delete_address('yc1qnp78h78vp92pwdwq5xvh8eprlga5q8gutptt0q')
         self.assertEqual(1, len(wallet.get_receiving_addresses()))
 
+    async def test_delete_address_changes_state_version(self):
+        text = 'yc1q2ccr34wzep58d4239tl3x3734ttle92aktd2uk yc1qnp78h78vp92pwdwq5xvh8eprlga5q8gutptt0q'
+        wallet = restore_wallet_from_text(text, path=self.wallet_path, config=self.config)['wallet']
+        # a tx that is also referenced by the remaining address is not removed
+        for addr in text.split():
+            wallet.db.set_addr_history(addr, [('11' * 32, 100)])
+        version, addresses = wallet.get_snapshot('addresses', wallet.get_addresses)
+        self.assertEqual(2, len(addresses))
+        wallet.delete_address('yc1qnp78h78vp92pwdwq5xvh8eprlga5q8gutptt0q')
+        self.assertNotEqual(version, wallet.get_state_version())
+        self.assertEqual(1, len(wallet.get_snapshot('addresses', wallet.get_addresses)[1]))
+        # tokens of another load of the same wallet differ
+        wallet2 = restore_wallet_from_text(text, path=None, config=self.config)['wallet']
+        self.assertNotEqual(wallet2.get_state_version(), wallet.get_state_version())
+
     async def test_restore_wallet_from_text_privkeys(self):
         text = 'p2wpkh:L4jkdiXszG26SUYvwwJhzGwg37H2nLhrbip7u6crmgNeJysv5FHL p2wpkh:L24GxnN7NNUAfCXA6hFzB1jt59fYAAiFZMcLaJ2ZSawGpM3uqhb1'
         d = restore_wallet_from_text(text, path=self.wallet_path, config=self.config)
@@ -306,3 +434,179 @@ class TestWalletPassword(WalletTestCase):
         with self.assertRaises(InvalidPassword):
             wallet.check_password("wrong password")
         wallet.check_password("1234")
+
+
+class TestWalletDBTables(WalletTestCase):
+
+    TXID1 = '11' * 32
+    TXID2 = '22' * 32
+    TXID3 = '33' * 32
+    HEADER_HASH = '00000000ab' + 'cd' * 27
+    ADDR1 = 'yc1qnyszy28jh59v6j5c3vxkehl62tlrfa9aedq352'
+    ADDR2 = 'yc1qzmj300t38dfwjnmjx2hm52ruld35mlc4xsg8cv'
+
+    def _make_db(self) -> WalletDB:
+        data = json.loads('{"addresses":{},"keystore":{"keypairs":{},"pw_hash_version":1,"type":"imported"},"seed_version":1,"transactions":{},"tx_fees":{},"txi":{},"txo":{},"use_encryption":false,"wallet_type":"imported"}')
+        data['addr_history'] = {
+            self.ADDR1: [[self.TXID1, 100], [self.TXID2, -1]],
+            self.ADDR2: [],
+            'old_address': ['*'],
+        }
+        data['verified_tx3'] = {
+            self.TXID1: [100, 1700000000, 3, self.HEADER_HASH],
+            self.TXID3: [101, None, 1, self.HEADER_HASH],
+        }
+        self.data = data
+        return WalletDB(json.dumps(data), storage=None, manual_upgrades=False)
+
+    def test_json_unchanged(self):
+        db = self._make_db()
+        for human_readable in (True, False):
+            dumped = json.loads(db.dump(human_readable=human_readable))
+            self.assertEqual(self.data['addr_history'], dumped['addr_history'])
+            self.assertEqual(self.data['verified_tx3'], dumped['verified_tx3'])
+            self.assertEqual(db.dump(human_readable=human_readable),
+                             ''.join(db.dump_chunks(human_readable=human_readable)))
+
+    def test_dump_chunks_of_large_tables(self):
+        db = self._make_db()
+        for i in range(3000):
+            txid = i.to_bytes(32, 'big').hex()
+            db.set_addr_history(f'address_{i}', [(txid, 100 + i)])
+            db.add_verified_tx(txid, TxMinedInfo(height=100 + i, timestamp=1700000000 + i, txpos=1,
+                                                 header_hash=self.HEADER_HASH))
+        for human_readable in (True, False):
+            with db.lock:
+                chunks = list(db.dump_chunks(human_readable=human_readable))
+            self.assertGreater(len(chunks), 2 * 3000 // json_db.JSON_CHUNK_ITEMS)
+            self.assertLess(max(len(c) for c in chunks), 100_000)
+            self.assertEqual(db.dump(human_readable=human_readable), ''.join(chunks))
+
+    def test_verified_tx(self):
+        db = self._make_db()
+        self.assertEqual(TxMinedInfo(height=100, timestamp=1700000000, txpos=3, header_hash=self.HEADER_HASH),
+                         db.get_verified_tx(self.TXID1))
+        self.assertEqual(TxMinedInfo(height=101, timestamp=None, txpos=1, header_hash=self.HEADER_HASH),
+                         db.get_verified_tx(self.TXID3))
+        self.assertIsNone(db.get_verified_tx(self.TXID2))
+        db.add_verified_tx(self.TXID2, TxMinedInfo(height=102, timestamp=1700000600, txpos=1, header_hash=self.HEADER_HASH))
+        db.remove_verified_tx(self.TXID1)  # not the last row
+        self.assertFalse(db.is_in_verified_tx(self.TXID1))
+        self.assertEqual(102, db.get_verified_tx(self.TXID2).height)
+        self.assertEqual({self.TXID2, self.TXID3}, set(db.list_verified_tx()))
+        db.add_verified_tx(self.TXID2, TxMinedInfo(height=103, timestamp=1700001200, txpos=2, header_hash=self.HEADER_HASH))
+        self.assertEqual([103, 1700001200, 2, self.HEADER_HASH],
+                         json.loads(db.dump())['verified_tx3'][self.TXID2])
+        db.clear_history()
+        self.assertEqual([], db.list_verified_tx())
+
+    def test_addr_history(self):
+        db = self._make_db()
+        self.assertEqual([(self.TXID1, 100), (self.TXID2, -1)], db.get_addr_history(self.ADDR1))
+        self.assertEqual([], db.get_addr_history(self.ADDR2))
+        self.assertEqual(['*'], db.get_addr_history('old_address'))
+        self.assertEqual([], db.get_addr_history('unknown'))
+        self.assertTrue(db.is_addr_in_history(self.ADDR2))
+        db.set_modified(False)
+        db.set_addr_history(self.ADDR2, [(self.TXID3, 101)])
+        self.assertTrue(db.modified())
+        self.assertEqual([(self.TXID3, 101)], db.get_addr_history(self.ADDR2))
+        db.remove_addr_history(self.ADDR1)
+        self.assertEqual({self.ADDR2, 'old_address'}, set(db.get_history()))
+        self.assertEqual([[self.TXID3, 101]], json.loads(db.dump())['addr_history'][self.ADDR2])
+
+
+class TestAcquisitionPrices(WalletTestCase):
+    TESTNET = True
+
+    async def test_acquisition_prices_are_saved_until_reorg(self):
+        text = 'cross end slow expose giraffe fuel track awake turtle capital ranch pulp'
+        wallet = restore_wallet_from_text(text, path=self.wallet_path, gap_limit=2, config=self.config)['wallet']
+        funding_tx = Transaction('0200000000010132515e6aade1b79ec7dd3bac0896d8b32c56195d23d07d48e21659cef24301560100000000fdffffff0112841e000000000016001477fe6d2a27e8860c278d4d2cd90bad716bb9521a02473044022041ed68ef7ef122813ac6a5e996b8284f645c53fbe6823b8e430604a8915a867802203233f5f4d347a687eb19b2aa570829ab12aeeb29a24cc6d6d20b8b3d79e971ae012102bee0ee043817e50ac1bb31132770f7c41e35946ccdcb771750fb9696bdd1b307ad951d00')
+        wallet.adb.receive_tx_callback(funding_tx.txid(), funding_tx, 1000)
+        wallet.adb.add_verified_tx(funding_tx.txid(), TxMinedInfo(height=1000, timestamp=1700000000, txpos=1, header_hash='01'*32))
+        outputs = [PartialTxOutput.from_address_and_value(wallet.get_receiving_addresses()[1], 10000)]
+        tx = wallet.mktx(outputs=outputs, fee=5000)
+        wallet.adb.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
+        timestamps = []
+
+        def price_func(timestamp):
+            timestamps.append(timestamp)
+            return Decimal('1000') if timestamp == 1700000000 else Decimal('2000')
+
+        self.assertEqual(Decimal('1000'), wallet.average_price(tx.txid(), price_func, 'TEST', exchange='ExchangeA'))
+        self.assertEqual(Decimal('1000'), wallet.average_price(tx.txid(), price_func, 'TEST', exchange='ExchangeA'))
+        self.assertEqual([1700000000], timestamps)
+        saved = wallet.db.get('acquisition_prices')['TEST']['ExchangeA']
+        self.assertEqual([tx.txid()], list(saved.keys()))
+        self.assertEqual(Decimal('1000'), Decimal(saved[tx.txid()]))
+        # the prices of another exchange are not reused
+        other_price_func = lambda timestamp: Decimal('3000')
+        self.assertEqual(Decimal('3000'), wallet.average_price(tx.txid(), other_price_func, 'TEST', exchange='ExchangeB'))
+        self.assertEqual(Decimal('1000'), wallet.average_price(tx.txid(), price_func, 'TEST', exchange='ExchangeA'))
+        # after a reorg, the price is based on the new timestamp of the funding tx
+        wallet.adb.undo_verifications(mock.Mock(read_header=lambda height: None), 999)
+        self.assertNotIn('TEST', wallet.db.get('acquisition_prices'))
+        self.assertEqual(Decimal('2000'), wallet.average_price(tx.txid(), price_func, 'TEST', exchange='ExchangeA'))
+        # unconfirmed prices are not saved
+        self.assertNotIn('TEST', wallet.db.get('acquisition_prices'))
+
+    async def test_saved_prices_are_forgotten_when_a_parent_arrives_late(self):
+        text = 'cross end slow expose giraffe fuel track awake turtle capital ranch pulp'
+        wallet = restore_wallet_from_text(text, path=self.wallet_path, gap_limit=2, config=self.config)['wallet']
+        funding_tx = Transaction('0200000000010132515e6aade1b79ec7dd3bac0896d8b32c56195d23d07d48e21659cef24301560100000000fdffffff0112841e000000000016001477fe6d2a27e8860c278d4d2cd90bad716bb9521a02473044022041ed68ef7ef122813ac6a5e996b8284f645c53fbe6823b8e430604a8915a867802203233f5f4d347a687eb19b2aa570829ab12aeeb29a24cc6d6d20b8b3d79e971ae012102bee0ee043817e50ac1bb31132770f7c41e35946ccdcb771750fb9696bdd1b307ad951d00')
+        txs = [(funding_tx, 1000, 1700000000)]
+        wallet.adb.receive_tx_callback(funding_tx.txid(), funding_tx, 1000)
+        for height, timestamp in ((1001, 1700100000), (1002, 1700200000)):
+            outputs = [PartialTxOutput.from_address_and_value(wallet.get_receiving_addresses()[1], 10000)]
+            tx = wallet.mktx(outputs=outputs, fee=5000)
+            txs.append((tx, height, timestamp))
+            wallet.adb.receive_tx_callback(tx.txid(), tx, height)
+        prices = {1700000000: Decimal('1000'), 1700100000: Decimal('2000'), 1700200000: Decimal('3000')}
+        price_func = lambda timestamp: prices[timestamp]
+        # a fresh wallet gets the child and grandchild before their parent
+        wallet2 = restore_wallet_from_text(text, path=None, gap_limit=2, config=self.config)['wallet']
+        for tx, height, timestamp in txs[1:] + txs[:1]:
+            wallet2.adb.receive_tx_callback(tx.txid(), tx, height)
+            wallet2.adb.add_verified_tx(tx.txid(), TxMinedInfo(height=height, timestamp=timestamp, txpos=1, header_hash='01'*32))
+            if tx is txs[2][0]:
+                # without the parent, the child looks like it was received at its own timestamp
+                self.assertEqual(Decimal('2000'), wallet2.average_price(tx.txid(), price_func, 'TEST', exchange='ExchangeA'))
+        self.assertEqual(Decimal('1000'), wallet2.average_price(txs[2][0].txid(), price_func, 'TEST', exchange='ExchangeA'))
+
+
+class TestBalanceSeries(WalletTestCase):
+    TESTNET = True
+
+    async def test_balance_series_is_maintained_incrementally(self):
+        text = 'cross end slow expose giraffe fuel track awake turtle capital ranch pulp'
+        wallet = restore_wallet_from_text(text, path=self.wallet_path, gap_limit=2, config=self.config)['wallet']
+        funding_tx = Transaction('0200000000010132515e6aade1b79ec7dd3bac0896d8b32c56195d23d07d48e21659cef24301560100000000fdffffff0112841e000000000016001477fe6d2a27e8860c278d4d2cd90bad716bb9521a02473044022041ed68ef7ef122813ac6a5e996b8284f645c53fbe6823b8e430604a8915a867802203233f5f4d347a687eb19b2aa570829ab12aeeb29a24cc6d6d20b8b3d79e971ae012102bee0ee043817e50ac1bb31132770f7c41e35946ccdcb771750fb9696bdd1b307ad951d00')
+        wallet.adb.receive_tx_callback(funding_tx.txid(), funding_tx, 1000)
+        wallet.adb.add_verified_tx(funding_tx.txid(), TxMinedInfo(height=1000, timestamp=1700000000, txpos=1, header_hash='01'*32))
+        self.assertEqual([1999890], list(wallet.get_balance_series().balances))
+        outputs = [PartialTxOutput.from_address_and_value(wallet.get_receiving_addresses()[1], 10000)]
+        tx = wallet.mktx(outputs=outputs, fee=5000)
+        with mock.patch.object(wallet, '_build_balance_series', wraps=wallet._build_balance_series) as build:
+            wallet.adb.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
+            self.assertEqual(1, len(wallet.get_balance_series()))
+            wallet.adb.add_verified_tx(tx.txid(), TxMinedInfo(height=1001, timestamp=1700000600, txpos=1, header_hash='02'*32))
+            series = wallet.get_balance_series()
+            self.assertEqual(0, build.call_count)
+        balance = 1999890 - tx.get_fee()
+        self.assertEqual([1999890, balance], list(series.balances))
+        self.assertEqual([1000, 1001], list(series.heights))
+        for timestamp in (1699999999, 1700000000, 1700000300, 1700000600):
+            self.assertEqual(wallet.balance_at_timestamp(wallet.get_addresses(), timestamp),
+                             wallet.balance_at_timestamp(None, timestamp))
+        self.assertEqual(1999890, series.balance_at_height(1000))
+        self.assertEqual([(1700000000, 1999890), (1700000300, 1999890), (1700000600, balance)], series.downsample(3))
+        self.assertEqual((0, tx.get_fee()), series.flow(1700000001))
+        summary = wallet.get_balance_summary(from_timestamp=1700000001)
+        self.assertEqual(1999890, summary['begin']['BTC_balance'].value)
+        self.assertEqual(balance, summary['end']['BTC_balance'].value)
+        self.assertEqual(tx.get_fee(), summary['flow']['BTC_outgoing'].value)
+        # reorg
+        wallet.adb.undo_verifications(mock.Mock(read_header=lambda height: None), 1000)
+        self.assertEqual([1999890], list(wallet.get_balance_series().balances))
+        self.assertEqual(0, len(wallet.get_balance_series('SOMEASSET')))
@@ -15,10 +15,11 @@ from electrum.wallet import (sweep, Multisig_Wallet, Standard_Wallet, Imported_W
                              restore_wallet_from_text, Abstract_Wallet, CannotBumpFee)
 from electrum.util import (
     bfh, NotEnoughFunds, UnrelatedTransactionException,
-    UserFacingException)
+    UserFacingException, InvalidPassword)
 from electrum.transaction import (TxOutput, Transaction, PartialTransaction, PartialTxOutput,
                                   PartialTxInput, tx_from_any, TxOutpoint)
 from electrum.mnemonic import seed_type
+from electrum.descriptor import PubkeyProvider
 from electrum.network import Network
 
 try:
@@ -110,6 +111,58 @@ class TestWalletKeystoreAddressIntegrityForMainnet(ElectrumTestCase):
         self.assertEqual(w.get_receiving_addresses()[0], 'YkjohN2UvzdcRe4Fy7PxphqQfJ8rUrhYmc')
         self.assertEqual(w.get_change_addresses()[0], 'Yhoho1cAYNVrd4UF9u1AhUn3BVaQC4sFAb')
 
+    def test_bip32_keystore_get_private_keys_in_bulk(self):
+        seed_words = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+        ks = keystore.from_seed(seed_words, '', False)
+        ks.update_password(None, 'secret')
+        derivations = {ks.derive_pubkey(for_change, n).hex(): [for_change, n]
+                       for for_change in (0, 1) for n in range(5)}
+        keypairs = ks._get_private_keys(derivations, 'secret')
+        self.assertEqual(derivations.keys(), keypairs.keys())
+        for pubkey, sequence in derivations.items():
+            self.assertEqual(ks.get_private_key(sequence, 'secret'), keypairs[pubkey])
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_bip32_keystore_derivation_caches(self, mock_save_db):
+        seed_words = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+        ks = keystore.from_seed(seed_words, '', False)
+        xpub = ks.get_master_public_key()
+        for for_change, n in [(0, 0), (1, 3), (0, 0)]:
+            self.assertEqual(keystore.Xpub.get_pubkey_from_xpub(xpub, (for_change, n)), ks.derive_pubkey(for_change, n))
+        self.assertEqual(ks.get_bip32_node_for_xpub().eckey.get_public_key_bytes(), ks.get_pubkey_at_path(()))
+        provider = ks.get_pubkey_provider([1, 3])
+        self.assertEqual(ks.derive_pubkey(1, 3), provider.get_pubkey_bytes())
+        self.assertEqual(provider.to_string(), PubkeyProvider.parse(provider.to_string()).to_string())
+        # private nodes: a wrong password still fails with a warm cache
+        ks.update_password(None, 'secret')
+        privkey = ks.get_private_key([0, 5], 'secret')
+        self.assertTrue(ks._private_nodes)
+        with self.assertRaises(InvalidPassword):
+            ks.get_private_key([0, 5], 'wrong')
+        self.assertEqual(privkey, ks.get_private_key([0, 5], 'secret'))
+        # ... and they are forgotten on timeout and on lock
+        ks._private_nodes_expiry = 0
+        self.assertEqual(privkey, ks.get_private_key([0, 5], 'secret'))
+        self.assertEqual(privkey, ks._get_private_keys({'': [0, 5]}, 'secret')[''])
+        ks.clear_private_key_cache()
+        self.assertFalse(ks._private_nodes)
+        w = WalletIntegrityHelper.create_standard_wallet(ks, config=self.config)
+        w.get_keystore().get_private_key([0, 0], 'secret')
+        self.assertTrue(w.get_keystore()._private_nodes)
+        w.unlock(None)
+        self.assertFalse(w.get_keystore()._private_nodes)
+
+    def test_bip32_private_nodes_are_wiped_on_timeout(self):
+        ks = keystore.from_seed('cycle rocket west magnet parrot shuffle foot correct salt library feed song', '', False)
+        ks.update_password(None, 'secret')
+        with mock.patch.object(keystore, 'BIP32_PRIVATE_NODE_CACHE_TIMEOUT', 0.05):
+            ks.get_private_key([0, 5], 'secret')
+            self.assertTrue(ks._private_nodes)
+            ks._private_nodes_timer.join(timeout=5)
+        # no further call was needed
+        self.assertFalse(ks._private_nodes)
+        self.assertIsNone(ks._private_nodes_xprv_hash)
+
     @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
     async def test_electrum_seed_segwit(self, mock_save_db):
         seed_words = 'bitter grass shiver impose acquire brush forget axis eager alone wine silver'
@@ -2948,6 +3001,78 @@ class TestWalletSending(ElectrumTestCase):
         with self.assertRaises(bitcoin.DummyAddressUsedInTxException):
             wallet1.sign_transaction(tx, password=None)
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_get_spendable_coins_by_asset(self, mock_save_db):
+        wallet1 = self.create_standard_wallet_from_seed('bitter grass shiver impose acquire brush forget axis eager alone wine silver')
+        wallet1.adb.db.add_asset_to_watch('INDEXED')  # there is no synchronizer
+        addr0, addr1 = wallet1.get_receiving_addresses()[:2]
+
+        def make_tx(prevout: TxOutpoint, outputs) -> Transaction:
+            txin = PartialTxInput(prevout=prevout)
+            txin.script_sig = b''
+            return Transaction(PartialTransaction.from_io([txin], outputs, BIP69_sort=False).serialize_to_network())
+
+        funding_tx = make_tx(TxOutpoint(txid=bytes(range(32)), out_idx=0), [
+            PartialTxOutput.from_address_and_value(addr0, 1_000_000),
+            PartialTxOutput.from_address_and_value(addr1, 500, asset='INDEXED'),
+        ])
+        wallet1.adb.receive_tx_callback(funding_tx.txid(), funding_tx, 1000)
+
+        coins = wallet1.get_spendable_coins(assets={'INDEXED'})
+        self.assertEqual([(TxOutpoint.from_str(funding_tx.txid() + ':1'), addr1, 500)],
+                         [(c.prevout, c.address, c.value_sats(asset_aware=True)) for c in coins])
+        self.assertEqual(1000, coins[0].block_height)
+        self.assertEqual(['INDEXED'], [c.asset for c in coins])
+        self.assertEqual([1_000_000], [c.value_sats() for c in wallet1.get_spendable_coins(assets={None})])
+        self.assertEqual({c.prevout for c in wallet1.get_spendable_coins()},
+                         {c.prevout for c in wallet1.get_spendable_coins(assets={None, 'INDEXED'})})
+        self.assertEqual([], wallet1.get_spendable_coins(domain=[addr0], assets={'INDEXED'}))
+        self.assertEqual([], wallet1.get_spendable_coins(assets={'OTHER'}))
+        wallet1.set_frozen_state_of_addresses([addr1], True)
+        self.assertEqual([], wallet1.get_spendable_coins(assets={'INDEXED'}))
+        wallet1.set_frozen_state_of_addresses([addr1], False)
+
+        # spending the asset coin removes it from the index, removing the spending tx brings it back
+        spending_tx = make_tx(coins[0].prevout, [
+            PartialTxOutput.from_address_and_value(bitcoin.DummyAddress.CHANNEL, 500, asset='INDEXED')])
+        wallet1.adb.receive_tx_callback(spending_tx.txid(), spending_tx, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual([], wallet1.get_spendable_coins(assets={'INDEXED'}))
+        self.assertEqual(1, len(wallet1.get_spendable_coins(assets={None})))
+        wallet1.adb.remove_transaction(spending_tx.txid())
+        self.assertEqual([coins[0].prevout], [c.prevout for c in wallet1.get_spendable_coins(assets={'INDEXED'})])
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_is_mine_txo(self, mock_save_db):
+        wallet1 = self.create_standard_wallet_from_seed('bitter grass shiver impose acquire brush forget axis eager alone wine silver')
+        addr0 = wallet1.get_receiving_addresses()[0]
+        self.assertTrue(wallet1.is_mine_txo(PartialTxOutput.from_address_and_value(addr0, 1000)))
+        self.assertTrue(wallet1.is_mine_txo(PartialTxOutput.from_address_and_value(addr0, 1000, asset='ASSET')))
+        self.assertFalse(wallet1.is_mine_txo(PartialTxOutput.from_address_and_value(bitcoin.DummyAddress.CHANNEL, 1000)))
+        self.assertFalse(wallet1.is_mine_txo(PartialTxOutput(scriptpubkey=bytes([bitcoin.opcodes.OP_RETURN]), value=0)))
+        # addresses created after the pre-filter was built
+        new_addr = wallet1.create_new_address(for_change=False)
+        self.assertTrue(wallet1.is_mine_txo(PartialTxOutput.from_address_and_value(new_addr, 1000)))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_get_address_version(self, mock_save_db):
+        wallet1 = self.create_standard_wallet_from_seed('bitter grass shiver impose acquire brush forget axis eager alone wine silver')
+        addr0, addr1 = wallet1.get_receiving_addresses()[:2]
+        versions = lambda: (wallet1.adb.get_address_version(addr0), wallet1.adb.get_address_version(addr1))
+        self.assertEqual((0, 0), versions())
+        txin = PartialTxInput(prevout=TxOutpoint(txid=bytes(range(32)), out_idx=0))
+        txin.script_sig = b''
+        funding_tx = Transaction(PartialTransaction.from_io(
+            [txin], [PartialTxOutput.from_address_and_value(addr0, 1_000_000)], BIP69_sort=False).serialize_to_network())
+        wallet1.adb.receive_tx_callback(funding_tx.txid(), funding_tx, 1000)
+        v0, v1 = versions()
+        self.assertGreater(v0, 0)
+        self.assertEqual(0, v1)
+        # unrelated changes keep the version
+        wallet1.set_label(addr0, 'label')
+        self.assertEqual((v0, v1), versions())
+        wallet1.adb.remove_transaction(funding_tx.txid())
+        self.assertGreater(wallet1.adb.get_address_version(addr0), v0)
+
 
 class TestWalletOfflineSigning(ElectrumTestCase):
     TESTNET = True
@@ -3800,6 +3925,57 @@ class TestWalletHistory_EvilGapLimit(ElectrumTestCase):
         w.synchronize()
         self.assertEqual(9999788, sum(w.get_balance()))
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_gap_limit_tracking(self, mock_save_db):
+        w = self.create_wallet()
+        old_addrs = set()
+        w.adb.address_is_old = lambda addr, **kwargs: addr in old_addrs
+
+        def beyond_gap_limit_reference(addrs, gap_limit):
+            found, num_unused = set(), 0
+            for addr in addrs:
+                if w.db.get_addr_history(addr):
+                    num_unused = 0
+                else:
+                    if num_unused >= gap_limit:
+                        found.add(addr)
+                    num_unused += 1
+            return found
+
+        def use(n, *, is_old=True):
+            addr = w.get_receiving_addresses()[n]
+            w.db.set_addr_history(addr, [('00' * 32, 1316912)])
+            if is_old:
+                old_addrs.add(addr)
+
+        self.assertEqual(20, len(w.get_receiving_addresses()))
+        self.assertEqual(1, w.min_acceptable_gap())
+        use(3, is_old=False)
+        self.assertEqual(0, w.synchronize())
+        self.assertEqual(5, w.min_acceptable_gap())
+        old_addrs.add(w.get_receiving_addresses()[3])
+        self.assertEqual(4, w.synchronize())
+        self.assertEqual(4, w.min_acceptable_gap())
+        use(20)
+        use(9, is_old=False)
+        self.assertEqual(17, w.synchronize())
+        self.assertEqual(41, len(w.get_receiving_addresses()))
+        self.assertEqual(0, w.synchronize())
+        self.assertEqual(17, w.min_acceptable_gap())
+        self.assertEqual([3, 9, 20], w.db.get_used_address_indexes(False))
+        self.assertEqual([20], w.db.get_used_address_indexes(False, start=10))
+
+        w.gap_limit = 4
+        expected = beyond_gap_limit_reference(w.get_receiving_addresses(), 4)
+        expected |= beyond_gap_limit_reference(w.get_change_addresses(), w.gap_limit_for_change)
+        self.assertEqual(expected, w.get_all_known_addresses_beyond_gap_limit())
+        self.assertIn(w.get_receiving_addresses()[14], expected)
+
+        w.db.remove_addr_history(w.get_receiving_addresses()[9])
+        w.db.set_addr_history(w.get_receiving_addresses()[20], [])
+        self.assertEqual([3], w.db.get_used_address_indexes(False))
+        self.assertEqual([], w.db.get_used_address_indexes(True))
+
 
 class TestWalletHistory_DoubleSpend(ElectrumTestCase):
     TESTNET = True
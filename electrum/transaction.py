@@ -30,8 +30,10 @@
 import struct
 import traceback
 import sys
+import os
 import io
 import base64
+import concurrent.futures
 from typing import (Sequence, Union, NamedTuple, Tuple, Optional, Iterable, Mapping,
                     Callable, List, Dict, Set, TYPE_CHECKING)
 from collections import defaultdict
@@ -49,7 +51,7 @@ from .bitcoin import (TYPE_ADDRESS, TYPE_SCRIPT, hash_160,
                       int_to_hex, push_script, b58_address_to_hash160,
                       opcodes, add_number_to_script, base_decode,
                       base_encode, construct_witness, construct_script)
-from .crypto import sha256d
+from .crypto import sha256d, sha256d_chunks
 from .logging import get_logger
 from .util import ShortID, OldTaskGroup, convert_bytes_to_utf8_safe
 from .bitcoin import DummyAddress
@@ -65,6 +67,44 @@ _logger = get_logger(__name__)
 DEBUG_PSBT_PARSING = False
 
 
+# Sighashes and signatures of wide txs are computed on this pool. hashlib releases the GIL
+# for large buffers, and ecc calls into libsecp256k1 via ctypes, which releases it too.
+_tx_signing_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=min(8, os.cpu_count() or 1),
+    thread_name_prefix='tx_signing_thread',
+)
+TX_SIGNING_CHUNK_SIZE = 25
+
+
+class _TxinSigningJob(NamedTuple):
+    txin_index: int
+    keys: Sequence[Tuple[str, bytes]]  # (pubkey_hex, privkey_bytes), in txin.pubkeys order
+    sighash: int
+    preimage_chunks: Sequence[Union[bytes, memoryview]]
+
+
+def _sign_hashed_preimage(pre_hash: bytes, privkey_bytes: bytes, sighash: int) -> str:
+    sig = ecc.ECPrivkey(privkey_bytes).sign_transaction(pre_hash)
+    return sig.hex() + Sighash.to_sigbytes(sighash).hex()
+
+
+def _run_signing_job(job: _TxinSigningJob) -> Sequence[str]:
+    pre_hash = sha256d_chunks(job.preimage_chunks)
+    return [_sign_hashed_preimage(pre_hash, privkey, job.sighash) for _, privkey in job.keys]
+
+
+def _run_signing_jobs(jobs: Sequence[_TxinSigningJob]) -> List[Sequence[str]]:
+    """Returns the signatures of each job, in order. Large batches run in parallel."""
+    if len(jobs) <= TX_SIGNING_CHUNK_SIZE:
+        return [_run_signing_job(job) for job in jobs]
+    def run_chunk(chunk: Sequence[_TxinSigningJob]) -> List[Sequence[str]]:
+        return [_run_signing_job(job) for job in chunk]
+    futures = [
+        _tx_signing_executor.submit(run_chunk, jobs[i:i + TX_SIGNING_CHUNK_SIZE])
+        for i in range(0, len(jobs), TX_SIGNING_CHUNK_SIZE)]
+    return [sigs for fut in futures for sigs in fut.result()]
+
+
 _NEEDS_RECALC = ...  # sentinel value
 
 
@@ -253,6 +293,22 @@ class BIP143SharedTxDigestFields(NamedTuple):
     hashOutputs: str
 
 
+# length of a txin serialized with an empty scriptSig: outpoint(36) + var_int(0) + nsequence(4)
+LEGACY_BLANK_TXIN_LEN = 41
+
+
+class LegacySighashTemplate(NamedTuple):
+    """Parts of the pre-segwit sighash preimage that do not depend on the input being signed.
+    The txins fields hold every input serialized with an empty scriptSig, so the slot
+    of input k starts at offset k * LEGACY_BLANK_TXIN_LEN.
+    """
+    num_inputs: bytes  # var_int
+    txins: bytes
+    txins_zero_nsequence: bytes  # for SIGHASH_NONE and SIGHASH_SINGLE
+    outputs: Sequence[bytes]  # each output serialized, for SIGHASH_SINGLE
+    txouts: bytes  # var_int(len(outputs)) + outputs
+
+
 class TxOutpoint(NamedTuple):
     txid: bytes  # endianness same as hex string displayed; reverse of tx serialization order
     out_idx: int
@@ -475,11 +531,22 @@ class TxInput:
         return self.utxo is not None
 
 
+# precompiled, little-endian integer formats of BCDataStream
+_STRUCT_INT16 = struct.Struct('<h')
+_STRUCT_UINT16 = struct.Struct('<H')
+_STRUCT_INT32 = struct.Struct('<i')
+_STRUCT_UINT32 = struct.Struct('<I')
+_STRUCT_INT64 = struct.Struct('<q')
+_STRUCT_UINT64 = struct.Struct('<Q')
+# prevout hash and index of a serialized txin
+_STRUCT_OUTPOINT = struct.Struct('<32sI')
+
+
 class BCDataStream(object):
     """Workalike python implementation of Bitcoin's CDataStream class."""
 
     def __init__(self):
-        self.input = None  # type: Optional[bytearray]
+        self.input = None  # type: Optional[Union[bytes, bytearray]]
         self.read_cursor = 0
 
     def clear(self):
@@ -489,9 +556,13 @@ class BCDataStream(object):
     def write(self, _bytes: Union[bytes, bytearray]):  # Initialize with string of _bytes
         assert isinstance(_bytes, (bytes, bytearray))
         if self.input is None:
-            self.input = bytearray(_bytes)
+            # immutable input is kept as-is: deserializing needs no copy of it
+            self.input = _bytes if isinstance(_bytes, bytes) else bytearray(_bytes)
+        elif isinstance(self.input, bytes):
+            self.input = bytearray(self.input)
+            self.input += _bytes
         else:
-            self.input += bytearray(_bytes)
+            self.input += _bytes
 
     def read_string(self, encoding='ascii'):
         # Strings are encoded depending on length:
@@ -518,13 +589,27 @@ class BCDataStream(object):
         if self.input is None:
             raise SerializationError("call write(bytes) before trying to deserialize")
         assert length >= 0
-        input_len = len(self.input)
         read_begin = self.read_cursor
         read_end = read_begin + length
-        if 0 <= read_begin <= read_end <= input_len:
-            result = self.input[read_begin:read_end]  # type: bytearray
-            self.read_cursor += length
-            return bytes(result)
+        if read_end <= len(self.input):
+            self.read_cursor = read_end
+            result = self.input[read_begin:read_end]
+            return result if type(result) is bytes else bytes(result)
+        else:
+            raise SerializationError('attempt to read past end of buffer')
+
+    def read_view(self, length: int) -> memoryview:
+        """Like read_bytes, but returns a view into the stream, without copying.
+        The view must not be written to, nor kept alive across a later write() to the stream.
+        """
+        if self.input is None:
+            raise SerializationError("call write(bytes) before trying to deserialize")
+        assert length >= 0
+        read_begin = self.read_cursor
+        read_end = read_begin + length
+        if read_end <= len(self.input):
+            self.read_cursor = read_end
+            return memoryview(self.input)[read_begin:read_end]
         else:
             raise SerializationError('attempt to read past end of buffer')
 
@@ -538,34 +623,34 @@ class BCDataStream(object):
         return self.read_cursor < len(self.input)
 
     def read_boolean(self) -> bool: return self.read_bytes(1) != b'\x00'
-    def read_int16(self): return self._read_num('<h')
-    def read_uint16(self): return self._read_num('<H')
-    def read_int32(self): return self._read_num('<i')
-    def read_uint32(self): return self._read_num('<I')
-    def read_int64(self): return self._read_num('<q')
-    def read_uint64(self): return self._read_num('<Q')
+    def read_int16(self): return self._read_num(_STRUCT_INT16)
+    def read_uint16(self): return self._read_num(_STRUCT_UINT16)
+    def read_int32(self): return self._read_num(_STRUCT_INT32)
+    def read_uint32(self): return self._read_num(_STRUCT_UINT32)
+    def read_int64(self): return self._read_num(_STRUCT_INT64)
+    def read_uint64(self): return self._read_num(_STRUCT_UINT64)
 
     def write_boolean(self, val): return self.write(b'\x01' if val else b'\x00')
-    def write_int16(self, val): return self._write_num('<h', val)
-    def write_uint16(self, val): return self._write_num('<H', val)
-    def write_int32(self, val): return self._write_num('<i', val)
-    def write_uint32(self, val): return self._write_num('<I', val)
-    def write_int64(self, val): return self._write_num('<q', val)
-    def write_uint64(self, val): return self._write_num('<Q', val)
+    def write_int16(self, val): return self._write_num(_STRUCT_INT16, val)
+    def write_uint16(self, val): return self._write_num(_STRUCT_UINT16, val)
+    def write_int32(self, val): return self._write_num(_STRUCT_INT32, val)
+    def write_uint32(self, val): return self._write_num(_STRUCT_UINT32, val)
+    def write_int64(self, val): return self._write_num(_STRUCT_INT64, val)
+    def write_uint64(self, val): return self._write_num(_STRUCT_UINT64, val)
 
     def read_compact_size(self):
         try:
             size = self.input[self.read_cursor]
-            self.read_cursor += 1
-            if size == 253:
-                size = self._read_num('<H')
-            elif size == 254:
-                size = self._read_num('<I')
-            elif size == 255:
-                size = self._read_num('<Q')
-            return size
-        except IndexError as e:
+        except (IndexError, TypeError) as e:
             raise SerializationError("attempt to read past end of buffer") from e
+        self.read_cursor += 1
+        if size < 253:  # fast path, by far the most common case
+            return size
+        if size == 253:
+            return self._read_num(_STRUCT_UINT16)
+        elif size == 254:
+            return self._read_num(_STRUCT_UINT32)
+        return self._read_num(_STRUCT_UINT64)
 
     def write_compact_size(self, size):
         if size < 0:
@@ -574,27 +659,34 @@ class BCDataStream(object):
             self.write(bytes([size]))
         elif size < 2**16:
             self.write(b'\xfd')
-            self._write_num('<H', size)
+            self._write_num(_STRUCT_UINT16, size)
         elif size < 2**32:
             self.write(b'\xfe')
-            self._write_num('<I', size)
+            self._write_num(_STRUCT_UINT32, size)
         elif size < 2**64:
             self.write(b'\xff')
-            self._write_num('<Q', size)
+            self._write_num(_STRUCT_UINT64, size)
         else:
             raise Exception(f"size {size} too large for compact_size")
 
-    def _read_num(self, format):
+    def read_struct(self, s: struct.Struct) -> tuple:
         try:
-            (i,) = struct.unpack_from(format, self.input, self.read_cursor)
-            self.read_cursor += struct.calcsize(format)
+            values = s.unpack_from(self.input, self.read_cursor)
         except Exception as e:
             raise SerializationError(e) from e
+        self.read_cursor += s.size
+        return values
+
+    def _read_num(self, s: struct.Struct):
+        try:
+            (i,) = s.unpack_from(self.input, self.read_cursor)
+        except Exception as e:
+            raise SerializationError(e) from e
+        self.read_cursor += s.size
         return i
 
-    def _write_num(self, format, num):
-        s = struct.pack(format, num)
-        self.write(s)
+    def _write_num(self, s: struct.Struct, num):
+        self.write(s.pack(num))
 
 
 def script_GetOp(_bytes : bytes):
@@ -769,18 +861,20 @@ def get_address_from_output_script(_bytes: bytes, *, net=None) -> Optional[str]:
 
 
 def parse_input(vds: BCDataStream) -> TxInput:
-    prevout_hash = vds.read_bytes(32)[::-1]
-    prevout_n = vds.read_uint32()
-    prevout = TxOutpoint(txid=prevout_hash, out_idx=prevout_n)
+    prevout_hash, prevout_n = vds.read_struct(_STRUCT_OUTPOINT)
+    prevout = TxOutpoint(txid=prevout_hash[::-1], out_idx=prevout_n)
     script_sig = vds.read_bytes(vds.read_compact_size())
     nsequence = vds.read_uint32()
     return TxInput(prevout=prevout, script_sig=script_sig, nsequence=nsequence)
 
 
 def parse_witness(vds: BCDataStream, txin: TxInput) -> None:
+    # the witness is stored serialized: only walk the elements to find where it ends
+    witness_begin = vds.read_cursor
     n = vds.read_compact_size()
-    witness_elements = list(vds.read_bytes(vds.read_compact_size()) for i in range(n))
-    txin.witness = bfh(construct_witness(witness_elements))
+    for i in range(n):
+        vds.read_view(vds.read_compact_size())
+    txin.witness = bytes(memoryview(vds.input)[witness_begin:vds.read_cursor])
 
 
 def parse_output(vds: BCDataStream) -> TxOutput:
@@ -997,6 +1091,21 @@ class Transaction:
                                           hashSequence=hashSequence,
                                           hashOutputs=hashOutputs)
 
+    def _calc_legacy_sighash_template(self) -> LegacySighashTemplate:
+        inputs = self.inputs()
+        prevouts = [txin.prevout.serialize_to_network() for txin in inputs]
+        txins = b''.join(prevout + b'\x00' + bfh(int_to_hex(txin.nsequence, 4))
+                         for prevout, txin in zip(prevouts, inputs))
+        txins_zero_nsequence = b''.join(prevout + bytes(5) for prevout in prevouts)
+        assert len(txins) == len(txins_zero_nsequence) == len(inputs) * LEGACY_BLANK_TXIN_LEN
+        outputs = tuple(o.serialize_to_network() for o in self.outputs())
+        txouts = bfh(var_int(len(outputs))) + b''.join(outputs)
+        return LegacySighashTemplate(num_inputs=bfh(var_int(len(inputs))),
+                                     txins=txins,
+                                     txins_zero_nsequence=txins_zero_nsequence,
+                                     outputs=outputs,
+                                     txouts=txouts)
+
     def is_segwit(self, *, guess_for_address=False):
         return any(txin.is_segwit(guess_for_address=guess_for_address)
                    for txin in self.inputs())
@@ -2183,7 +2292,19 @@ class PartialTransaction(Transaction):
 
     def serialize_preimage(self, txin_index: int, wallet: 'Abstract_Wallet', *,
                            bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None,
+                           legacy_sighash_template: LegacySighashTemplate = None,
                            locking_script_overrides = None) -> str:
+        return b''.join(self._serialize_preimage_chunks(
+            txin_index, wallet,
+            bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+            legacy_sighash_template=legacy_sighash_template,
+            locking_script_overrides=locking_script_overrides)).hex()
+
+    def _serialize_preimage_chunks(self, txin_index: int, wallet: 'Abstract_Wallet', *,
+                                   bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None,
+                                   legacy_sighash_template: LegacySighashTemplate = None,
+                                   locking_script_overrides = None) -> Sequence[Union[bytes, memoryview]]:
+        """Returns the preimage as a list of chunks, to be concatenated or hashed incrementally."""
         nVersion = int_to_hex(self.version, 4)
         nLocktime = int_to_hex(self.locktime, 4)
         inputs = self.inputs()
@@ -2216,68 +2337,84 @@ class PartialTransaction(Transaction):
             amount = int_to_hex(txin.value_sats(), 8)
             nSequence = int_to_hex(txin.nsequence, 4)
             preimage = nVersion + hashPrevouts + hashSequence + outpoint + scriptCode + amount + nSequence + hashOutputs + nLocktime + nHashType
+            return [bfh(preimage)]
+        # pre-segwit: every other input and the outputs come from the template,
+        # only the scriptSig slot of the input being signed is patched in.
+        if legacy_sighash_template is None:
+            legacy_sighash_template = self._calc_legacy_sighash_template()
+        script_slot = bfh(var_int(len(preimage_script) // 2) + preimage_script)
+        nSequence = bfh(int_to_hex(txin.nsequence, 4))
+        if sighash & Sighash.ANYONECANPAY:
+            txins = [bfh(var_int(1)), txin.prevout.serialize_to_network(), script_slot, nSequence]
         else:
-            if sighash & Sighash.ANYONECANPAY:
-                txins = var_int(1) + txin.serialize_to_network(script_sig=bfh(preimage_script)).hex()
+            if (sighash & 0x1f) == Sighash.NONE or (sighash & 0x1f) == Sighash.SINGLE:
+                blank_txins = memoryview(legacy_sighash_template.txins_zero_nsequence)
             else:
-                input_serializations = []
-                for k, txin in enumerate(inputs):
-                    if ((sighash & 0x1f) == Sighash.NONE or (sighash & 0x1f) == Sighash.SINGLE) and txin_index != k:
-                        txin = PartialTxInput.from_txin(txin, strip_witness=False)
-                        txin.nsequence = 0
-                    serialization = txin.serialize_to_network(script_sig=bfh(preimage_script) if txin_index==k else b"").hex()
-                    input_serializations.append(serialization)
-
-                txins = var_int(len(inputs)) + ''.join(input_serializations)
-
-            if (sighash & 0x1f) == Sighash.NONE:
-                txouts = var_int(0)
-            elif (sighash & 0x1f) == Sighash.SINGLE:
-                if txin_index >= len(outputs):
-                    raise Exception('Not enough outputs for SIGHASH_SINGLE!')
-                output_serializations = []
-                for k, txout in enumerate(outputs):
-                    if k > txin_index: break
-                    if k < txin_index:
-                        txout = PartialTxOutput.from_txout(txout)
-                        txout.scriptpubkey = b''
-                        txout.value = (1 << 64) - 1
-                    serialization = txout.serialize_to_network().hex()
-                    output_serializations.append(serialization)
-                txouts = var_int(len(output_serializations)) + ''.join(output_serializations)
-            else:
-                txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
-            preimage = nVersion + txins + txouts + nLocktime + nHashType
-        return preimage
+                blank_txins = memoryview(legacy_sighash_template.txins)
+            offset = txin_index * LEGACY_BLANK_TXIN_LEN
+            txins = [legacy_sighash_template.num_inputs,
+                     blank_txins[:offset + 36],  # everything up to our outpoint, inclusive
+                     script_slot,
+                     nSequence,
+                     blank_txins[offset + LEGACY_BLANK_TXIN_LEN:]]
+        if (sighash & 0x1f) == Sighash.NONE:
+            txouts = [bfh(var_int(0))]
+        elif (sighash & 0x1f) == Sighash.SINGLE:
+            if txin_index >= len(legacy_sighash_template.outputs):
+                raise Exception('Not enough outputs for SIGHASH_SINGLE!')
+            # outputs before ours are blanked: value=-1, empty scriptPubKey
+            blank_txout = b'\xff' * 8 + bfh(var_int(0))
+            txouts = [bfh(var_int(txin_index + 1)),
+                      blank_txout * txin_index,
+                      legacy_sighash_template.outputs[txin_index]]
+        else:
+            txouts = [legacy_sighash_template.txouts]
+        return [bfh(nVersion), *txins, *txouts, bfh(nLocktime), bfh(nHashType)]
 
     def sign(self, keypairs, wallet: 'Abstract_Wallet', *, locking_script_overrides=None) -> None:
         # keypairs:  pubkey_hex -> (secret_bytes, is_compressed)
         bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
+        legacy_sighash_template = self._calc_legacy_sighash_template()
+        # Preimages are built here, as they may need the wallet. Hashing them and
+        # the ECDSA signing are then spread over the signing pool.
+        jobs = []
         for i, txin in enumerate(self.inputs()):
-            pubkeys = [pk.hex() for pk in txin.pubkeys]
-            for pubkey in pubkeys:
+            if txin.is_complete():
+                continue
+            keys = [(pk.hex(), keypairs[pk.hex()][0]) for pk in txin.pubkeys if pk.hex() in keypairs]
+            if not keys:
+                continue
+            txin.validate_data(for_signing=True)
+            sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
+            preimage_chunks = self._serialize_preimage_chunks(
+                i, wallet,
+                bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+                legacy_sighash_template=legacy_sighash_template,
+                locking_script_overrides=locking_script_overrides)
+            jobs.append(_TxinSigningJob(txin_index=i, keys=keys, sighash=sighash, preimage_chunks=preimage_chunks))
+        # merge back in input order, so the result does not depend on scheduling
+        for job, sigs in zip(jobs, _run_signing_jobs(jobs)):
+            txin = self.inputs()[job.txin_index]
+            for (pubkey, _), sig in zip(job.keys, sigs):
                 if txin.is_complete():
                     break
-                if pubkey not in keypairs:
-                    continue
                 _logger.info(f"adding signature for {pubkey}. spending utxo {txin.prevout.to_str()}")
-                sec, compressed = keypairs[pubkey]
-                sig = self.sign_txin(i, sec, wallet, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields, locking_script_overrides=locking_script_overrides)
-                self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
+                self.add_signature_to_txin(txin_idx=job.txin_index, signing_pubkey=pubkey, sig=sig)
 
         _logger.debug(f"is_complete {self.is_complete()}")
         self.invalidate_ser_cache()
 
-    def sign_txin(self, txin_index, privkey_bytes, wallet: 'Abstract_Wallet', *, bip143_shared_txdigest_fields=None, locking_script_overrides=None) -> str:
+    def sign_txin(self, txin_index, privkey_bytes, wallet: 'Abstract_Wallet', *, bip143_shared_txdigest_fields=None,
+                  legacy_sighash_template=None, locking_script_overrides=None) -> str:
         txin = self.inputs()[txin_index]
         txin.validate_data(for_signing=True)
         sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
-        pre_hash = sha256d(bfh(self.serialize_preimage(txin_index, wallet,
-                                                       bip143_shared_txdigest_fields=bip143_shared_txdigest_fields, locking_script_overrides=locking_script_overrides)))
-        privkey = ecc.ECPrivkey(privkey_bytes)
-        sig = privkey.sign_transaction(pre_hash)
-        sig = sig.hex() + Sighash.to_sigbytes(sighash).hex()
-        return sig
+        pre_hash = sha256d_chunks(self._serialize_preimage_chunks(
+            txin_index, wallet,
+            bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+            legacy_sighash_template=legacy_sighash_template,
+            locking_script_overrides=locking_script_overrides))
+        return _sign_hashed_preimage(pre_hash, privkey_bytes, sighash)
 
     def is_complete(self) -> bool:
         return all([txin.is_complete() for txin in self.inputs()])
@@ -2322,6 +2459,7 @@ class PartialTransaction(Transaction):
             return
         if len(self.inputs()) != len(signatures):
             raise Exception('expected {} signatures; got {}'.format(len(self.inputs()), len(signatures)))
+        legacy_sighash_template = self._calc_legacy_sighash_template()
         for i, txin in enumerate(self.inputs()):
             pubkeys = [pk.hex() for pk in txin.pubkeys]
             sig = signatures[i]
@@ -2329,7 +2467,8 @@ class PartialTransaction(Transaction):
                 continue
             if bfh(sig) in list(txin.part_sigs.values()):
                 continue
-            pre_hash = sha256d(bfh(self.serialize_preimage(i, wallet)))
+            pre_hash = sha256d_chunks(self._serialize_preimage_chunks(
+                i, wallet, legacy_sighash_template=legacy_sighash_template))
             sig_string = ecc.sig_string_from_der_sig(bfh(sig[:-2]))
             for recid in range(4):
                 try:
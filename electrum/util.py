@@ -1768,6 +1768,38 @@ def create_and_start_event_loop() -> (
     return loop, stopping_fut, loop_thread
 
 
+class LRUCache(OrderedDict):
+    """An OrderedDict holding at most maxsize items, evicting the least recently used.
+
+    Note: only get() and __setitem__ count as a use.
+    get(), __setitem__ and clear() can be called from several threads;
+    other methods, and iteration, are not protected by the lock.
+    """
+
+    def __init__(self, *, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+        self.lock = threading.RLock()
+
+    @with_lock
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    @with_lock
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+    @with_lock
+    def clear(self):
+        super().clear()
+
+
 class OrderedDictWithIndex(OrderedDict):
     """An OrderedDict that keeps track of the positions of keys.
 
@@ -41,10 +41,12 @@ from functools import partial
 from collections import defaultdict
 from numbers import Number
 from decimal import Decimal
-from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable, Callable, Iterator
 from abc import ABC, abstractmethod
 import itertools
 import threading
+from array import array
+from bisect import bisect_left, bisect_right
 import enum
 import asyncio
 
@@ -86,7 +88,6 @@ from .contacts import Contacts
 from .interface import NetworkException
 from .mnemonic import Mnemonic
 from .logging import get_logger, Logger
-from .lnworker import LNWallet
 from .paymentrequest import PaymentRequest
 from .util import read_json_file, write_json_file, UserFacingException, FileImportFailed
 from .util import EventListener, event_listener
@@ -96,10 +97,14 @@ from .descriptor import Descriptor
 if TYPE_CHECKING:
     from .network import Network
     from .exchange_rate import FxThread
+    from .lnworker import LNWallet
 
 
 _logger = get_logger(__name__)
 
+# historical rates younger than this might still be replaced (see FxThread.history_rate)
+FINAL_RATE_AGE = 3 * 24 * 3600
+
 TX_STATUS = [
     _('Unconfirmed'),
     _('Unconfirmed parent'),
@@ -227,6 +232,130 @@ async def sweep(
     return tx
 
 
+def get_assets_needed_for_outputs(outputs: Iterable[TxOutput]) -> Set[Optional[str]]:
+    """Assets whose coins can be spent by a tx paying to outputs.
+    The base coin (None) is always needed, for the fee.
+    """
+    return {output.asset for output in outputs} | {None}
+
+
+def get_cached_timestamp_rate(fx: 'FxThread') -> Callable[[Optional[int]], Decimal]:
+    """Returns fx.timestamp_rate, memoized per day.
+    Historical rates have daily granularity, so a history export only needs one lookup per day.
+    """
+    cache = {}  # type: Dict[Any, Decimal]  # date -> rate
+
+    def timestamp_rate(timestamp: Optional[int]) -> Decimal:
+        date = timestamp_to_datetime(timestamp)
+        key = date.date() if date is not None else None
+        rate = cache.get(key)
+        if rate is None:
+            rate = cache[key] = fx.history_rate(date)
+        return rate
+    return timestamp_rate
+
+
+class DetailedHistoryTotals:
+    """Running totals over the items of Abstract_Wallet.iter_detailed_history,
+    used to build the summary of a history export.
+    """
+
+    def __init__(self):
+        self.first_item = None  # type: Optional[dict]
+        self.last_item = None  # type: Optional[dict]
+        self.income = 0
+        self.expenditures = 0
+        self.capital_gains = Decimal(0)
+        self.fiat_income = Decimal(0)
+        self.fiat_expenditures = Decimal(0)
+
+    def add(self, item: dict) -> None:
+        if self.first_item is None:
+            self.first_item = item
+        self.last_item = item
+        # fixme: use in and out values
+        value = item['bc_value'].value
+        if value < 0:
+            self.expenditures += -value
+        else:
+            self.income += value
+        if 'fiat_value' in item:
+            fiat_value = item['fiat_value'].value
+            if value < 0:
+                self.capital_gains += item['capital_gain'].value
+                self.fiat_expenditures += -fiat_value
+            else:
+                self.fiat_income += fiat_value
+
+
+class BalanceSeries:
+    """Balance of one asset after each confirmed tx of the wallet, in history order.
+
+    Stored as parallel arrays, so that lookups by timestamp or height are
+    a bisection. Timestamps are made monotonic (block timestamps are not).
+    incoming/outgoing are cumulative sums of the positive/negative deltas.
+    """
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.heights = array('q')
+        self.balances = array('q')
+        self.incoming = array('q')
+        self.outgoing = array('q')
+
+    def __len__(self):
+        return len(self.balances)
+
+    def append(self, timestamp: int, height: int, delta: int) -> None:
+        assert not self.timestamps or timestamp >= self.timestamps[-1]
+        last = len(self) - 1
+        self.timestamps.append(timestamp)
+        self.heights.append(height)
+        self.balances.append((self.balances[last] if last >= 0 else 0) + delta)
+        self.incoming.append((self.incoming[last] if last >= 0 else 0) + max(delta, 0))
+        self.outgoing.append((self.outgoing[last] if last >= 0 else 0) + max(-delta, 0))
+
+    @staticmethod
+    def _value_before(values: array, i: int) -> int:
+        return values[i - 1] if i > 0 else 0
+
+    def balance_at_timestamp(self, timestamp: int) -> int:
+        """Balance after all txs mined at or before timestamp."""
+        return self._value_before(self.balances, bisect_right(self.timestamps, timestamp))
+
+    def balance_at_height(self, height: int) -> int:
+        """Balance after all txs mined at or below height."""
+        return self._value_before(self.balances, bisect_right(self.heights, height))
+
+    def flow(self, from_timestamp: Optional[int] = None, to_timestamp: Optional[int] = None) -> Tuple[int, int]:
+        """Returns (incoming, outgoing) of the txs with from_timestamp <= timestamp < to_timestamp."""
+        lo = bisect_left(self.timestamps, from_timestamp) if from_timestamp is not None else 0
+        hi = bisect_left(self.timestamps, to_timestamp) if to_timestamp is not None else len(self)
+        if hi <= lo:
+            return 0, 0
+        return (self._value_before(self.incoming, hi) - self._value_before(self.incoming, lo),
+                self._value_before(self.outgoing, hi) - self._value_before(self.outgoing, lo))
+
+    def downsample(self, num_points: int, *, start: int = None, end: int = None) -> List[Tuple[int, int]]:
+        """Returns num_points (timestamp, balance) pairs, evenly spaced between start and end
+        (default: first and last tx). The arrays are walked once, not bisected per point.
+        """
+        if not self or num_points <= 0:
+            return []
+        start = self.timestamps[0] if start is None else start
+        end = self.timestamps[-1] if end is None else end
+        step = (end - start) / (num_points - 1) if num_points > 1 else 0
+        out = []
+        i = bisect_right(self.timestamps, start)
+        n = len(self)
+        for k in range(num_points):
+            t = int(start + k * step) if k < num_points - 1 else end
+            while i < n and self.timestamps[i] <= t:
+                i += 1
+            out.append((t, self._value_before(self.balances, i)))
+        return out
+
+
 def get_locktime_for_new_transaction(network: 'Network') -> int:
     # if no network or not up to date, just set locktime to zero
     if not network:
@@ -371,6 +500,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         self._invoices              = db.get_dict('invoices')  # type: Dict[str, Invoice]
         self._reserved_addresses   = set(db.get('reserved_addresses', []))
         self._num_parents          = db.get_dict('num_parents')
+        self._acquisition_prices   = db.get_dict('acquisition_prices')  # type: Dict[str, Dict[str, Dict[str, str]]]  # ccy -> exchange -> txid -> price
 
         self._freeze_lock = threading.RLock()  # for mutating/iterating frozen_{addresses,coins}
 
@@ -383,7 +513,15 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         if self.db.get('wallet_type') is None:
             self.db.put('wallet_type', self.wallet_type)
         self.contacts = Contacts(self.db)
-        self._coin_price_cache = {}
+        self._price_memo = {}  # type: Dict[Tuple[str, str], Decimal]  # (ccy, txid) -> price
+        self._price_memo_key = None
+        self._balance_series = None  # type: Optional[Dict[Optional[str], BalanceSeries]]  # asset -> series
+        self._balance_series_version = None  # type: Optional[int]  # adb history version of the series
+        self._balance_series_tip = None  # type: Optional[Tuple[Tuple[int, int], int]]  # sort key, timestamp of last tx
+        self._balance_series_truncated = False
+        self._snapshots = {}  # type: Dict[str, Tuple[str, Any]]  # name -> (state version, value)
+        # the adb counter starts from zero on every load, tokens of different loads must not collide
+        self._state_version_nonce = os.urandom(4).hex()
 
         # true when synchronized. this is stricter than adb.is_up_to_date():
         # to-be-generated (HD) addresses are also considered here (gap-limit-roll-forward)
@@ -446,6 +584,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         return bool(self.lnworker)
 
     def can_have_lightning(self) -> bool:
+        if not self.config.LIGHTNING_ENABLED and not self.db.get('channels'):
+            return False
         # we want static_remotekey to be a wallet address
         return self.txin_type == 'p2wpkh'
 
@@ -469,6 +609,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             node = BIP32Node.from_rootseed(seed, xtype='standard')
             ln_xprv = node.to_xprv()
             self.db.put('lightning_privkey2', ln_xprv)
+        from .lnworker import LNWallet  # imported lazily, see _init_lnworker
         self.lnworker = LNWallet(self, ln_xprv)
         self.save_db()
         if self.network:
@@ -496,7 +637,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         return self._up_to_date
 
     def tx_is_related(self, tx):
-        is_mine = any([self.is_mine(out.address) for out in tx.outputs()])
+        is_mine = any([self.is_mine_txo(out) for out in tx.outputs()])
         is_mine |= any([self.is_mine(self.adb.get_txin_address(txin)) for txin in tx.inputs()])
         return is_mine
 
@@ -559,6 +700,12 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def on_event_adb_added_tx(self, adb, tx_hash: str, tx: Transaction):
         if self.adb != adb:
             return
+        self._forget_onchain_payments_touched_by_tx(tx)
+        self._update_balance_series_for_new_tx(tx_hash)
+        if self._acquisition_prices:
+            # parents can arrive after their children (e.g. during the initial sync),
+            # the saved prices of the descendants did not account for this tx
+            self._forget_acquisition_prices_of_txs(self.adb.get_depending_transactions(tx_hash))
         if not self.tx_is_related(tx):
             return
         self.clear_tx_parents_cache()
@@ -571,6 +718,12 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def on_event_adb_removed_tx(self, adb, txid: str, tx: Transaction):
         if self.adb != adb:
             return
+        self._forget_onchain_payments_touched_by_tx(tx)
+        self._balance_series = None
+        if any(txid in prices
+               for by_exchange in self._acquisition_prices.values()
+               for prices in by_exchange.values()):
+            self.clear_coin_price_cache()
         if not self.tx_is_related(tx):
             return
         self.clear_tx_parents_cache()
@@ -581,6 +734,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         if adb != self.adb:
             return
         self._update_invoices_and_reqs_touched_by_tx(tx_hash)
+        self._update_balance_series_for_verified_tx(tx_hash)
         tx_mined_status = self.adb.get_tx_height(tx_hash)
         util.trigger_callback('verified', self, tx_hash, tx_mined_status)
 
@@ -589,9 +743,29 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         if adb != self.adb:
             return
         self._update_invoices_and_reqs_touched_by_tx(tx_hash)
+        # reorg: the timestamps that acquisition prices are based on might change
+        self.clear_coin_price_cache()
+        self._balance_series = None
+
+    @event_listener
+    def on_event_adb_tx_height_changed(self, adb, tx_hash, old_height, tx_height):
+        if adb != self.adb:
+            return
+        self._forget_onchain_payments_touched_by_tx(self.db.get_transaction(tx_hash))
+        if old_height > 0:
+            self.clear_coin_price_cache()
+            self._balance_series = None
+
+    @event_listener
+    def on_event_on_history(self):
+        # new historical rates: prices that were not final might have changed
+        self._price_memo_key = None
 
     def clear_history(self):
         self.adb.clear_history()
+        self._forget_onchain_payments_touched_by_tx(None)
+        self.clear_coin_price_cache()
+        self._balance_series = None
         self.save_db()
 
     def start_network(self, network: 'Network'):
@@ -729,6 +903,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             if ccy not in self.fiat_value:
                 self.fiat_value[ccy] = {}
             self.fiat_value[ccy][txid] = text
+        # the acquisition price of coins descending from txid changes
+        self._forget_acquisition_prices(ccy)
         return reset
 
     def get_fiat_value(self, txid, ccy):
@@ -742,6 +918,13 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         if not address: return False
         return bool(self.get_address_index(address))
 
+    def is_mine_txo(self, txo: TxOutput) -> bool:
+        """Same as is_mine(txo.address), but does not decode the address of foreign outputs"""
+        # note: the addresses of the wallet are a subset of those of self.adb
+        if not self.adb.is_maybe_mine_scriptpubkey(txo.scriptpubkey):
+            return False
+        return self.is_mine(txo.address)
+
     def is_change(self, address) -> bool:
         if not self.is_mine(address):
             return False
@@ -858,7 +1041,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     v_in += value
             for txout in tx.outputs():
                 v_out += txout.value
-                if self.is_mine(txout.address):
+                if self.is_mine_txo(txout):
                     v_out_mine += txout.value
                     is_relevant = True
         delta = v_out_mine - v_in_mine
@@ -1036,6 +1219,21 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         domain = self.get_addresses()
         return self.adb.get_balance(domain, **kwargs)
 
+    def get_state_version(self) -> str:
+        """Opaque token that changes whenever get_balance() or get_utxos() might change."""
+        return f'{self._state_version_nonce}.{self.adb.get_state_version()}.{self.adb.get_local_height()}'
+
+    def get_snapshot(self, name: str, make_value: Callable[[], Any]) -> Tuple[str, Any]:
+        """Returns (state version, make_value()).
+        The value is cached until the state version changes, it must not be mutated.
+        """
+        version = self.get_state_version()
+        snapshot = self._snapshots.get(name)
+        if snapshot is None or snapshot[0] != version:
+            # note: version was read before computing, so a concurrent change invalidates the result
+            snapshot = self._snapshots[name] = (version, make_value())
+        return snapshot
+
     def get_addr_balance(self, address, *, asset_aware=False):
         return self.adb.get_balance([address], asset_aware=asset_aware)
 
@@ -1054,6 +1252,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             *,
             nonlocal_only: bool = False,
             confirmed_only: bool = False,
+            assets: Optional[Iterable[Optional[str]]] = None,
     ) -> Sequence[PartialTxInput]:
         with self._freeze_lock:
             frozen_addresses = self._frozen_addresses.copy()
@@ -1063,6 +1262,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             mature_only=True,
             confirmed_funding_only=confirmed_only,
             nonlocal_only=nonlocal_only,
+            assets=assets,
         )
         utxos = [utxo for utxo in utxos if not self.is_frozen_coin(utxo)]
         return utxos
@@ -1124,7 +1324,9 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         frozen = fc + fu + fx
         return cc, uu, xx, frozen, lightning - f_lightning, f_lightning
 
-    def balance_at_timestamp(self, domain, target_timestamp):
+    def balance_at_timestamp(self, domain, target_timestamp, *, asset: Optional[str] = None):
+        if domain is None:
+            return self.get_balance_series(asset).balance_at_timestamp(target_timestamp)
         # we assume that get_history returns items ordered by block height
         # we also assume that block timestamps are monotonic (which is false...!)
         h = self.adb.get_history(domain=domain)
@@ -1136,12 +1338,112 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         # return last balance
         return balance
 
-    def get_onchain_history(self, *, domain=None):
+    def get_balance_series(self, asset: Optional[str] = None) -> BalanceSeries:
+        """Balance over time of the confirmed history of the wallet.
+
+        The series is built from the history once, then new verified txs are
+        appended to it. Anything else (reorgs, removed txs, txs verified out
+        of order) makes it rebuild on the next call.
+        """
+        with self.lock:
+            if self._balance_series is None or self._balance_series_version != self.adb.get_history_version():
+                self._build_balance_series()
+            return self._balance_series.get(asset) or BalanceSeries()
+
+    def _build_balance_series(self) -> None:
+        version = self.adb.get_history_version()
+        series = defaultdict(BalanceSeries)
+        tip = None
+        truncated = False
+        monotonic_timestamp = 0
+        for hist_item in self.adb.get_history(domain=self.get_addresses()):
+            tx_mined_status = hist_item.tx_mined_status
+            if tx_mined_status.timestamp is None:
+                # unconfirmed txs come last, but a mined tx that is not verified yet cuts the series short
+                truncated = tx_mined_status.height > 0
+                break
+            monotonic_timestamp = max(monotonic_timestamp, tx_mined_status.timestamp)
+            series[hist_item.asset].append(monotonic_timestamp, tx_mined_status.height, hist_item.delta)
+            tip = (tx_mined_status.height, tx_mined_status.txpos or -1), monotonic_timestamp
+        self._balance_series = dict(series)
+        self._balance_series_version = version
+        self._balance_series_tip = tip
+        self._balance_series_truncated = truncated
+
+    def _update_balance_series_for_new_tx(self, tx_hash: str) -> None:
+        with self.lock:
+            if self._balance_series is None:
+                return
+            # adding the tx bumped the history version once per address (see _add_tx_to_local_history).
+            # an unconfirmed tx does not change the series, so the series is still up to date.
+            expected_version = (self._balance_series_version
+                                + len(self.db.get_txi_addresses(tx_hash)) + len(self.db.get_txo_addresses(tx_hash)))
+            if self.adb.get_tx_height(tx_hash).timestamp is None and self.adb.get_history_version() == expected_version:
+                self._balance_series_version = expected_version
+            else:
+                self._balance_series = None
+
+    def _update_balance_series_for_verified_tx(self, tx_hash: str) -> None:
+        with self.lock:
+            if self._balance_series is None:
+                return
+            tx_mined_status = self.adb.get_tx_height(tx_hash)
+            key = (tx_mined_status.height, tx_mined_status.txpos or -1)
+            last_key, last_timestamp = self._balance_series_tip or ((0, -1), 0)
+            if (self._balance_series_truncated
+                    or self._balance_series_version != self.adb.get_history_version()
+                    or tx_mined_status.timestamp is None
+                    or key <= last_key):
+                self._balance_series = None
+                return
+            deltas = defaultdict(int)
+            for addr in set(self.db.get_txi_addresses(tx_hash)) | set(self.db.get_txo_addresses(tx_hash)):
+                for asset, delta in self.adb.get_tx_delta(tx_hash, addr).items():
+                    deltas[asset] += delta
+            timestamp = max(last_timestamp, tx_mined_status.timestamp)
+            for asset, delta in deltas.items():
+                if asset not in self._balance_series:
+                    self._balance_series[asset] = BalanceSeries()
+                self._balance_series[asset].append(timestamp, tx_mined_status.height, delta)
+            self._balance_series_tip = key, timestamp
+
+    def get_balance_summary(self, *, from_timestamp=None, to_timestamp=None, asset: Optional[str] = None) -> dict:
+        """Balances and flow of the confirmed history between two timestamps,
+        like get_detailed_history_summary but without fiat values.
+        Only bisects the balance series, instead of walking the history.
+        """
+        series = self.get_balance_series(asset)
+        if not series:
+            return {}
+        start_timestamp = from_timestamp if from_timestamp is not None else series.timestamps[0]
+        end_timestamp = to_timestamp if to_timestamp is not None else series.timestamps[-1]
+        incoming, outgoing = series.flow(from_timestamp, to_timestamp)
+        return {
+            'begin': {
+                'date': timestamp_to_datetime(start_timestamp),
+                'BTC_balance': Satoshis(series.balance_at_timestamp(start_timestamp - 1)),
+            },
+            'end': {
+                'date': timestamp_to_datetime(end_timestamp),
+                'BTC_balance': Satoshis(series.balance_at_timestamp(
+                    end_timestamp - 1 if to_timestamp is not None else end_timestamp)),
+            },
+            'flow': {
+                'BTC_incoming': Satoshis(incoming),
+                'BTC_outgoing': Satoshis(outgoing),
+            },
+        }
+
+    def get_onchain_history(self, *, domain=None, assets: Optional[Iterable[Optional[str]]] = None):
         if domain is None:
             domain = self.get_addresses()
+        if assets is not None:
+            assets = set(assets)
         monotonic_timestamp = 0
         for hist_item in self.adb.get_history(domain=domain):
             monotonic_timestamp = max(monotonic_timestamp, (hist_item.tx_mined_status.timestamp or TX_TIMESTAMP_INF))
+            if assets is not None and hist_item.asset not in assets:
+                continue
             d = {
                 'txid': hist_item.txid,
                 'fee_sat': hist_item.fee,
@@ -1221,6 +1523,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def clear_requests(self):
         self._receive_requests.clear()
         self._requests_addr_to_key.clear()
+        self._sorted_requests = None
         self.save_db()
 
     def get_invoices(self) -> List[Invoice]:
@@ -1277,10 +1580,16 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         for req in self._receive_requests.values():
             if addr := req.get_address():
                 self._requests_addr_to_key[addr].add(req.get_id())
+        self._sorted_requests = None  # type: Optional[List[Request]]  # built lazily, see get_sorted_requests
 
     def _prepare_onchain_invoice_paid_detection(self):
         self._invoices_from_txid_map = defaultdict(set)  # type: Dict[str, Set[str]]
         self._invoices_from_scriptpubkey_map = defaultdict(set)  # type: Dict[bytes, Set[str]]
+        # on-chain payments of invoices and requests, keyed by what they depend on: outputs and height.
+        # Entries are dropped when a tx paying to one of their scripthashes changes,
+        # see _forget_onchain_payments_touched_by_tx
+        self._onchain_payments = {}  # type: Dict[tuple, Tuple[bool, Optional[str], List[str]]]
+        self._onchain_payments_keys_by_scripthash = defaultdict(set)  # type: Dict[str, Set[tuple]]
         self._update_onchain_invoice_paid_detection(self._invoices.keys())
 
     def _update_onchain_invoice_paid_detection(self, invoice_keys: Iterable[str]) -> None:
@@ -1309,37 +1618,70 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         outputs = invoice.get_outputs()
         if not outputs:  # e.g. lightning-only
             return False, None, []
+        key = (tuple((txo.scriptpubkey, txo.value) for txo in outputs), invoice.height)
+        with self.lock, self.transaction_lock:
+            payment = self._onchain_payments.get(key)
+            if payment is None:
+                payment = self._get_onchain_payment(outputs, invoice.height)
+                self._onchain_payments[key] = payment
+                for txo in outputs:
+                    scripthash = bitcoin.script_to_scripthash(txo.scriptpubkey.hex())
+                    self._onchain_payments_keys_by_scripthash[scripthash].add(key)
+            is_paid, conf_txid, relevant_txs = payment
+            # confirmations of all mined txs grow together, so the tx with the fewest stays the same
+            conf_needed = (self.adb.get_tx_height(conf_txid).conf or 0) if conf_txid else None
+        return is_paid, conf_needed, relevant_txs
+
+    def _get_onchain_payment(
+            self, outputs: Sequence[PartialTxOutput], invoice_height: int,
+    ) -> Tuple[bool, Optional[str], List[str]]:
+        """Returns whether outputs are paid by txs newer than invoice_height, the paying
+        tx with the fewest confirmations, and list of relevant TXIDs.
+        """
         invoice_amounts = defaultdict(int)  # type: Dict[bytes, int]  # scriptpubkey -> value_sats
         for txo in outputs:  # type: PartialTxOutput
             invoice_amounts[txo.scriptpubkey] += 1 if parse_max_spend(txo.value) else txo.value
         relevant_txs = set()
         is_paid = True
         conf_needed = None  # type: Optional[int]
+        conf_txid = None  # type: Optional[str]
+        for invoice_scriptpubkey, invoice_amt in invoice_amounts.items():
+            scripthash = bitcoin.script_to_scripthash(invoice_scriptpubkey.hex())
+            prevouts_and_values = self.db.get_prevouts_by_scripthash(scripthash)
+            confs_and_values = []
+            for prevout, v, asset_stringified in prevouts_and_values:
+                txid = prevout.txid.hex()
+                relevant_txs.add(txid)
+                tx_height = self.adb.get_tx_height(txid)
+                if 0 < tx_height.height <= invoice_height:  # exclude txs older than invoice
+                    continue
+                confs_and_values.append((tx_height.conf or 0, v, asset_stringified or '', txid))
+            # check that there is at least one TXO, and that they pay enough.
+            # note: "at least one TXO" check is needed for zero amount invoice (e.g. OP_RETURN)
+            asset_data = get_asset_info_from_script(invoice_scriptpubkey)
+            vsum = 0
+            for conf, v, asset_stringified, txid in reversed(sorted(confs_and_values)):
+                # Falsy equates to None, needed string for comp
+                if (asset_stringified or None) != asset_data.asset: continue
+                vsum += v
+                if vsum >= invoice_amt:
+                    if conf_needed is None or conf < conf_needed:
+                        conf_needed, conf_txid = conf, txid
+                    break
+            else:
+                is_paid = False
+        return is_paid, conf_txid, list(relevant_txs)
+
+    def _forget_onchain_payments_touched_by_tx(self, tx: Optional[Transaction]) -> None:
         with self.lock, self.transaction_lock:
-            for invoice_scriptpubkey, invoice_amt in invoice_amounts.items():
-                scripthash = bitcoin.script_to_scripthash(invoice_scriptpubkey.hex())
-                prevouts_and_values = self.db.get_prevouts_by_scripthash(scripthash)
-                confs_and_values = []
-                for prevout, v, asset_stringified in prevouts_and_values:
-                    relevant_txs.add(prevout.txid.hex())
-                    tx_height = self.adb.get_tx_height(prevout.txid.hex())
-                    if 0 < tx_height.height <= invoice.height:  # exclude txs older than invoice
-                        continue
-                    confs_and_values.append((tx_height.conf or 0, v, asset_stringified or ''))
-                # check that there is at least one TXO, and that they pay enough.
-                # note: "at least one TXO" check is needed for zero amount invoice (e.g. OP_RETURN)
-                asset_data = get_asset_info_from_script(invoice_scriptpubkey)
-                vsum = 0
-                for conf, v, asset_stringified in reversed(sorted(confs_and_values)):
-                    # Falsy equates to None, needed string for comp
-                    if (asset_stringified or None) != asset_data.asset: continue
-                    vsum += v
-                    if vsum >= invoice_amt:
-                        conf_needed = min(conf_needed, conf) if conf_needed is not None else conf
-                        break
-                else:
-                    is_paid = False
-        return is_paid, conf_needed, list(relevant_txs)
+            if tx is None:
+                self._onchain_payments.clear()
+                self._onchain_payments_keys_by_scripthash.clear()
+                return
+            for txo in tx.outputs():
+                scripthash = bitcoin.script_to_scripthash(txo.scriptpubkey.hex())
+                for key in self._onchain_payments_keys_by_scripthash.pop(scripthash, ()):
+                    self._onchain_payments.pop(key, None)
 
     def is_onchain_invoice_paid(self, invoice: BaseInvoice) -> Tuple[bool, Optional[int]]:
         is_paid, conf_needed, relevant_txs = self._is_onchain_invoice_paid(invoice)
@@ -1474,30 +1816,31 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     item['fiat_default'] = True
         return transactions
 
-    @profiler
-    def get_detailed_history(
+    def iter_detailed_history(
             self,
             from_timestamp=None,
             to_timestamp=None,
             fx=None,
             show_addresses=False,
             from_height=None,
-            to_height=None):
-        # History with capital gains, using utxo pricing
-        # FIXME: Lightning capital gains would requires FIFO
+            to_height=None,
+            assets: Optional[Iterable[Optional[str]]] = None,
+    ) -> Iterator[dict]:
+        """Yields the items of get_detailed_history one by one, in history order,
+        so that exports do not need to hold the whole history in memory.
+        """
         if (from_timestamp is not None or to_timestamp is not None) \
                 and (from_height is not None or to_height is not None):
             raise Exception('timestamp and block height based filtering cannot be used together')
 
         show_fiat = fx and fx.is_enabled() and fx.has_history()
-        out = []
-        income = 0
-        expenditures = 0
-        capital_gains = Decimal(0)
-        fiat_income = Decimal(0)
-        fiat_expenditures = Decimal(0)
+        price_func = get_cached_timestamp_rate(fx) if show_fiat else None
         now = time.time()
-        for item in self.get_onchain_history():
+        for item in self.get_onchain_history(assets=assets):
+            if show_fiat:
+                # single forward pass: parents come before their children in
+                # the history, so pricing a tx only looks up its parents' prices
+                self.average_price(item['txid'], price_func, fx.ccy, exchange=fx.exchange.name())
             timestamp = item['timestamp']
             if from_timestamp and (timestamp or now) < from_timestamp:
                 continue
@@ -1509,107 +1852,130 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             if to_height is not None and (height >= to_height or height <= 0):
                 continue
             tx_hash = item['txid']
-            tx = self.db.get_transaction(tx_hash)
             tx_fee = item['fee_sat']
             item['fee'] = Satoshis(tx_fee) if tx_fee is not None else None
             if show_addresses:
+                tx = self.db.get_transaction(tx_hash)
                 item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
                 item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
                                            tx.outputs()))
-            # fixme: use in and out values
-            value = item['bc_value'].value
-            if value < 0:
-                expenditures += -value
-            else:
-                income += value
             # fiat computations
             if show_fiat:
-                fiat_fields = self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee)
-                fiat_value = fiat_fields['fiat_value'].value
-                item.update(fiat_fields)
-                if value < 0:
-                    capital_gains += fiat_fields['capital_gain'].value
-                    fiat_expenditures += -fiat_value
-                else:
-                    fiat_income += fiat_value
+                value = item['bc_value'].value
+                item.update(self.get_tx_item_fiat(
+                    tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee, price_func=price_func))
+            yield item
+
+    @profiler
+    def get_detailed_history(
+            self,
+            from_timestamp=None,
+            to_timestamp=None,
+            fx=None,
+            show_addresses=False,
+            from_height=None,
+            to_height=None,
+            assets: Optional[Iterable[Optional[str]]] = None):
+        # History with capital gains, using utxo pricing
+        # FIXME: Lightning capital gains would requires FIFO
+        totals = DetailedHistoryTotals()
+        out = []
+        for item in self.iter_detailed_history(
+                from_timestamp=from_timestamp, to_timestamp=to_timestamp, fx=fx, show_addresses=show_addresses,
+                from_height=from_height, to_height=to_height, assets=assets):
+            totals.add(item)
             out.append(item)
-        # add summary
-        if out:
-            first_item = out[0]
-            last_item = out[-1]
-            if from_height or to_height:
-                start_height = from_height
-                end_height = to_height
-            else:
-                start_height = first_item['height'] - 1
-                end_height = last_item['height']
+        summary = self.get_detailed_history_summary(
+            totals, fx=fx, from_timestamp=from_timestamp, to_timestamp=to_timestamp,
+            from_height=from_height, to_height=to_height)
+        return {
+            'transactions': out,
+            'summary': summary
+        }
 
-            b = first_item['bc_balance'].value
-            v = first_item['bc_value'].value
-            start_balance = None if b is None or v is None else b - v
-            end_balance = last_item['bc_balance'].value
+    def get_detailed_history_summary(
+            self,
+            totals: 'DetailedHistoryTotals',
+            *,
+            fx=None,
+            from_timestamp=None,
+            to_timestamp=None,
+            from_height=None,
+            to_height=None,
+    ) -> dict:
+        """Summary of the items accumulated in totals, see get_detailed_history."""
+        if totals.first_item is None:
+            return {}
+        show_fiat = fx and fx.is_enabled() and fx.has_history()
+        first_item = totals.first_item
+        last_item = totals.last_item
+        if from_height or to_height:
+            start_height = from_height
+            end_height = to_height
+        else:
+            start_height = first_item['height'] - 1
+            end_height = last_item['height']
 
-            if from_timestamp is not None and to_timestamp is not None:
-                start_timestamp = from_timestamp
-                end_timestamp = to_timestamp
-            else:
-                start_timestamp = first_item['timestamp']
-                end_timestamp = last_item['timestamp']
-
-            start_coins = self.get_utxos(
-                block_height=start_height,
-                confirmed_funding_only=True,
-                confirmed_spending_only=True,
-                nonlocal_only=True)
-            end_coins = self.get_utxos(
-                block_height=end_height,
-                confirmed_funding_only=True,
-                confirmed_spending_only=True,
-                nonlocal_only=True)
-
-            def summary_point(timestamp, height, balance, coins):
-                date = timestamp_to_datetime(timestamp)
-                out = {
-                    'date': date,
-                    'block_height': height,
-                    'BTC_balance': Satoshis(balance),
-                }
-                if show_fiat:
-                    ap = self.acquisition_price(coins, fx.timestamp_rate, fx.ccy)
-                    lp = self.liquidation_price(coins, fx.timestamp_rate, timestamp)
-                    out['acquisition_price'] = Fiat(ap, fx.ccy)
-                    out['liquidation_price'] = Fiat(lp, fx.ccy)
-                    out['unrealized_gains'] = Fiat(lp - ap, fx.ccy)
-                    out['fiat_balance'] = Fiat(fx.historical_value(balance, date), fx.ccy)
-                    out['BTC_fiat_price'] = Fiat(fx.historical_value(COIN, date), fx.ccy)
-                return out
-
-            summary_start = summary_point(start_timestamp, start_height, start_balance, start_coins)
-            summary_end = summary_point(end_timestamp, end_height, end_balance, end_coins)
-            flow = {
-                'BTC_incoming': Satoshis(income),
-                'BTC_outgoing': Satoshis(expenditures)
-            }
-            if show_fiat:
-                flow['fiat_currency'] = fx.ccy
-                flow['fiat_incoming'] = Fiat(fiat_income, fx.ccy)
-                flow['fiat_outgoing'] = Fiat(fiat_expenditures, fx.ccy)
-                flow['realized_capital_gains'] = Fiat(capital_gains, fx.ccy)
-            summary = {
-                'begin': summary_start,
-                'end': summary_end,
-                'flow': flow,
-            }
+        b = first_item['bc_balance'].value
+        v = first_item['bc_value'].value
+        start_balance = None if b is None or v is None else b - v
+        end_balance = last_item['bc_balance'].value
 
+        if from_timestamp is not None and to_timestamp is not None:
+            start_timestamp = from_timestamp
+            end_timestamp = to_timestamp
         else:
-            summary = {}
+            start_timestamp = first_item['timestamp']
+            end_timestamp = last_item['timestamp']
+
+        start_coins = self.get_utxos(
+            block_height=start_height,
+            confirmed_funding_only=True,
+            confirmed_spending_only=True,
+            nonlocal_only=True)
+        end_coins = self.get_utxos(
+            block_height=end_height,
+            confirmed_funding_only=True,
+            confirmed_spending_only=True,
+            nonlocal_only=True)
+
+        def summary_point(timestamp, height, balance, coins):
+            date = timestamp_to_datetime(timestamp)
+            out = {
+                'date': date,
+                'block_height': height,
+                'BTC_balance': Satoshis(balance),
+            }
+            if show_fiat:
+                ap = self.acquisition_price(coins, fx.timestamp_rate, fx.ccy, exchange=fx.exchange.name())
+                lp = self.liquidation_price(coins, fx.timestamp_rate, timestamp)
+                out['acquisition_price'] = Fiat(ap, fx.ccy)
+                out['liquidation_price'] = Fiat(lp, fx.ccy)
+                out['unrealized_gains'] = Fiat(lp - ap, fx.ccy)
+                out['fiat_balance'] = Fiat(fx.historical_value(balance, date), fx.ccy)
+                out['BTC_fiat_price'] = Fiat(fx.historical_value(COIN, date), fx.ccy)
+            return out
+
+        summary_start = summary_point(start_timestamp, start_height, start_balance, start_coins)
+        summary_end = summary_point(end_timestamp, end_height, end_balance, end_coins)
+        flow = {
+            'BTC_incoming': Satoshis(totals.income),
+            'BTC_outgoing': Satoshis(totals.expenditures)
+        }
+        if show_fiat:
+            flow['fiat_currency'] = fx.ccy
+            flow['fiat_incoming'] = Fiat(totals.fiat_income, fx.ccy)
+            flow['fiat_outgoing'] = Fiat(totals.fiat_expenditures, fx.ccy)
+            flow['realized_capital_gains'] = Fiat(totals.capital_gains, fx.ccy)
         return {
-            'transactions': out,
-            'summary': summary
+            'begin': summary_start,
+            'end': summary_end,
+            'flow': flow,
         }
 
-    def acquisition_price(self, coins, price_func, ccy):
-        return Decimal(sum(self.coin_price(coin.prevout.txid.hex(), price_func, ccy, self.adb.get_txin_value(coin)) for coin in coins))
+    def acquisition_price(self, coins, price_func, ccy, *, exchange: str = None):
+        return Decimal(sum(self.coin_price(coin.prevout.txid.hex(), price_func, ccy, self.adb.get_txin_value(coin), exchange=exchange)
+                           for coin in coins))
 
     def liquidation_price(self, coins, price_func, timestamp):
         p = price_func(timestamp)
@@ -1625,12 +1991,15 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             amount_sat: int,
             fx: 'FxThread',
             tx_fee: Optional[int],
+            price_func: Callable[[Optional[int]], Decimal] = None,
     ) -> Dict[str, Any]:
         item = {}
+        if price_func is None:
+            price_func = fx.timestamp_rate
         fiat_value = self.get_fiat_value(tx_hash, fx.ccy)
         fiat_default = fiat_value is None
-        fiat_rate = self.price_at_timestamp(tx_hash, fx.timestamp_rate)
-        fiat_value = fiat_value if fiat_value is not None else self.default_fiat_value(tx_hash, fx, amount_sat)
+        fiat_rate = self.price_at_timestamp(tx_hash, price_func)
+        fiat_value = fiat_value if fiat_value is not None else amount_sat / Decimal(COIN) * fiat_rate
         fiat_fee = tx_fee / Decimal(COIN) * fiat_rate if tx_fee is not None else None
         item['fiat_currency'] = fx.ccy
         item['fiat_rate'] = Fiat(fiat_rate, fx.ccy)
@@ -1638,7 +2007,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         item['fiat_fee'] = Fiat(fiat_fee, fx.ccy) if fiat_fee is not None else None
         item['fiat_default'] = fiat_default
         if amount_sat < 0:
-            acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(tx_hash, fx.timestamp_rate, fx.ccy)
+            acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(
+                tx_hash, price_func, fx.ccy, exchange=fx.exchange.name())
             liquidation_price = - fiat_value
             item['acquisition_price'] = Fiat(acquisition_price, fx.ccy)
             cg = liquidation_price - acquisition_price
@@ -1977,6 +2347,9 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         if fee is None and self.config.fee_per_kb() is None:
             raise NoDynamicFeeEstimates()
 
+        # coins of other assets cannot be spent by this tx, don't bother with them
+        needed_assets = get_assets_needed_for_outputs(outputs)
+        coins = [coin for coin in coins if coin.asset in needed_assets]
         for item in coins:
             self.add_input_info(item)
 
@@ -2110,7 +2483,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
              password=None, fee=None, change_addr=None,
              domain=None, rbf=True, nonlocal_only=False,
              tx_version=None, sign=True) -> PartialTransaction:
-        coins = self.get_spendable_coins(domain, nonlocal_only=nonlocal_only)
+        coins = self.get_spendable_coins(domain, nonlocal_only=nonlocal_only, assets=get_assets_needed_for_outputs(outputs))
         tx = self.make_unsigned_transaction(
             coins=coins,
             outputs=outputs,
@@ -2894,6 +3267,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         tx = self.db.get_transaction(tx_hash)
         if tx is None:
             return
+        self._forget_onchain_payments_touched_by_tx(tx)
         request_keys, invoice_keys = self.get_invoices_and_requests_touched_by_tx(tx)
         for key in request_keys:
             request = self.get_request(key)
@@ -2958,6 +3332,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def add_payment_request(self, req: Request, *, write_to_disk: bool = True):
         request_id = req.get_id()
         self._receive_requests[request_id] = req
+        self._sorted_requests = None
         if addr:=req.get_address():
             self._requests_addr_to_key[addr].add(request_id)
         if write_to_disk:
@@ -2970,6 +3345,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         if req is None:
             return
         self._receive_requests.pop(request_id, None)
+        self._sorted_requests = None
         if addr:=req.get_address():
             self._requests_addr_to_key[addr].discard(request_id)
         if req.is_lightning() and self.lnworker:
@@ -2989,15 +3365,15 @@ class Abstract_Wallet(ABC, Logger, EventListener):
 
     def get_sorted_requests(self) -> List[Request]:
         """ sorted by timestamp """
-        out = [self.get_request(x) for x in self._receive_requests.keys()]
-        out = [x for x in out if x is not None]
-        out.sort(key=lambda x: x.time)
-        return out
+        if self._sorted_requests is None:
+            out = [self.get_request(x) for x in self._receive_requests.keys()]
+            out = [x for x in out if x is not None]
+            out.sort(key=lambda x: x.time)
+            self._sorted_requests = out
+        return list(self._sorted_requests)
 
     def get_unpaid_requests(self) -> List[Request]:
-        out = [x for x in self._receive_requests.values() if self.get_invoice_status(x) != PR_PAID]
-        out.sort(key=lambda x: x.time)
-        return out
+        return [x for x in self.get_sorted_requests() if self.get_invoice_status(x) != PR_PAID]
 
     def delete_expired_requests(self):
         keys = [k for k, v in self._receive_requests.items() if self.get_invoice_status(v) == PR_EXPIRED]
@@ -3120,45 +3496,101 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         timestamp = self.adb.get_tx_height(txid).timestamp
         return price_func(timestamp if timestamp else time.time())
 
-    def average_price(self, txid, price_func, ccy) -> Decimal:
+    def average_price(self, txid, price_func, ccy, *, exchange: str = None) -> Decimal:
         """ Average acquisition price of the inputs of a transaction """
+        return self._get_average_price(txid, price_func, ccy, exchange=exchange)[0]
+
+    def _get_average_price(self, txid, price_func, ccy, *, exchange: str = None) -> Tuple[Decimal, bool]:
+        """Returns the average acquisition price of the inputs of txid,
+        and whether it is final.
+
+        Final prices are saved in the wallet file, per exchange that
+        price_func gets its rates from, and only forgotten on reorgs, when
+        parents arrive late, or when the user sets a fiat value. Without an
+        exchange, and for other prices, they are kept in memory while the
+        history and price_func do not change.
+        """
+        price = self._acquisition_prices.get(ccy, {}).get(exchange, {}).get(txid) if exchange else None
+        if price is not None:
+            return Decimal(price), True
+        memo = self._get_price_memo(price_func, ccy)
+        price = memo.get(txid)
+        if price is not None:
+            return price, False
         input_value = 0
         total_price = 0
+        is_final = True
         txi_addresses = self.db.get_txi_addresses(txid)
         if not txi_addresses:
-            return Decimal('NaN')
+            return Decimal('NaN'), False
         for addr in txi_addresses:
             d = self.db.get_txi_addr(txid, addr)
             for ser, v, asset in d:
                 input_value += v
-                total_price += self.coin_price(ser.split(':')[0], price_func, ccy, v)
-        return total_price / (input_value/Decimal(COIN))
+                coin_price, coin_is_final = self._get_coin_price(ser.split(':')[0], price_func, ccy, v, exchange=exchange)
+                total_price += coin_price
+                is_final = is_final and coin_is_final
+        price = total_price / (input_value/Decimal(COIN))
+        if is_final and price.is_finite() and exchange:
+            if ccy not in self._acquisition_prices:
+                self._acquisition_prices[ccy] = {}
+            if exchange not in self._acquisition_prices[ccy]:
+                self._acquisition_prices[ccy][exchange] = {}
+            self._acquisition_prices[ccy][exchange][txid] = str(price)
+        else:
+            is_final = False
+            memo[txid] = price
+        return price, is_final
+
+    def _get_price_memo(self, price_func, ccy) -> Dict[str, Decimal]:
+        key = (self.adb.get_state_version(), price_func, ccy)
+        if self._price_memo_key != key:
+            self._price_memo_key = key
+            self._price_memo = {}
+        return self._price_memo
+
+    def _forget_acquisition_prices(self, ccy) -> None:
+        self._acquisition_prices.pop(ccy, None)
+        self._price_memo_key = None
+
+    def _forget_acquisition_prices_of_txs(self, txids: Iterable[str]) -> None:
+        txids = set(txids)
+        if not txids:
+            return
+        for by_exchange in self._acquisition_prices.values():
+            for prices in by_exchange.values():
+                for txid in txids.intersection(prices):
+                    prices.pop(txid)
+        self._price_memo_key = None
 
     def clear_coin_price_cache(self):
-        self._coin_price_cache = {}
+        for ccy in list(self._acquisition_prices.keys()):
+            self._forget_acquisition_prices(ccy)
+        self._price_memo_key = None
 
-    def coin_price(self, txid, price_func, ccy, txin_value) -> Decimal:
+    def coin_price(self, txid, price_func, ccy, txin_value, *, exchange: str = None) -> Decimal:
         """
         Acquisition price of a coin.
         This assumes that either all inputs are mine, or no input is mine.
         """
+        return self._get_coin_price(txid, price_func, ccy, txin_value, exchange=exchange)[0]
+
+    def _get_coin_price(self, txid, price_func, ccy, txin_value, *, exchange: str = None) -> Tuple[Decimal, bool]:
         if txin_value is None:
-            return Decimal('NaN')
-        cache_key = "{}:{}:{}".format(str(txid), str(ccy), str(txin_value))
-        result = self._coin_price_cache.get(cache_key, None)
-        if result is not None:
-            return result
+            return Decimal('NaN'), False
         if self.db.get_txi_addresses(txid):
-            result = self.average_price(txid, price_func, ccy) * txin_value/Decimal(COIN)
-            self._coin_price_cache[cache_key] = result
-            return result
+            price, is_final = self._get_average_price(txid, price_func, ccy, exchange=exchange)
+            return price * txin_value/Decimal(COIN), is_final
         else:
             fiat_value = self.get_fiat_value(txid, ccy)
             if fiat_value is not None:
-                return fiat_value
+                return fiat_value, True
             else:
                 p = self.price_at_timestamp(txid, price_func)
-                return p * txin_value/Decimal(COIN)
+                timestamp = self.adb.get_tx_height(txid).timestamp
+                # recent rates are not final: they might come from spot quotes
+                is_final = bool(timestamp) and timestamp < time.time() - FINAL_RATE_AGE
+                return p * txin_value/Decimal(COIN), is_final
 
     def is_billing_address(self, addr):
         # overridden for TrustedCoin wallets
@@ -3190,7 +3622,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                            unsigned=False, rbf=True, password=None, locktime=None):
         if fee is not None and feerate is not None:
             raise Exception("Cannot specify both 'fee' and 'feerate' at the same time!")
-        coins = self.get_spendable_coins(domain_addr)
+        coins = self.get_spendable_coins(domain_addr, assets=get_assets_needed_for_outputs(outputs))
         if domain_coins is not None:
             coins = [coin for coin in coins if (coin.prevout.to_str() in domain_coins)]
         if feerate is not None:
@@ -3348,6 +3780,10 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         self.logger.info(f'unlocking wallet')
         if password:
             self.check_password(password)
+        else:
+            # locking: also forget derived private keys
+            for ks in self.get_keystores():
+                ks.clear_private_key_cache()
         self._password_in_memory = password
 
     def get_unlocked_password(self):
@@ -3474,6 +3910,8 @@ class Imported_Wallet(Simple_Wallet):
             self.db.remove_addr_history(address)
             for tx_hash in transactions_to_remove:
                 self.adb._remove_transaction(tx_hash)
+            # the domain of get_balance and get_utxos shrinks, even if no tx was removed
+            self.adb._invalidate_balance_cache()
         self.set_label(address, None)
         if req:= self.get_request_by_addr(address):
             self.delete_request(req.get_id())
@@ -3613,7 +4051,19 @@ class Deterministic_Wallet(Abstract_Wallet):
         ln_xprv = self.db.get('lightning_xprv') or self.db.get('lightning_privkey2')
         # lnworker can only be initialized once receiving addresses are available
         # therefore we instantiate lnworker in DeterministicWallet
-        self.lnworker = LNWallet(self, ln_xprv) if ln_xprv else None
+        if not self.config.LIGHTNING_ENABLED and ln_xprv and self.db.get('channels'):
+            # dropping the lnworker would stop watching the channels, and funds
+            # could be lost if the remote party force-closes with an old state.
+            self.logger.warning(
+                "lightning is disabled in the config, but this wallet has channels. "
+                "Keeping lightning enabled for this wallet. Close its channels first.")
+        elif not ln_xprv or not self.config.LIGHTNING_ENABLED:
+            # the lightning modules are only imported by wallets that use them:
+            # they are slow to load, and pull in channel_db, lnrouter etc.
+            self.lnworker = None
+            return
+        from .lnworker import LNWallet
+        self.lnworker = LNWallet(self, ln_xprv)
 
     def has_seed(self):
         return self.keystore.has_seed()
@@ -3673,18 +4123,22 @@ class Deterministic_Wallet(Abstract_Wallet):
             k += 1
         return k
 
+    def _get_address_at_index(self, for_change: bool, n: int) -> str:
+        if for_change:
+            return self.get_change_addresses(slice_start=n, slice_stop=n+1)[0]
+        return self.get_receiving_addresses(slice_start=n, slice_stop=n+1)[0]
+
     def min_acceptable_gap(self) -> int:
         # fixme: this assumes wallet is synchronized
-        n = 0
-        nmax = 0
-        addresses = self.get_receiving_addresses()
-        k = self.num_unused_trailing_addresses(addresses)
-        for addr in addresses[0:-k]:
-            if self.adb.address_is_old(addr):
-                n = 0
-            else:
-                n += 1
-                nmax = max(nmax, n)
+        # longest run of addresses that are not old, up to the last used one.
+        # Only used addresses can be old.
+        used = self.db.get_used_address_indexes(False)
+        if not used:
+            return 1
+        old = [n for n in used if self.adb.address_is_old(self._get_address_at_index(False, n))]
+        if not old:
+            return used[-1] + 2
+        nmax = max(old[0], used[-1] - old[-1], *(b - a - 1 for a, b in zip(old, old[1:])))
         return nmax + 1
 
     @abstractmethod
@@ -3732,23 +4186,19 @@ class Deterministic_Wallet(Abstract_Wallet):
             return address
 
     def synchronize_sequence(self, for_change: bool) -> int:
-        count = 0  # num new addresses we generated
         limit = self.gap_limit_for_change if for_change else self.gap_limit
-        while True:
-            num_addr = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
-            if num_addr < limit:
-                count += 1
-                self.create_new_address(for_change)
-                continue
-            if for_change:
-                last_few_addresses = self.get_change_addresses(slice_start=-limit)
-            else:
-                last_few_addresses = self.get_receiving_addresses(slice_start=-limit)
-            if any(map(self.adb.address_is_old, last_few_addresses)):
-                count += 1
-                self.create_new_address(for_change)
-            else:
+        num_addr = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
+        # none of the last `limit` addresses may be old. New addresses are unused,
+        # so we need `limit` addresses after the last old one in that window.
+        # Only used addresses can be old, so that is all we look at.
+        num_needed = limit
+        for n in reversed(self.db.get_used_address_indexes(for_change, start=num_addr - limit)):
+            if self.adb.address_is_old(self._get_address_at_index(for_change, n)):
+                num_needed = n + 1 + limit
                 break
+        count = max(0, num_needed - num_addr)  # num new addresses we generate
+        for i in range(count):
+            self.create_new_address(for_change)
         return count
 
     def synchronize(self):
@@ -3762,18 +4212,16 @@ class Deterministic_Wallet(Abstract_Wallet):
         # note that we don't stop at first large gap
         found = set()
 
-        def process_addresses(addrs, gap_limit):
-            rolling_num_unused = 0
-            for addr in addrs:
-                if self.db.get_addr_history(addr):
-                    rolling_num_unused = 0
-                else:
-                    if rolling_num_unused >= gap_limit:
-                        found.add(addr)
-                    rolling_num_unused += 1
+        def process_chain(for_change: bool, gap_limit: int):
+            addrs = self.get_change_addresses() if for_change else self.get_receiving_addresses()
+            # runs of unused addresses are the ones between used addresses
+            run_start = 0
+            for n in itertools.chain(self.db.get_used_address_indexes(for_change), [len(addrs)]):
+                found.update(addrs[run_start + gap_limit:n])
+                run_start = n + 1
 
-        process_addresses(self.get_receiving_addresses(), self.gap_limit)
-        process_addresses(self.get_change_addresses(), self.gap_limit_for_change)
+        process_chain(False, self.gap_limit)
+        process_chain(True, self.gap_limit_for_change)
         return found
 
     def get_address_index(self, address) -> Optional[Sequence[int]]:
@@ -24,13 +24,16 @@
 # SOFTWARE.
 import os
 import ast
+import array
 import datetime
 import json
 import copy
 import threading
+import struct
 from collections import defaultdict
-from typing import Dict, Optional, List, Tuple, Set, Iterable, NamedTuple, Sequence, TYPE_CHECKING, Union, Any
+from typing import Dict, Optional, List, Tuple, Set, Iterable, Iterator, NamedTuple, Sequence, TYPE_CHECKING, Union, Any
 import binascii
+import bisect
 import time
 
 import attr
@@ -45,7 +48,7 @@ from .logging import Logger
 
 from .lnutil import LOCAL, REMOTE, HTLCOwner, ChannelType
 from . import json_db
-from .json_db import StoredDict, JsonDB, locked, modifier, StoredObject, stored_in, stored_as
+from .json_db import StoredDict, StoredTable, JsonDB, locked, modifier, StoredObject, stored_in, stored_as
 from .plugin import run_hook, plugin_loaders
 from .version import ELECTRUM_VERSION
 from .atomic_swap import AtomicSwap
@@ -78,6 +81,231 @@ class DBMetadata(StoredObject):
         return f"using {ver}, on {date_str}"
 
 
+def _txid_to_bytes(txid) -> Optional[bytes]:
+    """Returns the 32 bytes of a txid in canonical (lowercase hex) form, or None."""
+    if not isinstance(txid, str) or len(txid) != 64:
+        return None
+    try:
+        b = bytes.fromhex(txid)
+    except ValueError:
+        return None
+    return b if b.hex() == txid else None
+
+
+def _fits_int64(x) -> bool:
+    return type(x) is int and -2**63 <= x < 2**63
+
+
+class VerifiedTxTable(StoredTable):
+    """txid -> (height, timestamp, txpos, header_hash), stored column-wise
+    in arrays, with txids and header hashes as raw bytes.
+    Rows that do not fit the columns (e.g. a None field) are kept as tuples.
+    Serialized to json as a dict of lists, like a StoredDict would be.
+    """
+
+    def __init__(self, data: dict, db: Optional['WalletDB']):
+        self.db = db
+        self.lock = db.lock if db else threading.RLock()
+        self._reset()
+        for txid, v in data.items():
+            self._set(txid, tuple(v), replace=False)
+
+    def _reset(self) -> None:
+        self._rows = {}  # type: Dict[bytes, int]  # txid -> row
+        self._other = {}  # type: Dict[str, tuple]
+        self._txids = bytearray()
+        self._header_hashes = bytearray()
+        self._heights = array.array('q')
+        self._timestamps = array.array('q')
+        self._txpos = array.array('q')
+
+    def _set(self, txid: str, v: tuple, *, replace: bool = True) -> None:
+        height, timestamp, txpos, header_hash = v
+        txid_bytes = _txid_to_bytes(txid)
+        header_hash_bytes = _txid_to_bytes(header_hash)
+        if replace:
+            self._remove(txid)
+        if (txid_bytes is None or header_hash_bytes is None
+                or not (_fits_int64(height) and _fits_int64(timestamp) and _fits_int64(txpos))):
+            self._other[txid] = v
+            return
+        self._rows[txid_bytes] = len(self._heights)
+        self._txids += txid_bytes
+        self._header_hashes += header_hash_bytes
+        self._heights.append(height)
+        self._timestamps.append(timestamp)
+        self._txpos.append(txpos)
+
+    def _remove(self, txid: str) -> bool:
+        if self._other.pop(txid, None) is not None:
+            return True
+        txid_bytes = _txid_to_bytes(txid)
+        row = self._rows.pop(txid_bytes, None) if txid_bytes else None
+        if row is None:
+            return False
+        # move the last row into the hole
+        last = len(self._heights) - 1
+        if row != last:
+            last_txid = bytes(self._txids[32 * last:32 * last + 32])
+            self._rows[last_txid] = row
+            self._txids[32 * row:32 * row + 32] = last_txid
+            self._header_hashes[32 * row:32 * row + 32] = self._header_hashes[32 * last:32 * last + 32]
+            for column in (self._heights, self._timestamps, self._txpos):
+                column[row] = column[last]
+        del self._txids[32 * last:]
+        del self._header_hashes[32 * last:]
+        for column in (self._heights, self._timestamps, self._txpos):
+            column.pop()
+        return True
+
+    def _get_row(self, row: int) -> tuple:
+        return (self._heights[row], self._timestamps[row], self._txpos[row],
+                self._header_hashes[32 * row:32 * row + 32].hex())
+
+    @locked
+    def get(self, txid: str, default=None):
+        v = self._other.get(txid)
+        if v is not None:
+            return v
+        txid_bytes = _txid_to_bytes(txid)
+        row = self._rows.get(txid_bytes) if txid_bytes else None
+        return self._get_row(row) if row is not None else default
+
+    @locked
+    def __contains__(self, txid) -> bool:
+        if txid in self._other:
+            return True
+        txid_bytes = _txid_to_bytes(txid)
+        return txid_bytes is not None and txid_bytes in self._rows
+
+    @locked
+    def __setitem__(self, txid: str, v) -> None:
+        self._set(txid, tuple(v))
+        if self.db:
+            self.db.set_modified(True)
+
+    @locked
+    def pop(self, txid: str, default=None):
+        v = self.get(txid)
+        if v is None:
+            return default
+        self._remove(txid)
+        if self.db:
+            self.db.set_modified(True)
+        return v
+
+    @locked
+    def clear(self) -> None:
+        self._reset()
+        if self.db:
+            self.db.set_modified(True)
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._other)
+
+    @locked
+    def keys(self) -> List[str]:
+        return [txid.hex() for txid in self._rows] + list(self._other)
+
+    def items(self) -> Iterator[Tuple[str, tuple]]:
+        """The caller must hold self.lock until the iterator is exhausted."""
+        for txid, row in self._rows.items():
+            yield txid.hex(), self._get_row(row)
+        yield from self._other.items()
+
+    @locked
+    def to_json(self) -> dict:
+        return dict(self.items())
+
+
+class AddrHistoryTable(StoredTable):
+    """address -> list of (txid, height). Each history is packed into a
+    single bytes object of 36 byte entries, decoded on access.
+    Histories that cannot be packed (e.g. the ['*'] of old wallets) are
+    kept as they are. Serialized to json as a dict of lists.
+    """
+
+    _entry = struct.Struct('<32si')
+
+    def __init__(self, data: dict, db: Optional['WalletDB']):
+        self.db = db
+        self.lock = db.lock if db else threading.RLock()
+        self._histories = {}  # type: Dict[str, Union[bytes, list]]
+        for addr, hist in data.items():
+            self._histories[addr] = self._pack(hist)
+
+    @classmethod
+    def _pack(cls, hist) -> Union[bytes, list]:
+        out = bytearray(cls._entry.size * len(hist))
+        for i, item in enumerate(hist):
+            try:
+                txid, height = item
+            except (TypeError, ValueError):
+                return list(hist)
+            txid_bytes = _txid_to_bytes(txid)
+            if txid_bytes is None or type(height) is not int or not -2**31 <= height < 2**31:
+                return list(hist)
+            cls._entry.pack_into(out, cls._entry.size * i, txid_bytes, height)
+        return bytes(out)
+
+    @classmethod
+    def _unpack(cls, packed: Union[bytes, list]) -> list:
+        if isinstance(packed, list):
+            return list(packed)
+        return [(txid.hex(), height) for txid, height in cls._entry.iter_unpack(packed)]
+
+    @locked
+    def get(self, addr: str, default=None):
+        packed = self._histories.get(addr)
+        return self._unpack(packed) if packed is not None else default
+
+    def get_num_txs(self, addr: str) -> int:
+        packed = self._histories.get(addr)
+        if packed is None:
+            return 0
+        return len(packed) if isinstance(packed, list) else len(packed) // self._entry.size
+
+    def __contains__(self, addr) -> bool:
+        return addr in self._histories
+
+    @locked
+    def __setitem__(self, addr: str, hist) -> None:
+        self._histories[addr] = self._pack(hist)
+        if self.db:
+            self.db.set_modified(True)
+
+    @locked
+    def pop(self, addr: str, default=None):
+        packed = self._histories.pop(addr, None)
+        if packed is None:
+            return default
+        if self.db:
+            self.db.set_modified(True)
+        return self._unpack(packed)
+
+    @locked
+    def clear(self) -> None:
+        self._histories.clear()
+        if self.db:
+            self.db.set_modified(True)
+
+    def __len__(self) -> int:
+        return len(self._histories)
+
+    @locked
+    def keys(self) -> List[str]:
+        return list(self._histories)
+
+    def items(self) -> Iterator[Tuple[str, list]]:
+        """The caller must hold self.lock until the iterator is exhausted."""
+        for addr, packed in self._histories.items():
+            yield addr, self._unpack(packed)
+
+    @locked
+    def to_json(self) -> dict:
+        return dict(self.items())
+
+
 # note: subclassing WalletFileException for some specific cases
 #       allows the crash reporter to distinguish them and open
 #       separate tracking issues
@@ -108,6 +336,8 @@ for key in ('assets_to_watch', 'asset_blacklist', 'broadcasts_to_watch', 'non_de
 class WalletDB(JsonDB):
 
     def __init__(self, data, *, storage=None, manual_upgrades: bool):
+        # per-chain derivation indexes of addresses with history, see get_used_address_indexes
+        self._used_address_indexes = None  # type: Optional[Tuple[List[int], List[int]]]
         JsonDB.__init__(self, data, storage)
         if not data:
             # create new DB
@@ -438,11 +668,48 @@ class WalletDB(JsonDB):
     def set_addr_history(self, addr: str, hist) -> None:
         assert isinstance(addr, str)
         self.history[addr] = hist
+        self._update_used_address_index(addr)
 
     @modifier
     def remove_addr_history(self, addr: str) -> None:
         assert isinstance(addr, str)
         self.history.pop(addr, None)
+        self._update_used_address_index(addr)
+
+    @locked
+    def get_used_address_indexes(self, for_change: bool, *, start: int = 0) -> Sequence[int]:
+        """Sorted derivation indexes, not below start, of the addresses of a
+        deterministic chain that have history (according to the server).
+        """
+        indexes = self._get_used_address_indexes(for_change)
+        return indexes[bisect.bisect_left(indexes, start):]
+
+    def _get_used_address_indexes(self, for_change: bool) -> List[int]:
+        if self._used_address_indexes is None:
+            self._used_address_indexes = ([], [])
+            for addr in self.history.keys():
+                addr_index = self._addr_to_addr_index.get(addr) if self.history.get_num_txs(addr) else None
+                if addr_index is not None:
+                    self._used_address_indexes[addr_index[0]].append(addr_index[1])
+            for indexes in self._used_address_indexes:
+                indexes.sort()
+        return self._used_address_indexes[int(for_change)]
+
+    def _update_used_address_index(self, addr: str) -> None:
+        if self._used_address_indexes is None:
+            return
+        addr_index = self._addr_to_addr_index.get(addr)
+        if addr_index is None:
+            return
+        indexes = self._used_address_indexes[addr_index[0]]
+        n = addr_index[1]
+        i = bisect.bisect_left(indexes, n)
+        is_listed = i < len(indexes) and indexes[i] == n
+        has_history = self.history.get_num_txs(addr) > 0
+        if has_history and not is_listed:
+            indexes.insert(i, n)
+        elif not has_history and is_listed:
+            del indexes[i]
 
     @locked
     def list_verified_tx(self) -> Sequence[str]:
@@ -453,7 +720,7 @@ class WalletDB(JsonDB):
         assert isinstance(txid, str)
         if txid not in self.verified_tx:
             return None
-        height, timestamp, txpos, header_hash = self.verified_tx[txid]
+        height, timestamp, txpos, header_hash = self.verified_tx.get(txid)
         return TxMinedInfo(height=height,
                            conf=None,
                            timestamp=timestamp,
@@ -557,12 +824,14 @@ class WalletDB(JsonDB):
         assert isinstance(addr, str)
         self._addr_to_addr_index[addr] = (1, len(self.change_addresses))
         self.change_addresses.append(addr)
+        self._update_used_address_index(addr)
 
     @modifier
     def add_receiving_address(self, addr: str) -> None:
         assert isinstance(addr, str)
         self._addr_to_addr_index[addr] = (0, len(self.receiving_addresses))
         self.receiving_addresses.append(addr)
+        self._update_used_address_index(addr)
 
     @locked
     def get_address_index(self, address: str) -> Optional[Sequence[int]]:
@@ -605,6 +874,7 @@ class WalletDB(JsonDB):
             self.change_addresses = self.data['addresses']['change']
             self.receiving_addresses = self.data['addresses']['receiving']
             self._addr_to_addr_index = {}  # type: Dict[str, Sequence[int]]  # key: address, value: (is_change, index)
+            self._used_address_indexes = None
             for i, addr in enumerate(self.receiving_addresses):
                 self._addr_to_addr_index[addr] = (0, i)
             for i, addr in enumerate(self.change_addresses):
@@ -1011,7 +1281,19 @@ class WalletDB(JsonDB):
 
     @profiler
     def _load_transactions(self):
+        # these two are the largest parts of big wallets, and are kept in
+        # compact tables instead of StoredDicts
+        history = self.data.pop('addr_history', {})
+        verified_tx = self.data.pop('verified_tx3', {})
         self.data = StoredDict(self.data, self, [])
+        if not isinstance(history, AddrHistoryTable):
+            history = AddrHistoryTable(history, self)
+        if not isinstance(verified_tx, VerifiedTxTable):
+            verified_tx = VerifiedTxTable(verified_tx, self)
+        self.history = history              # address -> list of (txid, height)
+        self.verified_tx = verified_tx      # txid -> (height, timestamp, txpos, header_hash)
+        dict.__setitem__(self.data, 'addr_history', self.history)
+        dict.__setitem__(self.data, 'verified_tx3', self.verified_tx)
         # references in self.data
         # TODO make all these private
         # txid -> address -> prev_outpoint -> value
@@ -1020,8 +1302,6 @@ class WalletDB(JsonDB):
         self.txo = self.get_dict('txo')                          # type: Dict[str, Dict[str, Dict[str, Tuple[int, Optional[str], bool]]]]
         self.transactions = self.get_dict('transactions')        # type: Dict[str, Transaction]
         self.spent_outpoints = self.get_dict('spent_outpoints')  # txid -> output_index -> next_txid
-        self.history = self.get_dict('addr_history')             # address -> list of (txid, height)
-        self.verified_tx = self.get_dict('verified_tx3')         # txid -> (height, timestamp, txpos, header_hash)
         self.tx_fees = self.get_dict('tx_fees')                  # type: Dict[str, TxFeesValue]
         # scripthash -> set of (outpoint, value)
         self._prevouts_by_scripthash = self.get_dict('prevouts_by_scripthash')  # type: Dict[str, Set[Tuple[str, int]]]
@@ -1045,6 +1325,8 @@ class WalletDB(JsonDB):
         self.spent_outpoints.clear()
         self.transactions.clear()
         self.history.clear()
+        if self._used_address_indexes is not None:
+            self._used_address_indexes = ([], [])
         self.verified_tx.clear()
         self.tx_fees.clear()
         self._prevouts_by_scripthash.clear()